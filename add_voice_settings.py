@@ -10,6 +10,8 @@ import json
 import os
 from datetime import datetime
 
+from route_metrics import path_metrics
+
 
 def backup_file(filepath):
     """Создает резервную копию файла"""
@@ -48,32 +50,26 @@ def analyze_route(route_data):
     start_name = start_point.get('pointName', 'начало')
     end_name = end_point.get('pointName', 'конец')
 
-    # Определяем количество этажей в маршруте
-    floors = set()
-    for point in points:
-        if point.get('floor'):
-            floors.add(point['floor'])
-
-    has_floor_change = len(floors) > 1
-
-    # Определяем основное направление первого шага
-    if len(points) >= 2:
-        first = points[0]
-        second = points[1]
-        dx = second.get('x', 0) - first.get('x', 0)
-        dy = second.get('y', 0) - first.get('y', 0)
-        angle = math.atan2(dy, dx) * 180 / math.pi if 'math' in dir() else 0
-        first_direction = get_direction_text(angle) if 'math' in dir() else 'прямо'
-    else:
-        first_direction = 'прямо'
+    # Метрики посчитаны сервером при сохранении маршрута; у старых файлов - считаем сами
+    metrics = route_data.get('metrics') or path_metrics(points)
+
+    # Этажи маршрута: первый и те, на которые переходим
+    floors = {points[0].get('floor', 1)} | {change['to'] for change in metrics['floor_changes']}
+
+    # Направление первого ненулевого отрезка (дубли точек пропускаются)
+    first_angle = next((d for d in metrics['directions'] if d is not None), None)
+    first_direction = get_direction_text(first_angle) if first_angle is not None else 'прямо'
 
     return {
         'start_name': start_name,
         'end_name': end_name,
-        'has_floor_change': has_floor_change,
-        'floors': list(floors),
+        'has_floor_change': bool(metrics['floor_changes']),
+        'floors': sorted(floors),
         'first_direction': first_direction,
-        'points_count': len(points)
+        'points_count': len(points),
+        'meters': metrics['meters'],
+        'minutes': metrics['minutes'],
+        'turns': len(metrics['turns'])
     }
 
 
@@ -345,8 +341,6 @@ def clean_duplicate_points():
 
 
 if __name__ == "__main__":
-    import math  # Импортируем здесь для использования в функциях
-
     print("\nВыберите режим работы:")
     print("1. Интерактивный режим (с запросами)")
     print("2. Пакетный режим (автоматически)")
@@ -0,0 +1,217 @@
+"""
+Рассылка тревог об эвакуации всем открытым просмотрщикам (Server-Sent Events)
+Одно событие форматируется один раз на этаж/зону и отдаётся всем ожидающим
+клиентам сразу. Клиент не опрашивает сервер: соединение висит открытым, пока
+не придёт событие или пульс (комментарий раз в HEARTBEAT секунд).
+
+Ожидание - на threading.Condition. Под gunicorn с воркером gevent (см. gunicorn.conf.py)
+threading подменяется на гринлеты, поэтому тысячи простаивающих соединений
+не занимают по потоку каждое.
+
+С shared_file события общие для всех воркеров: публикация дописывает строку в
+файл под FileLock (номер события - сквозной), а фоновый поток каждого воркера
+подхватывает чужие строки и будит своих подписчиков. Файл не растёт без
+конца: когда в нём набирается COMPACT_FACTOR * history_size строк, публикующий
+воркер переписывает его, оставляя последние history_size событий; остальные
+замечают новый файл по смене inode и перечитывают его (повторы отсекаются по номеру).
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from shared_state import FileLock
+
+HEARTBEAT = 15.0  # секунд между пульсами, чтобы прокси не закрывали соединение
+HISTORY_SIZE = 100  # событий для переподключившихся клиентов (Last-Event-ID)
+RETRY_MS = 3000  # через сколько браузер переподключится после обрыва
+POLL_INTERVAL = 0.5  # секунд между проверками общего файла событий
+COMPACT_FACTOR = 2  # во сколько раз файл может перерасти историю до перезаписи
+
+
+class AlertBroadcaster:
+
+    def __init__(self, history_size=HISTORY_SIZE, shared_file=None, poll_interval=POLL_INTERVAL):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=history_size)  # (id, событие, {(этаж, зона): готовый текст})
+        self.last_id = 0
+        self.subscribers = 0
+        self.published = 0
+        self.imported = 0
+        self.shared_file = shared_file
+        self.poll_interval = poll_interval
+        self._file_pos = 0
+        self._file_inode = None
+        self._file_lines = 0
+        self.compactions = 0
+        self._file_lock = FileLock(f"{shared_file}.lock") if shared_file else None
+        self._watcher = None
+        if shared_file:
+            with self._cond:
+                self._import_new()
+
+    # ---------- общий файл событий ----------
+    def _import_new(self):
+        """Подхватывает события, дописанные после _file_pos; вызывать под self._cond"""
+        try:
+            with open(self.shared_file, 'rb') as f:
+                inode = os.fstat(f.fileno()).st_ino
+                if inode != self._file_inode:
+                    # Файл переписали (или это первое чтение) - читаем с начала
+                    self._file_inode, self._file_pos, self._file_lines = inode, 0, 0
+                f.seek(self._file_pos)
+                lines = f.readlines()
+        except OSError:
+            return
+        added = 0
+        for line in lines:
+            if not line.endswith(b'\n'):
+                break  # строку ещё дописывают
+            self._file_pos += len(line)
+            self._file_lines += 1
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            event_id = event.pop('id')
+            if event_id > self.last_id:
+                self._events.append((event_id, event, {}))
+                self.last_id = event_id
+                added += 1
+        if added:
+            self.imported += added
+            self._cond.notify_all()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                st = os.stat(self.shared_file)
+            except OSError:
+                continue
+            if st.st_size != self._file_pos or st.st_ino != self._file_inode:
+                with self._cond:
+                    self._import_new()
+
+    def _ensure_watcher(self):
+        # Поток запускается лениво: после fork у воркера gunicorn его ещё нет
+        if self.shared_file and (self._watcher is None or not self._watcher.is_alive()):
+            self._watcher = threading.Thread(target=self._watch, name='alerts-watcher', daemon=True)
+            self._watcher.start()
+
+    # ---------- публикация ----------
+    def publish(self, event_type, message, floors=None, zones=None, per_floor=None, **extra):
+        """
+        Новое событие. floors/zones - кому адресовано (None - всем);
+        per_floor - {этаж: {поля, заменяющие общие для этого этажа}}
+        """
+        event = {
+            'type': event_type,
+            'message': message,
+            'floors': sorted(int(f) for f in floors) if floors else None,
+            'zones': sorted(zones) if zones else None,
+            'per_floor': {str(k): v for k, v in (per_floor or {}).items()},
+            'time': time.time()
+        }
+        event.update(extra)
+        if self.shared_file:
+            return self._publish_shared(event)
+        with self._cond:
+            self.last_id += 1
+            self._events.append((self.last_id, event, {}))
+            self.published += 1
+            self._cond.notify_all()
+            return self.last_id
+
+    def _publish_shared(self, event):
+        os.makedirs(os.path.dirname(self.shared_file) or '.', exist_ok=True)
+        with self._file_lock, self._cond:
+            # Сначала чужие события - номер нового должен быть больше всех в файле
+            self._import_new()
+            event_id = self.last_id + 1
+            line = json.dumps(dict(event, id=event_id), ensure_ascii=False).encode('utf-8') + b'\n'
+            with open(self.shared_file, 'ab') as f:
+                f.write(line)
+            self._file_pos += len(line)
+            self._file_lines += 1
+            self._events.append((event_id, event, {}))
+            self.last_id = event_id
+            self.published += 1
+            if self._file_lines >= COMPACT_FACTOR * self._events.maxlen:
+                self._compact_shared()
+            self._cond.notify_all()
+            return event_id
+
+    def _compact_shared(self):
+        """Оставляет в файле только последние события истории; вызывать под _file_lock и self._cond"""
+        lines = [json.dumps(dict(event, id=event_id), ensure_ascii=False).encode('utf-8') + b'\n'
+                 for event_id, event, _ in self._events]
+        tmp_file = f"{self.shared_file}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.writelines(lines)
+        os.replace(tmp_file, self.shared_file)
+        self._file_inode = os.stat(self.shared_file).st_ino
+        self._file_pos = sum(len(line) for line in lines)
+        self._file_lines = len(lines)
+        self.compactions += 1
+
+    # ---------- подписка ----------
+    @staticmethod
+    def _matches(event, floor, zone):
+        if event['floors'] and floor is not None and floor not in event['floors']:
+            return False
+        if event['zones'] and zone is not None and zone not in event['zones']:
+            return False
+        return True
+
+    def _format(self, event_id, event, rendered, floor, zone):
+        """Текст события для этажа/зоны - один раз на всех клиентов с теми же параметрами"""
+        key = (floor, zone)
+        text = rendered.get(key)
+        if text is None:
+            payload = {k: v for k, v in event.items() if k != 'per_floor'}
+            payload.update(event['per_floor'].get(str(floor), {}))
+            payload['id'] = event_id
+            text = f"id: {event_id}\nevent: {event['type']}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            rendered[key] = text
+        return text
+
+    def _pending(self, last_id, floor, zone):
+        return [self._format(event_id, event, rendered, floor, zone)
+                for event_id, event, rendered in self._events
+                if event_id > last_id and self._matches(event, floor, zone)]
+
+    def stream(self, last_id=None, floor=None, zone=None, heartbeat=HEARTBEAT):
+        """Генератор строк text/event-stream; last_id - с какого события продолжить"""
+        self._ensure_watcher()
+        with self._cond:
+            self.subscribers += 1
+            if last_id is None:
+                last_id = self.last_id
+        try:
+            yield f"retry: {RETRY_MS}\n: connected\n\n"
+            while True:
+                with self._cond:
+                    if self.last_id <= last_id:
+                        self._cond.wait(heartbeat)
+                    chunks = self._pending(last_id, floor, zone)
+                    last_id = self.last_id
+                if chunks:
+                    yield ''.join(chunks)
+                else:
+                    yield ": ping\n\n"
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+    def recent(self, limit=20):
+        with self._cond:
+            if self.shared_file:
+                self._import_new()
+            return [dict(event, id=event_id) for event_id, event, _ in list(self._events)[-limit:]]
+
+    def get_counters(self):
+        return {'subscribers': self.subscribers, 'published': self.published, 'last_id': self.last_id,
+                'imported': self.imported, 'compactions': self.compactions}
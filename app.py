@@ -5,78 +5,439 @@ Flask приложение для навигации по школе с испо
 """
 
 from flask import Flask, render_template, jsonify, request, send_file, send_from_directory
+from werkzeug.utils import get_content_type
 import qrcode
 import os
+import io
 import json
+import atexit
+import gzip
+import hashlib
 import math
+import mimetypes
 import socket
-from datetime import datetime
+import threading
+import time
+from datetime import date, datetime
+from collections import OrderedDict
+from itertools import islice
 from typing import List, Dict, Optional
 import logging
 
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None  # без brotli отдаём gzip
+
+from alerts import AlertBroadcaster
+from blocking import blocking_pool, run_blocking
+from evacuation import EvacuationPlanner
+from pathfinding import CorridorGraph, ensure_next_hop_table
+from route_codec import DEFAULT_TOLERANCE, compact_route
+from route_counters import COUNTERS_FILE as ROUTE_COUNTERS_FILE, RouteCounters
+from route_metrics import attach_metrics, path_metrics, reverse_metrics, summary as metrics_summary, with_metrics
+from route_validator import fix_routes, summarize, validate_routes
+from search_index import SearchIndex
+from shared_state import FileLock, file_signature
+from spatial_index import WallIndex, walls_from_map
+from storage import PreconditionFailed, get_storage
+from voice_generator import VOICE_SETTINGS_FILE, PromptGenerator, load_phrases
+
+# Отладка - только для python app.py; gunicorn.conf.py выставляет FLASK_DEBUG=0
+DEBUG = os.environ.get('FLASK_DEBUG', '1') == '1'
+
 # Настройка логирования
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=logging.DEBUG if DEBUG else logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Создание приложения Flask
-app = Flask(__name__)
+# Создание приложения Flask (статику отдаёт serve_static - с учётом собранных файлов)
+app = Flask(__name__, static_folder=None)
 app.config['SECRET_KEY'] = 'school-navigation-secret-key-2024'
-app.config['DEBUG'] = True
+app.config['DEBUG'] = DEBUG
+
+# Хранилище точек, маршрутов и подсказок: JSON-файлы или SQLite (STORAGE_BACKEND)
+storage = get_storage()
 
 
 # ========== СТАТИСТИКА НАВИГАЦИЙ ==========
+STATS_SNAPSHOT_FILE = 'data/statistics_snapshot.json'
+STATS_SEED_FILE = 'data/statistics.json'  # статистика до журнала событий, в репозитории
+STATS_EVENTS_FILE = 'data/statistics_events.jsonl'
+STATS_FLUSH_INTERVAL = 5.0  # секунд между дозаписями журнала
+STATS_FLUSH_EVERY = 100  # или раньше, если накопилось столько событий
+STATS_COMPACT_INTERVAL = 60.0  # секунд между сворачиваниями журнала в снимок
+STATS_SEGMENT_SIZE = 4 * 1024 * 1024  # байт журнала, после которых он уходит в сегмент
+
+
 class Statistics:
-    def __init__(self, stats_file='data/statistics.json'):
+    """
+    Статистика на журнале событий: каждая навигация/эвакуация дописывается
+    строкой JSONL в конец журнала, а компактизация периодически сворачивает
+    его в агрегированный снимок statistics_snapshot.json, который отдаёт /api/stats.
+    Пока снимка нет, за основу берётся statistics.json из репозитория - сам он
+    не перезаписывается.
+
+    Журнал делится на сегменты: первая строка журнала - заголовок с номером
+    поколения, а выросший до STATS_SEGMENT_SIZE журнал переименовывается
+    в statistics_events.jsonl.<поколение> и следующая запись начинает новый.
+    Сегменты не удаляются - по ним статистику можно пересчитать (rebuild_from_log).
+    Позиция в журнале - (поколение, байт): снимок хранит её в log_generation
+    и log_offset, и всё, что после неё, доигрывается по сегментам по порядку.
+    Ротация - одно переименование, поэтому сбой на любом шаге не теряет и
+    не повторяет событий.
+
+    Журнал общий для всех воркеров: каждый дописывает свои события под FileLock,
+    а свою копию агрегатов догоняет по журналу (log_generation, log_pos) - так
+    в /api/stats видны навигации из всех процессов, и снимок ни одного из них не теряет.
+    Файлы создаются при первом событии, импорт приложения ничего не пишет.
+
+    Популярность маршрутов не в снимке, а в route_counters.RouteCounters: матрица
+    счётчиков в mmap-файле, куда пачка навигаций прибавляется вместе с дозаписью
+    журнала. Словарь popular_routes для /api/stats строится из неё по запросу.
+    """
+
+    def __init__(self, stats_file=STATS_SNAPSHOT_FILE, seed_file=STATS_SEED_FILE, events_file=STATS_EVENTS_FILE,
+                 counters_file=ROUTE_COUNTERS_FILE, write_behind=True, flush_interval=STATS_FLUSH_INTERVAL,
+                 flush_every=STATS_FLUSH_EVERY, compact_interval=STATS_COMPACT_INTERVAL,
+                 segment_size=STATS_SEGMENT_SIZE):
         self.stats_file = stats_file
+        self.seed_file = seed_file
+        self.events_file = events_file
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.compact_interval = compact_interval
+        self.segment_size = segment_size
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._file_lock = FileLock(f"{events_file}.lock")
+        self._buffer = []
+        self._pending_routes = {}  # (start_id, end_id, номер дня) -> навигаций, ещё не в счётчиках
+        self.route_counters = RouteCounters(counters_file)
+        self._legacy_routes = None
+        self._since_compact = 0  # событий этого воркера, ещё не попавших в снимок
+        self._last_compact = time.monotonic()
+        self._wakeup = threading.Event()
+        self._flusher = None
+        self.log_generation = 0  # поколение журнала, до которого события учтены в self.data
+        self.log_pos = 0  # и байт в нём
         self.data = self.load_stats()
 
-    def load_stats(self):
-        try:
-            if os.path.exists(self.stats_file):
-                with open(self.stats_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
-            print(f"⚠️ Ошибка загрузки статистики: {e}")
+    @staticmethod
+    def empty_stats():
         return {
             "total_navigations": 0,
-            "popular_routes": {},
             "daily_stats": {},
+            "hourly_stats": {},
             "unique_users": 0,
             "evacuation_used": 0,
-            "last_reset": datetime.now().isoformat()
+            "last_reset": datetime.now().isoformat(),
+            "log_offset": 0,
+            "log_generation": 0
         }
 
+    def _read_snapshot(self):
+        data = self.empty_stats()
+        path = self.stats_file if os.path.exists(self.stats_file) else self.seed_file
+        try:
+            if path and os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    data.update(json.load(f))
+        except Exception as e:
+            print(f"⚠️ Ошибка загрузки статистики: {e}")
+        return data
+
+    # ---------- сегменты журнала ----------
+    def _segment_file(self, generation):
+        return f"{self.events_file}.{generation}"
+
+    def _segment_generations(self):
+        """Поколения свёрнутых сегментов по возрастанию"""
+        folder, name = os.path.split(self.events_file)
+        try:
+            names = os.listdir(folder or '.')
+        except OSError:
+            return []
+        prefix = name + '.'
+        return sorted(int(n[len(prefix):]) for n in names
+                      if n.startswith(prefix) and n[len(prefix):].isdigit())
+
+    @staticmethod
+    def _header_generation(f):
+        """Поколение из заголовка открытого журнала; 0 - журнал старого формата, без заголовка"""
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            return 0
+        if isinstance(header, dict) and header.get("type") == "log":
+            return header.get("generation", 0)
+        return 0
+
+    def _current_generation(self):
+        try:
+            with open(self.events_file, 'rb') as f:
+                return self._header_generation(f)
+        except OSError:
+            return None
+
+    def _open_segment(self, generation):
+        """
+        Файл журнала поколения generation - текущий или уже свёрнутый сегмент.
+        Поколение сверяется по заголовку открытого файла, поэтому ротация в другом
+        воркере не подсунет чужой файл. Возвращает (файл, текущий ли) или (None, False).
+        """
+        try:
+            f = open(self.events_file, 'rb')
+        except FileNotFoundError:
+            f = None
+        if f is not None:
+            if self._header_generation(f) == generation:
+                f.seek(0)
+                return f, True
+            f.close()
+        try:
+            return open(self._segment_file(generation), 'rb'), False
+        except FileNotFoundError:
+            return None, False
+
+    @staticmethod
+    def _log_header(generation):
+        return (json.dumps({"type": "log", "generation": generation}) + '\n').encode('utf-8')
+
+    def _start_log(self):
+        """Новый журнал с заголовком следующего поколения; вызывать под _file_lock"""
+        generation = max(self._segment_generations() + [self.log_generation - 1]) + 1
+        if generation == self.log_generation and self.log_pos:
+            generation += 1  # журнал этого поколения был, но пропал - не продолжаем его с середины
+        tmp_file = f"{self.events_file}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(self._log_header(generation))
+        os.replace(tmp_file, self.events_file)
+
+    def _rotate(self):
+        """Журнал уходит в сегмент своего поколения; вызывать под _file_lock"""
+        generation = self._current_generation()
+        if generation is not None and not os.path.exists(self._segment_file(generation)):
+            os.replace(self.events_file, self._segment_file(generation))
+            print(f"📊 Журнал статистики свёрнут в сегмент {generation}")
+
+    # ---------- чтение журнала ----------
+    @staticmethod
+    def _apply_event(data, event):
+        ts = datetime.fromtimestamp(event["ts"])
+        if event["type"] == "navigation":
+            day = ts.strftime("%Y-%m-%d")
+            hour = ts.strftime("%Y-%m-%d %H:00")
+            data["total_navigations"] += 1
+            data["daily_stats"][day] = data["daily_stats"].get(day, 0) + 1
+            data["hourly_stats"][hour] = data["hourly_stats"].get(hour, 0) + 1
+        elif event["type"] == "evacuation":
+            data["evacuation_used"] = data.get("evacuation_used", 0) + 1
+
+    def _replay_file(self, data, f, offset):
+        count = 0
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                break  # недописанная строка после сбоя
+            offset += len(line)
+            try:
+                event = json.loads(line)
+                if event.get("type") == "log":
+                    continue  # заголовок журнала
+                self._apply_event(data, event)
+                count += 1
+            except (ValueError, KeyError, TypeError, AttributeError):
+                continue
+        return count, offset
+
+    def replay(self, data, generation=0, offset=0):
+        """
+        Применяет к data события журнала после позиции (generation, offset):
+        хвост её сегмента и все следующие сегменты до текущего журнала.
+        Возвращает (сколько событий, поколение и байт, на которых остановились).
+        """
+        count = 0
+        try:
+            while True:
+                f, current = self._open_segment(generation)
+                if f is None:
+                    # Сегмента нет (удалён вручную) - переходим к следующему, если он есть
+                    newest = max(self._segment_generations() + [self._current_generation() or 0])
+                    if generation >= newest:
+                        break
+                    generation, offset = generation + 1, 0
+                    continue
+                with f:
+                    replayed, offset = self._replay_file(data, f, offset)
+                count += replayed
+                if current:
+                    break
+                generation, offset = generation + 1, 0
+        except Exception as e:
+            print(f"⚠️ Ошибка чтения журнала статистики: {e}")
+        return count, generation, offset
+
+    def load_stats(self):
+        # Снимок пишется через os.replace, сегменты после ротации не меняются -
+        # чтение обходится без блокировки и ничего не создаёт
+        data = self._read_snapshot()
+        # Доигрываем хвост журнала, который не успел попасть в снимок
+        replayed, self.log_generation, self.log_pos = self.replay(
+            data, data.get("log_generation", 0), data.get("log_offset", 0))
+        # Старый формат: словарь маршрутов переносится в счётчики (migrate_popular_routes)
+        self._legacy_routes = data.pop("popular_routes", None)
+        if replayed:
+            self._since_compact = replayed
+            print(f"📊 Восстановлено событий из журнала: {replayed}")
+        return data
+
+    def rebuild_from_log(self):
+        """Статистика, пересчитанная заново по всем сохранённым сегментам журнала"""
+        data = self.empty_stats()
+        generations = self._segment_generations()
+        self.replay(data, generations[0] if generations else self._current_generation() or 0, 0)
+        data.pop("log_offset")
+        data.pop("log_generation")
+        return data
+
+    # ---------- запись ----------
+    def _write_buffer(self):
+        """Дописывает буфер в журнал и счётчики маршрутов; вызывать под _io_lock и _file_lock"""
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+            routes, self._pending_routes = self._pending_routes, {}
+        if lines:
+            os.makedirs(os.path.dirname(self.events_file) or '.', exist_ok=True)
+            if not os.path.exists(self.events_file):
+                self._start_log()
+            with open(self.events_file, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+                size = f.tell()
+            if size >= self.segment_size:
+                self._rotate()
+        self.route_counters.add(routes)
+
+    def _catch_up(self):
+        """Учитывает в self.data события, дописанные после позиции (в том числе другими воркерами)"""
+        with self._lock:
+            _, self.log_generation, self.log_pos = self.replay(self.data, self.log_generation, self.log_pos)
+
+    def append_events(self):
+        """Дописывает накопленные события в конец журнала - O(размер пачки)"""
+        try:
+            with self._io_lock, self._file_lock:
+                self._write_buffer()
+        except Exception as e:
+            print(f"❌ Ошибка записи журнала статистики: {e}")
+
     def save_stats(self):
+        """Компактизация: сворачивает журнал в снимок (временный файл + os.replace)"""
+        with self._io_lock:
+            self._compact()
+
+    def _compact(self):
+        """Вызывать под _io_lock"""
         try:
-            os.makedirs(os.path.dirname(self.stats_file), exist_ok=True)
-            with open(self.stats_file, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            # Всё, что записано до этого момента, попадёт в снимок; события, пришедшие
+            # во время записи, останутся в счёте до следующей компактизации
+            with self._lock:
+                covered = self._since_compact
+            os.makedirs(os.path.dirname(self.stats_file) or '.', exist_ok=True)
+            with self._file_lock:
+                self._write_buffer()
+                self._catch_up()
+                with self._lock:
+                    self.data.update(log_offset=self.log_pos, log_generation=self.log_generation)
+                    payload = json.dumps(self.data, ensure_ascii=False, indent=2)
+                # Снимок с позицией в журнале: журнал не трогаем, после сбоя
+                # доиграется всё, что дописано после этой позиции
+                run_blocking(self._write_snapshot, payload)
+            with self._lock:
+                self._since_compact = max(self._since_compact - covered, 0)
+            self._last_compact = time.monotonic()
         except Exception as e:
             print(f"❌ Ошибка сохранения статистики: {e}")
 
+    def _write_snapshot(self, payload):
+        tmp_file = f"{self.stats_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(tmp_file, self.stats_file)
+
+    def _record(self, event, route=None):
+        # В self.data событие попадёт из журнала (_catch_up) - как и события других воркеров
+        with self._lock:
+            if route is not None:
+                self._pending_routes[route] = self._pending_routes.get(route, 0) + 1
+            self._buffer.append(json.dumps(event, ensure_ascii=False))
+            self._since_compact += 1
+        if not self.write_behind:
+            self.append_events()
+            return
+        if self._flusher is None or not self._flusher.is_alive():
+            # Поток запускается лениво: после fork у воркера gunicorn его ещё нет
+            self._flusher = threading.Thread(target=self._flush_loop, name='stats-flusher', daemon=True)
+            self._flusher.start()
+        if len(self._buffer) >= self.flush_every:
+            self._wakeup.set()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._since_compact and time.monotonic() - self._last_compact >= self.compact_interval:
+                self.save_stats()
+            else:
+                self.append_events()
+
+    def flush(self):
+        # Под _io_lock: если компактизация уже идёт в потоке, дожидаемся её и смотрим, что осталось
+        with self._io_lock:
+            if self._since_compact or self._buffer:
+                self._compact()
+
     def increment_navigation(self, start_id: str, end_id: str, start_name: str = "", end_name: str = ""):
         try:
-            self.data["total_navigations"] += 1
-            route_key = f"{start_id}_{end_id}"
-            self.data["popular_routes"][route_key] = self.data["popular_routes"].get(route_key, 0) + 1
-            today = datetime.now().strftime("%Y-%m-%d")
-            self.data["daily_stats"][today] = self.data["daily_stats"].get(today, 0) + 1
-            self.save_stats()
+            self._record({"ts": round(time.time(), 3), "type": "navigation", "route": f"{start_id}_{end_id}"},
+                         route=(start_id, end_id, date.today().toordinal()))
         except Exception as e:
             print(f"❌ Ошибка: {e}")
 
     def increment_evacuation(self):
         try:
-            self.data["evacuation_used"] = self.data.get("evacuation_used", 0) + 1
-            self.save_stats()
+            self._record({"ts": round(time.time(), 3), "type": "evacuation"})
         except Exception as e:
             print(f"❌ Ошибка: {e}")
 
     def get_stats(self):
-        return self.data
+        self.append_events()
+        self._catch_up()
+        # Копия, чтобы ответ API не попадал в файл и не менялся во время сериализации
+        with self._lock:
+            stats = {k: (dict(v) if isinstance(v, dict) else v) for k, v in self.data.items()}
+        stats["popular_routes"] = self.route_counters.popular_routes()
+        return stats
+
+    def migrate_popular_routes(self, point_ids):
+        """Переносит popular_routes из снимка старого формата в счётчики (один раз)"""
+        if not self._legacy_routes:
+            return
+        try:
+            skipped = self.route_counters.import_legacy(self._legacy_routes, point_ids)
+            if skipped is not None:
+                print(f"📊 Популярные маршруты перенесены в счётчики: {len(self._legacy_routes) - skipped}"
+                      f" (не разобрано: {skipped})")
+        except Exception as e:
+            print(f"⚠️ Ошибка переноса популярных маршрутов: {e}")
+        self._legacy_routes = None
 
 
 statistics = Statistics()
+atexit.register(statistics.flush)
 
 
 # ========== ТОЧКИ НАВИГАЦИИ ==========
@@ -116,32 +477,76 @@ class NavigationPoint:
 
 
 class NavigationManager:
-    def __init__(self, data_file='data/points.json'):
-        self.data_file = data_file
-        self.points = []
+    """
+    Точки навигации с индексами по id, этажу и категории.
+    Точки могут изменить в другом воркере - refresh() перечитывает их,
+    если подпись хранилища (mtime файла / версия в SQLite) поменялась.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._by_id = {}
+        self._by_floor = {}
+        self._by_category = {}
+        self.version = 0
+        self.reloads = 0
+        self._signature = None
         self.load_points()
 
+    @property
+    def points(self):
+        return list(self._by_id.values())
+
+    @points.setter
+    def points(self, points):
+        self._by_id = {}
+        self._by_floor = {}
+        self._by_category = {}
+        for point in points:
+            self._by_id[point.id] = point
+            self._index_groups(point)
+
+    def _index_groups(self, point):
+        self._by_floor.setdefault(point.floor, {})[point.id] = point
+        self._by_category.setdefault(point.category, {})[point.id] = point
+
+    def _unindex_groups(self, point):
+        self._by_floor.get(point.floor, {}).pop(point.id, None)
+        self._by_category.get(point.category, {}).pop(point.id, None)
+
     def load_points(self):
         try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    if isinstance(data, dict):
-                        if 'points' in data:
-                            points_data = data['points']
-                        else:
-                            points_data = list(data.values())
-                    else:
-                        points_data = data
-                    self.points = [NavigationPoint.from_dict(point) for point in points_data]
-                    logger.info(f"✅ Загружено {len(self.points)} точек")
+            signature = self.storage.points_signature()
+            points_data = self.storage.load_points()
+            if points_data is not None:
+                self.points = [NavigationPoint.from_dict(point) for point in points_data]
+                self.version += 1
+                self.reloads += 1
+                self._signature = signature
+                logger.info(f"✅ Загружено {len(self.points)} точек")
             else:
-                logger.warning(f"⚠️ Файл {self.data_file} не найден")
+                logger.warning(f"⚠️ Точки не найдены в хранилище ({self.storage.name})")
                 self.create_default_points()
         except Exception as e:
             logger.error(f"❌ Ошибка загрузки точек: {e}")
             self.create_default_points()
 
+    def refresh(self):
+        """Перечитывает точки, если их изменил другой процесс"""
+        try:
+            if self.storage.points_signature() != self._signature:
+                self.load_points()
+                return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка проверки точек: {e}")
+        return False
+
+    def _mark_written(self, before):
+        # Если до нашей записи файл уже менял другой воркер, подпись не обновляем -
+        # следующий refresh() перечитает точки вместе с его правками
+        if before == self._signature:
+            self._signature = self.storage.points_signature()
+
     def create_default_points(self):
         default_points = [
             {"id": "entrance_main", "name": "Главный вход", "x": 265, "y": 340, "floor": 1,
@@ -173,80 +578,348 @@ class NavigationManager:
         self.save_points()
 
     def save_points(self):
+        self.version += 1
         try:
-            os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump([p.to_dict() for p in self.points], f, ensure_ascii=False, indent=2)
+            self.storage.save_points([p.to_dict() for p in self.points])
+            self._signature = self.storage.points_signature()
         except Exception as e:
             logger.error(f"❌ Ошибка сохранения точек: {e}")
 
+    def _store_point(self, point: NavigationPoint, old_id: str = None):
+        # Только изменённая точка - для SQLite это одна строка
+        self.version += 1
+        try:
+            before = self.storage.points_signature()
+            self.storage.upsert_point(point.to_dict(), old_id=old_id)
+            self._mark_written(before)
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения точки: {e}")
+
+    def add_point(self, point: NavigationPoint):
+        if point.id in self._by_id:
+            self._unindex_groups(self._by_id[point.id])
+        self._by_id[point.id] = point
+        self._index_groups(point)
+        self._store_point(point)
+
+    def update_point(self, point_id: str, point: NavigationPoint) -> bool:
+        old = self._by_id.get(point_id)
+        if old is None:
+            return False
+        if point.id == point_id:
+            self._unindex_groups(old)
+            self._by_id[point_id] = point
+            self._index_groups(point)
+        else:
+            # Сменился id - пересобираем индексы, сохраняя порядок точек
+            self.points = [point if p.id == point_id else p for p in self.points]
+        self._store_point(point, old_id=point_id)
+        return True
+
+    def delete_point(self, point_id: str) -> bool:
+        point = self._by_id.pop(point_id, None)
+        if point is None:
+            return False
+        self._unindex_groups(point)
+        self.version += 1
+        try:
+            before = self.storage.points_signature()
+            self.storage.delete_point(point_id)
+            self._mark_written(before)
+        except Exception as e:
+            logger.error(f"❌ Ошибка удаления точки: {e}")
+        return True
+
     def get_point(self, point_id: str):
-        for point in self.points:
-            if point.id == point_id:
-                return point
-        return None
+        return self._by_id.get(point_id)
 
     def get_exits(self, floor: int = None):
-        exits = [p for p in self.points if p.category == 'entrance']
+        exits = self._by_category.get('entrance', {}).values()
         if floor is not None:
-            exits = [p for p in exits if p.floor == floor]
-        return exits
+            return [p for p in exits if p.floor == floor]
+        return list(exits)
 
     def get_points_by_floor(self, floor: int):
-        return [p for p in self.points if p.floor == floor]
+        return list(self._by_floor.get(floor, {}).values())
 
     def calculate_distance(self, p1: NavigationPoint, p2: NavigationPoint) -> float:
         return math.sqrt((p1.x - p2.x) ** 2 + (p1.y - p2.y) ** 2)
 
 
-nav_manager = NavigationManager()
+nav_manager = NavigationManager(storage)
+statistics.migrate_popular_routes([p.id for p in nav_manager.points])
+# Когда таблица счётчиков заполнится, точки, которых больше нет, из неё выбрасываются
+statistics.route_counters.live_ids = lambda: [p.id for p in nav_manager.points]
+
+
+@app.before_request
+def refresh_shared_state():
+    # Правки из админки в другом воркере: одна проверка подписи на запрос
+    nav_manager.refresh()
 
 # ========== РАБОТА С МАРШРУТАМИ ==========
-ROUTES_FILE = 'data/routes.json'
-EVACUATION_FILE = 'data/evacuation_routes.json'
+COMPACT_EVERY = 200  # правок в журнале до перезаписи файла целиком (JSON-хранилище)
+
+
+class CachedDictStore:
+    """
+    Словарь из хранилища в памяти: перечитывается только при изменении подписи
+    (mtime/размер файлов или счётчик версии в SQLite). Правки отдельных ключей
+    уходят в хранилище как изменения, а не перезапись всего набора.
+    kind - имя набора в хранилище: 'routes' -> load_routes/patch_routes/...
+    """
+
+    kind = None
+
+    def __init__(self, storage, compact_every=COMPACT_EVERY):
+        self.storage = storage
+        self.compact_every = compact_every
+        self.data = {}
+        self.hits = 0
+        self.reloads = 0
+        self.version = 0
+        self._signature = None
+        self._lock = threading.Lock()
+        self._load = getattr(storage, f'load_{self.kind}')
+        self._save = getattr(storage, f'save_{self.kind}')
+        self._patch = getattr(storage, f'patch_{self.kind}')
+        self._compact = getattr(storage, f'compact_{self.kind}')
+        self._get_signature = getattr(storage, f'{self.kind}_signature')
+
+    @property
+    def etag(self):
+        """ETag набора по подписи хранилища - одинаков во всех воркерах"""
+        return hashlib.sha1(repr(self._signature).encode()).hexdigest()
+
+    @property
+    def journal_entries(self):
+        return getattr(self.storage, f'{self.kind}_journal_entries')
+
+    def _reload(self, signature):
+        try:
+            self.data = self._load()
+            self.reloads += 1
+            self.version += 1
+            logger.info(f"🔄 {self.kind} перечитаны ({self.storage.name}): {len(self.data)}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки {self.kind}: {e}")
+            self.data = {}
+        self._signature = signature
+
+    def get_all(self):
+        signature = self._get_signature()
+        with self._lock:
+            if self.reloads == 0 or signature != self._signature:
+                self._reload(signature)
+            else:
+                self.hits += 1
+            return self.data
+
+    def get(self, key):
+        return self.get_all().get(key)
+
+    def _mark_written(self, before):
+        # Подпись до записи не та, что мы читали: набор менял другой воркер -
+        # оставляем старую подпись, и следующее чтение перечитает его целиком
+        if before == self._signature:
+            self._signature = self._get_signature()
+
+    def save(self, data):
+        """Полная замена всего набора"""
+        with self._lock:
+            try:
+                self._save(data)
+            except Exception as e:
+                logger.error(f"❌ Ошибка сохранения {self.kind}: {e}")
+                return False
+            self.data = data
+            self.version += 1
+            self._signature = self._get_signature()
+            return True
+
+    def patch(self, changes, precondition=None):
+        """
+        Пакетное изменение: {ключ: значение} - добавить/заменить, {ключ: None} - удалить.
+        В хранилище уходят только изменённые записи. precondition(текущие значения
+        ключей) хранилище проверяет в той же блокировке/транзакции, что и запись;
+        не прошла - PreconditionFailed.
+        """
+        self.get_all()
+        with self._lock:
+            if not changes:
+                return True
+            before = self._get_signature()
+            try:
+                self._patch(changes, precondition)
+            except PreconditionFailed:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи {self.kind}: {e}")
+                return False
+            # Копия при записи: читатели продолжают работать со старым словарём
+            data = dict(self.data)
+            for key, value in changes.items():
+                if value is None:
+                    data.pop(key, None)
+                else:
+                    data[key] = value
+            self.data = data
+            self.version += 1
+            if self.journal_entries >= self.compact_every:
+                try:
+                    self._compact()
+                except Exception as e:
+                    logger.error(f"❌ Ошибка компактизации {self.kind}: {e}")
+            self._mark_written(before)
+            return True
+
+    def put(self, key, value):
+        return self.patch({key: value})
+
+    def delete(self, key):
+        return self.patch({key: None})
+
+    def compact(self):
+        with self._lock:
+            if self.journal_entries:
+                before = self._get_signature()
+                self._compact()
+                self._mark_written(before)
+
+    def get_counters(self):
+        return {'hits': self.hits, 'reloads': self.reloads, 'items': len(self.data),
+                'journal_entries': self.journal_entries}
+
+
+class RouteStore(CachedDictStore):
+    """
+    Обычные маршруты (routes.json / таблица routes).
+    Каждый маршрут хранится с полем metrics (route_metrics): длина, время, повороты.
+    Считаются при записи и заново для всех маршрутов при загрузке - так старые
+    записи без metrics и маршруты, записанные другим воркером, всегда с ними.
+    """
+
+    kind = 'routes'
+
+    def _reload(self, signature):
+        super()._reload(signature)
+        try:
+            attach_metrics(self.data)
+        except Exception as e:
+            logger.error(f"❌ Ошибка расчёта метрик маршрутов: {e}")
+
+    def save(self, data):
+        return super().save(with_metrics(data))
+
+    def patch(self, changes, precondition=None):
+        return super().patch(with_metrics(changes), precondition)
+
+    def put_if_match(self, key, route, if_match):
+        """
+        put (route=None - delete), только если маршрут не менялся: if_match - ETag'и
+        из заголовка If-Match. Сравнение и запись - под блокировкой хранилища;
+        маршрут изменён или удалён - PreconditionFailed с текущим значением.
+        """
+        def unchanged(current):
+            stored = current.get(key)
+            return stored is not None and if_match.contains(route_etag(with_metrics({key: stored})[key]))
+
+        return self.patch({key: route}, unchanged)
+
+    @property
+    def routes(self):
+        return self.data
+
+
+def route_etag(route):
+    """ETag одного маршрута - для условных запросов и защиты от одновременной правки"""
+    payload = json.dumps(route, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+route_store = RouteStore(storage)
+atexit.register(route_store.compact)
 
 
 def load_routes():
-    try:
-        if os.path.exists(ROUTES_FILE):
-            with open(ROUTES_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
-    except:
-        return {}
+    return route_store.get_all()
 
 
 def save_routes(routes):
-    try:
-        os.makedirs('data', exist_ok=True)
-        with open(ROUTES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(routes, f, ensure_ascii=False, indent=2)
-        return True
-    except:
-        return False
+    return route_store.save(routes)
 
 
 def load_evacuation_routes():
     try:
-        if os.path.exists(EVACUATION_FILE):
-            with open(EVACUATION_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
+        return storage.load_evacuation_routes()
     except:
         return {}
 
 
 def save_evacuation_routes(routes):
     try:
-        os.makedirs('data', exist_ok=True)
-        with open(EVACUATION_FILE, 'w', encoding='utf-8') as f:
-            json.dump(routes, f, ensure_ascii=False, indent=2)
+        storage.save_evacuation_routes(routes)
         logger.info(f"✅ Сохранено {len(routes)} эвакуационных маршрутов")
         return True
     except:
         return False
 
 
+# ========== КАРТА И ГРАФ КОРИДОРОВ ==========
+MAP_FILE = 'data/map_data.json'
+NEXT_HOP_FILE = 'data/next_hop.bin'
+
+
+def load_map_data():
+    if os.path.exists(MAP_FILE):
+        with open(MAP_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {"floors": {"1": {"walls": []}, "2": {"walls": []}, "3": {"walls": []}}}
+
+
+_wall_index = WallIndex()
+_wall_index_mtime = -1  # ещё не строился
+_wall_index_lock = threading.Lock()
+
+
+def _map_mtime():
+    try:
+        return os.stat(MAP_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_wall_index():
+    """Сетка стен по этажам; перестраивается только после сохранения карты"""
+    global _wall_index, _wall_index_mtime
+    mtime = _map_mtime()
+    with _wall_index_lock:
+        if mtime != _wall_index_mtime:
+            _wall_index = WallIndex(walls_from_map(load_map_data()))
+            _wall_index_mtime = mtime
+        return _wall_index
+
+
+corridor_graph = CorridorGraph()
+_corridor_graph_key = None
+_corridor_graph_lock = threading.Lock()
+
+
+def get_corridor_graph():
+    """Граф коридоров, синхронизированный с текущими точками, маршрутами и стенами"""
+    global _corridor_graph_key
+    routes = route_store.get_all()
+    wall_index = get_wall_index()
+    key = (route_store.version, nav_manager.version, _wall_index_mtime)
+    with _corridor_graph_lock:
+        if key != _corridor_graph_key:
+            corridor_graph.sync(nav_manager.points, routes, wall_index.walls)
+            # Кратчайшие пути между всеми парами - из файла или пересчёт, если данные изменились
+            ensure_next_hop_table(corridor_graph, NEXT_HOP_FILE)
+            _corridor_graph_key = key
+    return corridor_graph
+
+
 # ========== ФУНКЦИЯ ДЛЯ IP ==========
 def get_local_ip():
     try:
@@ -290,6 +963,18 @@ def voice_editor():
     return render_template('voice_editor.html')
 
 
+@app.route('/google-map')
+def google_map():
+    """Карта в стиле Google Maps: план этажа тайлами (build_tiles.py)"""
+    return render_template('google-map.html')
+
+
+@app.route('/yandex-map')
+def yandex_map():
+    """Карта в стиле Яндекс Карт: план этажа тайлами (build_tiles.py)"""
+    return render_template('yandex-map.html')
+
+
 # ========== API ТОЧЕК ==========
 @app.route('/api/points', methods=['GET'])
 def get_points():
@@ -309,8 +994,7 @@ def add_point():
         if 'id' not in data:
             data['id'] = f"point_{int(datetime.now().timestamp() * 1000)}"
         new_point = NavigationPoint.from_dict(data)
-        nav_manager.points.append(new_point)
-        nav_manager.save_points()
+        nav_manager.add_point(new_point)
         return jsonify({'success': True, 'point': new_point.to_dict()})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -320,11 +1004,9 @@ def add_point():
 def update_point(point_id):
     try:
         data = request.json
-        for i, point in enumerate(nav_manager.points):
-            if point.id == point_id:
-                nav_manager.points[i] = NavigationPoint.from_dict(data)
-                nav_manager.save_points()
-                return jsonify({'success': True})
+        if nav_manager.update_point(point_id, NavigationPoint.from_dict(data)):
+            qr_cache.invalidate(point_id)
+            return jsonify({'success': True})
         return jsonify({'error': 'Not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -333,20 +1015,23 @@ def update_point(point_id):
 @app.route('/api/points/<point_id>', methods=['DELETE'])
 def delete_point(point_id):
     try:
-        nav_manager.points = [p for p in nav_manager.points if p.id != point_id]
-        nav_manager.save_points()
+        nav_manager.delete_point(point_id)
+        qr_cache.invalidate(point_id)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 # ========== API КАРТЫ (СТЕНЫ) ==========
+def _write_map_file(data):
+    with open(MAP_FILE, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
 @app.route('/api/save-map', methods=['POST'])
 def save_map():
     try:
-        data = request.json
-        with open('data/map_data.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        run_blocking(_write_map_file, request.json)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -355,18 +1040,106 @@ def save_map():
 @app.route('/api/load-map', methods=['GET'])
 def load_map():
     try:
-        if os.path.exists('data/map_data.json'):
-            with open('data/map_data.json', 'r', encoding='utf-8') as f:
-                return jsonify(json.load(f))
-        return jsonify({"floors": {"1": {"walls": []}, "2": {"walls": []}, "3": {"walls": []}}})
+        return jsonify(load_map_data())
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/map/walls', methods=['GET'])
+def get_map_walls():
+    """Стены этажа; bbox=x1,y1,x2,y2 - только попадающие в окно просмотра"""
+    floor = request.args.get('floor', 1, type=int)
+    index = get_wall_index()
+    bbox = request.args.get('bbox')
+    if bbox:
+        try:
+            x1, y1, x2, y2 = (float(v) for v in bbox.split(','))
+        except ValueError:
+            return jsonify({'error': 'bbox должен быть в виде x1,y1,x2,y2'}), 400
+        walls = index.in_bbox(floor, x1, y1, x2, y2)
+    else:
+        walls = index.walls.get(floor, [])
+    return jsonify({
+        'floor': floor,
+        'walls': [{'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2} for x1, y1, x2, y2 in walls],
+        'total': len(index.walls.get(floor, []))
+    })
+
+
 # ========== API ОБЫЧНЫХ МАРШРУТОВ ==========
+COMPACT_CACHE_SIZE = 4  # разных допусков в кэше компактных маршрутов
+MAX_TOLERANCE = 1000.0  # единиц карты - больше любого маршрута на плане
+_compact_routes_cache = OrderedDict()  # допуск -> (версия маршрутов, {ключ: компактный маршрут})
+_compact_routes_lock = threading.Lock()
+
+
+def wants_compact():
+    return request.args.get('compact', '').lower() in ('1', 'true', 'yes')
+
+
+def compact_with_summary(route, tolerance):
+    """compact_route, но metrics - только итоги: индексы точек после упрощения уже не те"""
+    compact = compact_route(route, tolerance)
+    if 'metrics' in compact:
+        compact['metrics'] = metrics_summary(compact['metrics'])
+    return compact
+
+
+def compact_tolerance():
+    """
+    Допуск упрощения из ?tolerance= (0 - убрать только дубли и точки точно на прямой).
+    None - не число, nan или inf: вызывающий отвечает 400.
+    """
+    tolerance = request.args.get('tolerance', DEFAULT_TOLERANCE, type=float)
+    if not math.isfinite(tolerance):
+        return None
+    return min(max(tolerance, 0.0), MAX_TOLERANCE)
+
+
+def _bad_tolerance():
+    return jsonify({'error': 'tolerance must be a finite number'}), 400
+
+
 @app.route('/api/routes', methods=['GET'])
 def get_routes():
-    return jsonify(load_routes())
+    """?compact=1 - упрощённые маршруты с координатами в виде строки (см. route_codec)"""
+    if not wants_compact():
+        return jsonify(load_routes())
+    tolerance = compact_tolerance()
+    if tolerance is None:
+        return _bad_tolerance()
+    routes = route_store.get_all()
+    version = route_store.version
+    with _compact_routes_lock:
+        cached = _compact_routes_cache.get(tolerance)
+        if cached is not None and cached[0] == version:
+            _compact_routes_cache.move_to_end(tolerance)
+    if cached is None or cached[0] != version:
+        # Считаем вне блокировки; кэш - последние COMPACT_CACHE_SIZE допусков
+        cached = (version, {k: compact_with_summary(route, tolerance) for k, route in routes.items()})
+        with _compact_routes_lock:
+            _compact_routes_cache[tolerance] = cached
+            _compact_routes_cache.move_to_end(tolerance)
+            while len(_compact_routes_cache) > COMPACT_CACHE_SIZE:
+                _compact_routes_cache.popitem(last=False)
+    response = jsonify(cached[1])
+    # Допуск - в ETag: ответ с другим tolerance - другое тело
+    response.set_etag(f"{route_store.etag}-compact-{tolerance}")
+    return response.make_conditional(request)
+
+
+def check_routes(routes):
+    """Проверка сохраняемых маршрутов по стенам и точкам; сводка - в ответ API"""
+    try:
+        report = validate_routes(routes, nav_manager.points, get_wall_index().walls)
+    except Exception as e:
+        logger.error(f"❌ Ошибка проверки маршрутов: {e}")
+        return None
+    if report['invalid_routes']:
+        logger.warning(f"⚠️ Маршруты с проблемами ({report['invalid_routes']}): {report['counts']}")
+    summary = summarize(report)
+    summary['invalid_keys'] = list(report['issues'].keys())
+    return summary
 
 
 @app.route('/api/routes', methods=['POST'])
@@ -374,7 +1147,111 @@ def save_routes_api():
     try:
         data = request.json
         save_routes(data)
-        return jsonify({'success': True, 'count': len(data)})
+        return jsonify({'success': True, 'count': len(data), 'validation': check_routes(data)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/routes', methods=['PATCH'])
+def patch_routes_api():
+    """Пакетная правка: {ключ: маршрут} - сохранить, {ключ: null} - удалить"""
+    try:
+        data = request.json
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Expected object'}), 400
+        if not route_store.patch(data):
+            return jsonify({'error': 'Save failed'}), 500
+        deleted = sum(1 for route in data.values() if route is None)
+        saved = {key: route for key, route in data.items() if route is not None}
+        return jsonify({'success': True, 'updated': len(data) - deleted, 'deleted': deleted,
+                        'validation': check_routes(saved)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/routes/validate', methods=['GET'])
+def validate_routes_api():
+    """Полный отчёт проверки всех маршрутов"""
+    try:
+        return jsonify(validate_routes(route_store.get_all(), nav_manager.points, get_wall_index().walls))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/routes/validate', methods=['POST'])
+def fix_routes_api():
+    """Автоисправление: дубли точек, сдвинутые концы, устаревшие pointId"""
+    try:
+        routes = route_store.get_all()
+        report = validate_routes(routes, nav_manager.points, get_wall_index().walls)
+        fixed = fix_routes(routes, nav_manager.points, report)
+        if fixed and not route_store.patch(fixed):
+            return jsonify({'error': 'Save failed'}), 500
+        return jsonify({'success': True, 'fixed': list(fixed.keys()), 'validation': check_routes(route_store.get_all())})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/routes/<route_key>', methods=['GET'])
+def get_route(route_key):
+    route = route_store.get(route_key)
+    if route is None:
+        return jsonify({'error': 'Not found'}), 404
+    if wants_compact():
+        tolerance = compact_tolerance()
+        if tolerance is None:
+            return _bad_tolerance()
+        response = jsonify(compact_with_summary(route, tolerance))
+        response.set_etag(f"{route_etag(route)}-compact-{tolerance}")
+    else:
+        response = jsonify(route)
+        response.set_etag(route_etag(route))
+    return response.make_conditional(request)
+
+
+def _write_route(route_key, route):
+    """
+    Запись/удаление маршрута; с If-Match - только если маршрут не изменил кто-то
+    другой с момента чтения. Проверка и запись - одна операция хранилища.
+    Возвращает None или ответ 412 с текущим маршрутом.
+    """
+    if not request.if_match:
+        return None if route_store.put(route_key, route) else (jsonify({'error': 'Save failed'}), 500)
+    try:
+        if not route_store.put_if_match(route_key, route, request.if_match):
+            return jsonify({'error': 'Save failed'}), 500
+    except PreconditionFailed as e:
+        current = e.current.get(route_key)
+        if current is not None:
+            current = with_metrics({route_key: current})[route_key]
+        return jsonify({'error': 'Route was modified', 'route': current}), 412
+    return None
+
+
+@app.route('/api/routes/<route_key>', methods=['PUT'])
+def put_route(route_key):
+    try:
+        data = request.json
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Expected object'}), 400
+        failed = _write_route(route_key, data)
+        if failed:
+            return failed
+        # ETag - от сохранённой записи: в ней уже есть пересчитанные metrics
+        return jsonify({'success': True, 'etag': route_etag(route_store.get(route_key)), 'validation': check_routes({route_key: data})})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/routes/<route_key>', methods=['DELETE'])
+def delete_route(route_key):
+    try:
+        if route_store.get(route_key) is None:
+            return jsonify({'error': 'Not found'}), 404
+        failed = _write_route(route_key, None)
+        if failed:
+            return failed
+        return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -395,31 +1272,176 @@ def save_evacuation_routes_api():
         return jsonify({'error': str(e)}), 500
 
 
-# ========== API ЭВАКУАЦИИ ==========
-@app.route('/api/evacuation/start', methods=['POST'])
-def start_evacuation():
-    """Запуск эвакуации - возвращает сохраненный эвакуационный маршрут"""
+# ========== BOOTSTRAP ДЛЯ ПРОСМОТРЩИКА ==========
+class BootstrapCache:
+    """
+    Точки, карта, маршруты и эвакуационные маршруты одним ответом.
+    Тело и его сжатые варианты собираются один раз на версию данных;
+    ETag - хэш тела, поэтому одинаков во всех процессах сервера.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.etag = None
+        self.bodies = {}
+        self.builds = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _data_key():
+        return (nav_manager.version, route_store.version,
+                storage.evacuation_routes_signature(), _map_mtime())
+
+    def get(self):
+        routes = route_store.get_all()
+        key = self._data_key()
+        with self._lock:
+            if key != self.key:
+                payload = {
+                    'points': [p.to_dict() for p in nav_manager.points],
+                    'map': load_map_data(),
+                    'routes': routes,
+                    'evacuation_routes': load_evacuation_routes()
+                }
+                body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+                bodies = run_blocking(compress_variants, body)
+                self.etag = hashlib.sha1(body).hexdigest()
+                self.bodies = bodies
+                self.key = key
+                self.builds += 1
+                logger.info(f"📦 Bootstrap пересобран: {len(body)} байт, gzip {len(bodies['gzip'])}")
+            return self.etag, self.bodies
+
+
+def compress_variants(body):
+    """{'identity', 'gzip', 'br'} - тело и его сжатые варианты (вызывается в пуле потоков)"""
+    bodies = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9)}
+    if brotli is not None:
+        bodies['br'] = brotli.compress(body)
+    return bodies
+
+
+bootstrap_cache = BootstrapCache()
+
+
+def choose_encoding(available):
+    """Лучшее сжатие из поддерживаемых клиентом (Accept-Encoding)"""
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accepted[encoding]:
+            return encoding
+    return 'identity'
+
+
+@app.route('/api/bootstrap', methods=['GET'])
+def bootstrap():
+    """Все данные для старта просмотрщика за один запрос (или 304, если не менялись)"""
     try:
-        # Загружаем сохраненные эвакуационные маршруты
-        evac_routes = load_evacuation_routes()
-
-        print(f"📢 Загружено эвакуационных маршрутов: {len(evac_routes)}")
-
-        # Если есть сохраненные маршруты - берем первый
-        if evac_routes:
-            first_key = list(evac_routes.keys())[0]
-            route = evac_routes[first_key]
-            print(f"✅ Возвращаем маршрут: {route.get('name', 'Без имени')}, точек: {len(route.get('points', []))}")
+        etag, bodies = bootstrap_cache.get()
+        encoding = choose_encoding(bodies)
+        # Сильный ETag на каждое представление: у сжатых вариантов свой суффикс
+        variant_etag = etag if encoding == 'identity' else f"{etag}-{encoding}"
+        # Содержимое всех вариантов одинаково - подходит ETag любого из них
+        known = [etag] + [f"{etag}-{name}" for name in bodies if name != 'identity']
+        if any(request.if_none_match.contains(tag) for tag in known):
+            response = app.response_class(status=304)
+        else:
+            response = app.response_class(bodies[encoding], mimetype='application/json')
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(variant_etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-            statistics.increment_evacuation()
-            return jsonify({
-                'success': True,
-                'route': route,
-                'message': '🚨 ЭВАКУАЦИЯ! Следуйте по красному маршруту'
-            })
 
+# ========== API ЭВАКУАЦИИ ==========
+EVACUATION_COLOR = '#dc2626'
+EVACUATION_MESSAGE = '🚨 ЭВАКУАЦИЯ! Следуйте по красному маршруту'
+
+# Перекрытия общие для всех воркеров: задаются в одном, файл подхватывают остальные
+EVACUATION_BLOCKED_FILE = 'data/evacuation_blocked.json'
+
+evacuation_planner = EvacuationPlanner()
+_evacuation_responses = {}  # point_id известной точки -> готовый JSON (для _evacuation_responses_version)
+_evacuation_responses_version = None  # (версия планировщика, сохранённых маршрутов, точек)
+_evacuation_responses_lock = threading.Lock()
+_blocked_lock = FileLock(f"{EVACUATION_BLOCKED_FILE}.lock")
+_blocked_signature = None
+
+
+def _write_blocked_file(blocked):
+    tmp_file = f"{EVACUATION_BLOCKED_FILE}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(blocked, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, EVACUATION_BLOCKED_FILE)
+
+
+def get_evacuation_planner():
+    """Таблица путей к ближайшим выходам, синхронизированная с графом коридоров и файлом перекрытий"""
+    global _blocked_signature
+    evacuation_planner.sync(get_corridor_graph(), [p.id for p in nav_manager.get_exits()])
+    signature = file_signature(EVACUATION_BLOCKED_FILE)
+    if signature != _blocked_signature:
+        blocked = {}
+        try:
+            with open(EVACUATION_BLOCKED_FILE, 'r', encoding='utf-8') as f:
+                blocked = json.load(f)
+        except (OSError, ValueError):
+            pass
+        evacuation_planner.set_blocked(blocked.get('exits', []), blocked.get('areas', []))
+        _blocked_signature = signature
+    return evacuation_planner
+
+
+def nearest_saved_evacuation_route(point):
+    """
+    Сохранённый эвакуационный маршрут, проходящий ближе всего к точке,
+    начиная с ближайшей к ней вершины (если выходов в точках нет)
+    """
+    evac_routes = load_evacuation_routes()
+    if not evac_routes:
+        return None
+    if point is None:
+        return evac_routes[next(iter(evac_routes))]
+    best = None
+    for route in evac_routes.values():
+        for i, p in enumerate(route.get('points', [])):
+            if p.get('floor', 1) != point.floor:
+                continue
+            distance = math.hypot(p['x'] - point.x, p['y'] - point.y)
+            if best is None or distance < best[0]:
+                best = (distance, route, i)
+    if best is None:
+        return evac_routes[next(iter(evac_routes))]
+    _, route, index = best
+    start = {'x': point.x, 'y': point.y, 'floor': point.floor, 'pointId': point.id, 'pointName': point.name}
+    return dict(route, points=[start] + route['points'][index:])
+
+
+def build_evacuation_response(point_id):
+    point = nav_manager.get_point(point_id) if point_id else None
+    if point is not None:
+        planner = get_evacuation_planner()
+        nodes, cost = planner.route_from(point.id)
+        if nodes:
+            exit_point = nav_manager.get_point(nodes[-1][1])
+            route = {
+                'name': f"🚨 Выход: {exit_point.name if exit_point else 'ближайший'}",
+                'points': planner.graph.to_waypoints(nodes),
+                'type': 'evacuation',
+                'color': EVACUATION_COLOR,
+                'exitId': nodes[-1][1],
+                'distance': round(cost * 0.5)
+            }
+            return {'success': True, 'route': route, 'message': EVACUATION_MESSAGE}
+
+    route = nearest_saved_evacuation_route(point)
+    if route is None:
         # Если нет сохраненных маршрутов - создаем стандартный
-        default_route = {
+        route = {
             "name": "🚨 ЭВАКУАЦИОННЫЙ МАРШРУТ",
             "points": [
                 {"x": 265, "y": 340, "floor": 1, "pointId": "start", "pointName": "Начало маршрута"},
@@ -428,33 +1450,127 @@ def start_evacuation():
                 {"x": 100, "y": 340, "floor": 1, "pointId": "exit", "pointName": "ВЫХОД"}
             ],
             "type": "evacuation",
-            "color": "#dc2626"
+            "color": EVACUATION_COLOR
         }
+    return {'success': True, 'route': route, 'message': EVACUATION_MESSAGE}
+
 
+@app.route('/api/evacuation/start', methods=['POST'])
+def start_evacuation():
+    """Путь от current_point_id к ближайшему незаблокированному выходу (готовый ответ из кэша)"""
+    global _evacuation_responses_version
+    try:
+        data = request.get_json(silent=True) or {}
+        point_id = data.get('current_point_id')
+        if point_id is not None and not isinstance(point_id, str):
+            return jsonify({'error': 'current_point_id must be a string'}), 400
+        point = nav_manager.get_point(point_id) if point_id else None
+        planner = get_evacuation_planner()
+        if point is None:
+            # Неизвестная точка - без кэша: иначе каждый новый id оставался бы в памяти
+            body = json.dumps(build_evacuation_response(None), ensure_ascii=False)
+        else:
+            # Ответы зависят от перекрытий, графа, сохранённых маршрутов и точек
+            version = (planner.version, storage.evacuation_routes_signature(), nav_manager.version)
+            with _evacuation_responses_lock:
+                if version != _evacuation_responses_version:
+                    _evacuation_responses.clear()
+                    _evacuation_responses_version = version
+                body = _evacuation_responses.get(point.id)
+            if body is None:
+                body = json.dumps(build_evacuation_response(point.id), ensure_ascii=False)
+                with _evacuation_responses_lock:
+                    if version == _evacuation_responses_version:
+                        _evacuation_responses[point.id] = body
         statistics.increment_evacuation()
-        return jsonify({
-            'success': True,
-            'route': default_route,
-            'message': '🚨 ЭВАКУАЦИЯ! Следуйте по красному маршруту'
-        })
+        return app.response_class(body, mimetype='application/json')
 
     except Exception as e:
         logger.error(f"Ошибка эвакуации: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/evacuation/blocked', methods=['GET'])
+def get_evacuation_blocked():
+    planner = get_evacuation_planner()
+    return jsonify({
+        'exits': sorted(planner.blocked_exits),
+        'areas': planner.blocked_areas,
+        'counters': planner.get_counters()
+    })
+
+
+@app.route('/api/evacuation/blocked', methods=['POST'])
+def set_evacuation_blocked():
+    """
+    Перекрытые выходы и участки: {"exits": [point_id, ...],
+    "areas": [{"floor": 1, "x": 100, "y": 200, "radius": 50}, ...]}
+    """
+    try:
+        data = request.json or {}
+        areas = []
+        for area in data.get('areas', []):
+            areas.append({'floor': int(area.get('floor', 1)), 'x': float(area['x']), 'y': float(area['y']),
+                          'radius': float(area.get('radius', 50))})
+        os.makedirs(os.path.dirname(EVACUATION_BLOCKED_FILE), exist_ok=True)
+        with _blocked_lock:
+            run_blocking(_write_blocked_file, {'exits': sorted(data.get('exits', [])), 'areas': areas})
+        started = time.perf_counter()
+        # Пересчёт - при чтении изменившегося файла, так же как в остальных воркерах
+        planner = get_evacuation_planner()
+        elapsed = round((time.perf_counter() - started) * 1000, 2)
+        print(f"🚧 Перекрыто выходов: {len(planner.blocked_exits)}, участков: {len(areas)} ({elapsed} мс)")
+        return jsonify({'success': True, 'elapsed_ms': elapsed, 'counters': planner.get_counters()})
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Bad area: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 # ========== API УВЕДОМЛЕНИЙ ==========
+ALERTS_FILE = 'data/alerts.jsonl'
+
+alerts = AlertBroadcaster(shared_file=ALERTS_FILE)
+
+
 @app.route('/api/evacuation/notify', methods=['POST'])
 def evacuation_notify():
-    """Получение уведомления об эвакуации от сервера"""
+    """
+    Тревога всем подключённым просмотрщикам: {"message": "...", "type": "evacuation"|"all_clear",
+    "floors": [1, 2], "zones": ["A"], "per_floor": {"2": {"message": "..."}}}
+    """
     try:
-        data = request.json
-        print(f"📢 Уведомление об эвакуации: {data.get('message')}")
-        return jsonify({'success': True})
+        data = request.json or {}
+        event_type = data.get('type', 'evacuation')
+        if event_type not in ('evacuation', 'all_clear'):
+            return jsonify({'error': 'Unknown event type'}), 400
+        message = data.get('message') or ('🚨 ВНИМАНИЕ! ЭВАКУАЦИЯ!' if event_type == 'evacuation'
+                                          else '✅ Эвакуация отменена')
+        event_id = alerts.publish(event_type, message, floors=data.get('floors'), zones=data.get('zones'),
+                                  per_floor=data.get('per_floor'))
+        print(f"📢 Уведомление об эвакуации: {message} (подписчиков: {alerts.subscribers})")
+        return jsonify({'success': True, 'id': event_id, 'subscribers': alerts.subscribers})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/evacuation/stream', methods=['GET'])
+def evacuation_stream():
+    """Server-Sent Events: ?floor=&zone= - только адресованные этому этажу/зоне тревоги"""
+    floor = request.args.get('floor', type=int)
+    zone = request.args.get('zone')
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    response = app.response_class(alerts.stream(last_id, floor, zone), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx не должен копить поток
+    return response
+
+
+@app.route('/api/evacuation/alerts', methods=['GET'])
+def evacuation_alerts():
+    return jsonify({'events': alerts.recent(), 'counters': alerts.get_counters()})
+
+
 # ========== API НАВИГАЦИИ ==========
 @app.route('/api/navigate', methods=['POST'])
 def navigate():
@@ -472,16 +1588,24 @@ def navigate():
         if not start_point or not end_point:
             return jsonify({'error': 'Points not found'}), 404
 
-        # Ищем маршрут
-        routes = load_routes()
+        # Ищем маршрут (из памяти RouteStore, без разбора файла)
+        routes = route_store.get_all()
         route_key = f"{start_id}_{end_id}"
         reverse_key = f"{end_id}_{start_id}"
 
+        metrics = None
         if route_key in routes:
             path = routes[route_key].get('points', [])
+            metrics = routes[route_key].get('metrics')
         elif reverse_key in routes:
             path = list(reversed(routes[reverse_key].get('points', [])))
+            if routes[reverse_key].get('metrics'):
+                metrics = reverse_metrics(routes[reverse_key]['metrics'], len(path))
         else:
+            # Маршрута нет в routes.json - ищем путь по графу коридоров
+            path = get_corridor_graph().find_path(start_id, end_id)
+        if not path:
+            metrics = None
             path = [
                 {'x': start_point.x, 'y': start_point.y, 'floor': start_point.floor,
                  'pointId': start_point.id, 'pointName': start_point.name},
@@ -489,24 +1613,36 @@ def navigate():
                  'pointId': end_point.id, 'pointName': end_point.name}
             ]
 
-        # Расстояние
-        distance = 0
-        for i in range(len(path) - 1):
-            distance += math.sqrt(
-                (path[i + 1]['x'] - path[i]['x']) ** 2 +
-                (path[i + 1]['y'] - path[i]['y']) ** 2
-            )
+        # Длина, время и повороты: у сохранённых маршрутов посчитаны заранее
+        if metrics is None:
+            metrics = path_metrics(path)
 
-        meters = round(distance * 0.5)
-        minutes = max(1, round(meters / 70))
+        # Голосовые подсказки: написанные вручную для этого направления, иначе - сгенерированные
+        prompts = (voice_store.get(route_key) or generated_prompts.get(route_key)
+                   or generated_prompts.for_path(path, metrics))
+
+        compact = wants_compact() or data.get('compact')
+        tolerance = compact_tolerance() if compact else None
+        if compact and tolerance is None:
+            return _bad_tolerance()
 
         # Статистика
         statistics.increment_navigation(start_id, end_id, start_point.name, end_point.name)
 
+        if compact:
+            return jsonify({
+                'route': compact_route({'points': path}, tolerance),
+                'distance': metrics['meters'],
+                'time': metrics['minutes'],
+                'metrics': metrics_summary(metrics),
+                'prompts': prompts
+            })
         return jsonify({
             'path': path,
-            'distance': meters,
-            'time': minutes
+            'distance': metrics['meters'],
+            'time': metrics['minutes'],
+            'metrics': metrics,
+            'prompts': prompts
         })
 
     except Exception as e:
@@ -514,16 +1650,23 @@ def navigate():
         return jsonify({'error': str(e)}), 500
 
 
+search_index = SearchIndex()
+
+
 @app.route('/api/search', methods=['GET'])
 def search():
-    query = request.args.get('q', '')
+    query = request.args.get('q', '').strip()
     if len(query) < 2:
         return jsonify([])
+    limit = max(1, min(request.args.get('limit', 20, type=int), 50))
+    if search_index.version != nav_manager.version:
+        search_index.sync(nav_manager.points, nav_manager.version)
     results = []
-    for p in nav_manager.points:
-        if query in p.name.lower() or query in p.description.lower():
+    for point_id in search_index.search(query, limit):
+        p = nav_manager.get_point(point_id)
+        if p:
             results.append({'id': p.id, 'name': p.name, 'category': p.category, 'floor': p.floor})
-    return jsonify(results[:20])
+    return jsonify(results)
 
 
 # ========== API СТАТИСТИКИ ==========
@@ -533,13 +1676,125 @@ def get_stats():
         stats = statistics.get_stats()
         stats['total_points'] = len(nav_manager.points)
         stats['total_routes'] = len(load_routes())
+        stats['route_store'] = route_store.get_counters()
+        stats['bootstrap_builds'] = bootstrap_cache.builds
+        stats['wall_index'] = get_wall_index().get_counters()
+        stats['corridor_graph'] = corridor_graph.get_counters()
+        stats['evacuation'] = evacuation_planner.get_counters()
+        stats['alerts'] = alerts.get_counters()
+        stats['blocking_pool'] = blocking_pool.get_counters()
+        stats['route_counters'] = statistics.route_counters.get_counters()
+        stats['generated_prompts'] = generated_prompts.get_counters()
         stats['total_evacuation_routes'] = len(load_evacuation_routes())
         return jsonify(stats)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/stats/routes', methods=['GET'])
+def get_route_stats():
+    """Популярные маршруты из счётчиков: ?limit=20 - сколько, ?days=7 - разбивка по последним дням"""
+    try:
+        statistics.append_events()  # свои ещё не сброшенные навигации - в счётчики
+        counters = statistics.route_counters
+        limit = max(1, min(request.args.get('limit', 20, type=int), 1000))
+        days = max(0, min(request.args.get('days', 7, type=int), counters.days))
+        return jsonify({
+            'popular_routes': counters.popular_routes(limit),
+            'by_day': counters.by_day(days, limit),
+            'counters': counters.get_counters()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 # ========== API QR-КОДОВ ==========
+# Адрес определяется один раз при запуске (или задаётся через BASE_URL)
+BASE_URL = os.environ.get('BASE_URL') or f"http://{get_local_ip()}:8080"
+QR_CACHE_DIR = 'qr_codes/cache'
+
+
+class QRCache:
+    """
+    Готовые PNG QR-кодов, адресуемые по содержимому: ключ - хэш (URL, размер).
+    Сначала память (LRU), затем диск, и только потом рендер.
+    """
+
+    def __init__(self, cache_dir=QR_CACHE_DIR, max_items=512):
+        self.cache_dir = cache_dir
+        self.max_items = max_items
+        self._memory = OrderedDict()  # ключ -> (png, last_modified)
+        self._keys_by_point = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(url, box_size):
+        return hashlib.sha1(f"{url}|{box_size}".encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def render(url, box_size):
+        qr = qrcode.QRCode(version=1, box_size=box_size, border=4)
+        qr.add_data(url)
+        qr.make(fit=True)
+        buffer = io.BytesIO()
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def _render_to_file(self, path, url, box_size):
+        """(png, ошибка записи или None)"""
+        png = self.render(url, box_size)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Тот же QR может рендериться сразу в нескольких потоках пула и воркерах
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            return png, e
+        return png, None
+
+    def get(self, point_id, url, box_size):
+        """(ключ-ETag, png, время изменения)"""
+        key = self.make_key(url, box_size)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return (key,) + self._memory[key]
+        path = os.path.join(self.cache_dir, f"{key}.png")
+        try:
+            with open(path, 'rb') as f:
+                png = f.read()
+            last_modified = os.path.getmtime(path)
+        except OSError:
+            # Рендер PIL и запись на диск - в пуле потоков, чтобы не держать остальные запросы
+            png, error = run_blocking(self._render_to_file, path, url, box_size)
+            last_modified = time.time()
+            if error:
+                logger.warning(f"⚠️ Не удалось сохранить QR в кэш: {error}")
+        with self._lock:
+            self._memory[key] = (png, last_modified)
+            self._keys_by_point.setdefault(point_id, set()).add(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+        return key, png, last_modified
+
+    def invalidate(self, point_id):
+        """Удаляет QR точки из памяти и с диска (точка изменена или удалена)"""
+        with self._lock:
+            keys = self._keys_by_point.pop(point_id, set())
+            for key in keys:
+                self._memory.pop(key, None)
+        for key in keys:
+            try:
+                os.remove(os.path.join(self.cache_dir, f"{key}.png"))
+            except OSError:
+                pass
+
+
+qr_cache = QRCache()
+
+
 @app.route('/api/qr/<point_id>', methods=['GET'])
 def generate_qr(point_id):
     try:
@@ -547,54 +1802,159 @@ def generate_qr(point_id):
         if not point:
             return jsonify({'error': 'Point not found'}), 404
 
-        os.makedirs('qr_codes', exist_ok=True)
-        local_ip = get_local_ip()
-        url = f"http://{local_ip}:8080/viewer?point={point_id}"
-
-        qr = qrcode.QRCode(version=1, box_size=10, border=4)
-        qr.add_data(url)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-
-        qr_path = f'qr_codes/{point_id}.png'
-        img.save(qr_path)
-        return send_file(qr_path, mimetype='image/png')
+        box_size = max(1, min(request.args.get('size', 10, type=int), 40))
+        url = f"{BASE_URL}/viewer?point={point_id}"
+        etag, png, last_modified = qr_cache.get(point_id, url, box_size)
+        # conditional=True отвечает 304 на If-None-Match / If-Modified-Since
+        return send_file(io.BytesIO(png), mimetype='image/png', etag=etag,
+                         last_modified=last_modified, max_age=86400, conditional=True)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 # ========== API ГОЛОСОВЫХ ПОДСКАЗОК ==========
-VOICE_FILE = 'data/voice_prompts.json'
+class VoicePromptStore(CachedDictStore):
+    """Голосовые подсказки по ключу маршрута: загружаются один раз, пишется только изменённый ключ"""
+
+    kind = 'voice_prompts'
+
+
+voice_store = VoicePromptStore(storage)
+atexit.register(voice_store.compact)
+
+
+VOICE_PAGE_LIMIT = 200  # подсказок на странице /api/voice-prompts не больше
 
 
 def load_voice_prompts():
-    try:
-        if os.path.exists(VOICE_FILE):
-            with open(VOICE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except:
-        pass
-    return {}
+    return voice_store.get_all()
 
 
 def save_voice_prompts(prompts):
-    try:
-        os.makedirs('data', exist_ok=True)
-        with open(VOICE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(prompts, f, ensure_ascii=False, indent=2)
-    except:
-        pass
+    voice_store.save(prompts)
 
 
 @app.route('/api/voice-prompts', methods=['GET'])
 def get_all_voice():
-    return jsonify(load_voice_prompts())
+    """
+    Без параметров - все подсказки (с ETag). Фильтры:
+    keys=a,b - только эти маршруты; offset/limit - страница (limit от 1 до
+    VOICE_PAGE_LIMIT, по умолчанию - он же); keys_only=1 - список ключей
+    """
+    prompts = voice_store.get_all()
+    if request.args.get('keys_only'):
+        return jsonify(list(prompts.keys()))
+    keys = request.args.get('keys')
+    offset = request.args.get('offset', type=int)
+    limit = request.args.get('limit', type=int)
+    if keys is not None:
+        selected = {key: prompts[key] for key in keys.split(',') if key in prompts}
+    elif offset is not None or limit is not None:
+        offset = max(offset or 0, 0)
+        limit = max(1, min(limit if limit is not None else VOICE_PAGE_LIMIT, VOICE_PAGE_LIMIT))
+        selected = {key: prompts[key] for key in islice(prompts, offset, offset + limit)}
+    else:
+        response = jsonify(prompts)
+        response.set_etag(voice_store.etag)
+        return response.make_conditional(request)
+    response = jsonify(selected)
+    response.headers['X-Total-Count'] = str(len(prompts))
+    return response
+
+
+class GeneratedPromptCache:
+    """
+    Автоматические подсказки (voice_generator) сразу для всех маршрутов.
+    Пересобираются одним проходом, когда меняется версия маршрутов, точек
+    или файл шаблонов фраз.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.generator = None
+        self.prompts = {}
+        self.builds = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _data_key():
+        return (route_store.version, nav_manager.version, file_signature(VOICE_SETTINGS_FILE))
+
+    def _get(self):
+        with self._lock:
+            route_store.get_all()  # перечитать маршруты, если их изменил другой воркер
+            # Сначала версия, потом маршруты: если их поменяют между вызовами,
+            # подсказки окажутся новее ключа и просто пересоберутся ещё раз
+            key = self._data_key()
+            if key != self.key:
+                routes = route_store.get_all()
+                started = time.perf_counter()
+                self.generator = PromptGenerator([p.to_dict() for p in nav_manager.points], load_phrases())
+                self.prompts = self.generator.generate_all(routes)
+                self.key = key
+                self.builds += 1
+                logger.info(f"🔊 Подсказки сгенерированы: {len(self.prompts)} маршрутов "
+                            f"за {(time.perf_counter() - started) * 1000:.1f} мс")
+            return self.generator, self.prompts
+
+    def get_all(self):
+        return self._get()[1]
+
+    def get(self, route_key):
+        return self.get_all().get(route_key)
+
+    def for_path(self, points, metrics=None):
+        """Подсказки для пути, которого нет среди маршрутов (обратное направление, граф коридоров)"""
+        generator, _ = self._get()
+        return generator.generate(points, metrics)
+
+    def get_counters(self):
+        return {'builds': self.builds, 'routes': len(self.prompts)}
+
+
+generated_prompts = GeneratedPromptCache()
+
+
+def split_route_key(route_key):
+    """'start_end' -> (start_id, end_id); id точек сами содержат "_", делим там, где обе части - точки"""
+    parts = route_key.split('_')
+    for i in range(1, len(parts)):
+        start_id, end_id = '_'.join(parts[:i]), '_'.join(parts[i:])
+        if nav_manager.get_point(start_id) and nav_manager.get_point(end_id):
+            return start_id, end_id
+    return None, None
+
+
+@app.route('/api/voice-prompts/generated', methods=['GET'])
+def get_all_generated_voice():
+    """Сгенерированные подсказки всех маршрутов; keys=a,b - только эти"""
+    prompts = generated_prompts.get_all()
+    keys = request.args.get('keys')
+    if keys is not None:
+        return jsonify({key: prompts[key] for key in keys.split(',') if key in prompts})
+    response = jsonify(prompts)
+    response.set_etag(hashlib.sha1(repr(generated_prompts.key).encode()).hexdigest())
+    return response.make_conditional(request)
+
+
+@app.route('/api/voice-prompts/generated/<route_key>', methods=['GET'])
+def get_generated_voice(route_key):
+    """Сгенерированные подсказки маршрута; для обратного направления - по развёрнутому маршруту"""
+    prompts = generated_prompts.get(route_key)
+    if prompts is None:
+        start_id, end_id = split_route_key(route_key)
+        reverse = route_store.get(f"{end_id}_{start_id}") if start_id else None
+        if not reverse or len(reverse.get('points') or []) < 2:
+            return jsonify({'error': 'Not found'}), 404
+        points = list(reversed(reverse['points']))
+        metrics = reverse_metrics(reverse['metrics'], len(points)) if reverse.get('metrics') else None
+        prompts = generated_prompts.for_path(points, metrics)
+    return jsonify(prompts)
 
 
 @app.route('/api/voice-prompts/<route_key>', methods=['GET'])
 def get_voice(route_key):
-    prompts = load_voice_prompts()
-    return jsonify(prompts.get(route_key, []))
+    return jsonify(voice_store.get(route_key) or [])
 
 
 @app.route('/api/voice-prompts/<route_key>', methods=['POST'])
@@ -602,18 +1962,127 @@ def save_voice(route_key):
     try:
         data = request.json
         prompts = data.get('prompts', [])
-        all_prompts = load_voice_prompts()
-        all_prompts[route_key] = prompts
-        save_voice_prompts(all_prompts)
+        if not voice_store.put(route_key, prompts):
+            return jsonify({'error': 'Save failed'}), 500
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 # ========== СТАТИЧЕСКИЕ ФАЙЛЫ ==========
-@app.route('/static/<path:path>')
-def serve_static(path):
-    return send_from_directory('static', path)
+STATIC_DIR = 'static'
+STATIC_MANIFEST_FILE = 'static/dist/manifest.json'  # создаёт build_static.py
+IMMUTABLE_MAX_AGE = 31536000  # год: имя собранного файла меняется вместе с содержимым
+STATIC_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_static_manifest = {}
+_static_manifest_mtime = None
+
+
+def get_static_manifest():
+    """Манифест собранной статики; перечитывается, если сборку обновили"""
+    global _static_manifest, _static_manifest_mtime
+    try:
+        mtime = os.stat(STATIC_MANIFEST_FILE).st_mtime_ns
+    except OSError:
+        _static_manifest, _static_manifest_mtime = {}, None
+        return _static_manifest
+    if mtime != _static_manifest_mtime:
+        try:
+            with open(STATIC_MANIFEST_FILE, 'r', encoding='utf-8') as f:
+                _static_manifest = json.load(f)
+        except Exception as e:
+            logger.error(f"❌ Ошибка чтения манифеста статики: {e}")
+            _static_manifest = {}
+        _static_manifest_mtime = mtime
+    return _static_manifest
+
+
+@app.template_global('asset')
+def asset_url(path):
+    """Ссылка на файл статики: собранный вариант с отпечатком, если есть"""
+    return f"/static/{get_static_manifest().get(path, path)}"
+
+
+@app.route('/api/static-manifest', methods=['GET'])
+def get_static_manifest_api():
+    """Манифест для скриптов: картинки, которые они подгружают сами (планы этажей), - по собранным ссылкам"""
+    response = jsonify(get_static_manifest())
+    response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@app.route('/static/<path:filename>', endpoint='static')
+def serve_static(filename):
+    if not filename.startswith('dist/'):
+        return send_from_directory(STATIC_DIR, filename)
+
+    # Собранный файл: сжатый вариант по Accept-Encoding и кэш навсегда
+    response = None
+    for encoding, suffix in STATIC_ENCODINGS:
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(STATIC_DIR, filename + suffix)):
+            response = send_from_directory(STATIC_DIR, filename + suffix, max_age=IMMUTABLE_MAX_AGE)
+            # Тип - по исходному файлу, а не по .br/.gz
+            response.headers['Content-Type'] = get_content_type(
+                mimetypes.guess_type(filename)[0] or 'application/octet-stream', 'utf-8')
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_from_directory(STATIC_DIR, filename, max_age=IMMUTABLE_MAX_AGE)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return response
+
+
+# ========== ТАЙЛЫ ПЛАНОВ ЭТАЖЕЙ ==========
+TILES_DIR = 'static/tiles'  # создаёт build_tiles.py
+TILES_META_FILE = 'static/tiles/tiles.json'
+TILE_MAX_AGE = 86400
+
+_tiles_meta = {}
+_tiles_meta_mtime = None
+
+
+def get_tiles_meta():
+    """Описание пирамид тайлов по этажам; перечитывается после новой нарезки"""
+    global _tiles_meta, _tiles_meta_mtime
+    try:
+        mtime = os.stat(TILES_META_FILE).st_mtime_ns
+    except OSError:
+        _tiles_meta, _tiles_meta_mtime = {}, None
+        return _tiles_meta
+    if mtime != _tiles_meta_mtime:
+        try:
+            with open(TILES_META_FILE, 'r', encoding='utf-8') as f:
+                _tiles_meta = json.load(f)
+        except Exception as e:
+            logger.error(f"❌ Ошибка чтения описания тайлов: {e}")
+            _tiles_meta = {}
+        _tiles_meta_mtime = mtime
+    return _tiles_meta
+
+
+@app.route('/api/tiles', methods=['GET'])
+def get_tiles_info():
+    response = jsonify(get_tiles_meta())
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/api/tiles/<int:floor>/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_tile(floor, z, x, y):
+    """Один тайл; ?v=<версия плана> из /api/tiles делает ссылку неизменяемой"""
+    meta = get_tiles_meta().get(str(floor))
+    if not meta or not 0 <= z <= meta['max_zoom']:
+        return jsonify({'error': 'Tile not found'}), 404
+    path = os.path.join(TILES_DIR, f"floor{floor}", str(z), f"{x}_{y}.{meta['format']}")
+    if not os.path.isfile(path):
+        return jsonify({'error': 'Tile not found'}), 404
+    response = send_file(path, max_age=TILE_MAX_AGE, conditional=True)
+    if request.args.get('v') == meta['version']:
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return response
 
 
 # ========== ЗАПУСК ==========
@@ -628,6 +2097,10 @@ if __name__ == '__main__':
     for key, route in evac_routes.items():
         print(f"   - {key}: {route.get('name', 'Без имени')} ({len(route.get('points', []))} точек)")
 
+    # Граф коридоров и таблица кратчайших путей - до первого запроса
+    graph = get_corridor_graph()
+    print(f"🧭 Граф коридоров: {graph.get_counters()}")
+
     local_ip = get_local_ip()
 
     points_by_floor = {1: 0, 2: 0, 3: 0}
@@ -644,6 +2117,7 @@ if __name__ == '__main__':
     print(f"   🗺️ Навигатор: http://localhost:8080/viewer")
     print(f"   ✏️ Редактор карты: http://localhost:8080/editor")
     print(f"   ⚙️ Админ-панель: http://localhost:8080/admin")
+    print(f"\n🚀 Продакшен: gunicorn -c gunicorn.conf.py app:app")
     print("=" * 70 + "\n")
 
-    app.run(debug=True, host='0.0.0.0', port=8080)
\ No newline at end of file
+    app.run(debug=DEBUG, host='0.0.0.0', port=8080)
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""
+Нагрузочная проверка рассылки тревог (SSE) на локальной машине
+Поднимает приложение на gevent-сервере, открывает N простаивающих подключений
+к /api/evacuation/stream, публикует тревогу через /api/evacuation/notify и
+замеряет, через сколько её получил каждый клиент.
+
+    python bench_sse.py --clients 2000
+"""
+
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse
+import json
+import resource
+import socket
+import time
+
+import gevent
+from gevent.event import Event
+from gevent.pywsgi import WSGIServer
+
+
+def raise_file_limit(needed):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def client(port, floor, ready, received):
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.sendall(f"GET /api/evacuation/stream?floor={floor} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    buffer = b''
+    while b': connected' not in buffer:
+        buffer += sock.recv(4096)
+    ready()
+    while b'event: evacuation' not in buffer:
+        chunk = sock.recv(4096)
+        if not chunk:
+            sock.close()
+            return
+        buffer += chunk
+    received.append(time.perf_counter())
+    sock.close()
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def run(clients, floors):
+    raise_file_limit(clients * 2 + 100)
+    import app as school_app
+
+    server = WSGIServer(('127.0.0.1', 0), school_app.app, log=None)
+    server.start()
+    port = server.server_port
+
+    connected = [0]
+    all_ready = Event()
+    received = []
+
+    def ready():
+        connected[0] += 1
+        if connected[0] == clients:
+            all_ready.set()
+
+    started = time.perf_counter()
+    greenlets = [gevent.spawn(client, port, 1 + i % floors, ready, received) for i in range(clients)]
+    all_ready.wait(timeout=120)
+    print(f"🔌 Подключено клиентов: {connected[0]} за {time.perf_counter() - started:.2f} с "
+          f"(подписчиков на сервере: {school_app.alerts.subscribers})")
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    body = json.dumps({'message': 'Учебная тревога', 'per_floor': {'2': {'message': 'Выход через лестницу Б'}}})
+    sock = socket.create_connection(('127.0.0.1', port))
+    sent_at = time.perf_counter()
+    sock.sendall((f"POST /api/evacuation/notify HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(body.encode())}\r\nConnection: close\r\n\r\n{body}").encode())
+    gevent.joinall(greenlets, timeout=60)
+    sock.close()
+    server.stop(timeout=1)
+
+    latencies = sorted((t - sent_at) * 1000 for t in received)
+    if not latencies:
+        print("❌ Ни один клиент не получил тревогу")
+        return
+    print(f"📢 Тревогу получили: {len(latencies)} из {clients}")
+    print(f"⏱️ Задержка, мс: p50 {percentile(latencies, 0.5):.1f}, p95 {percentile(latencies, 0.95):.1f}, "
+          f"макс {latencies[-1]:.1f}")
+    print(f"💾 Пиковая память процесса: {peak_rss // 1024} МБ")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Проверка рассылки тревог на N подключениях')
+    parser.add_argument('--clients', type=int, default=1000, help='число подключений')
+    parser.add_argument('--floors', type=int, default=3, help='по скольким этажам распределить клиентов')
+    args = parser.parse_args()
+    run(args.clients, args.floors)
@@ -0,0 +1,77 @@
+"""
+Ограниченный пул потоков для блокирующей работы: рендер QR (PIL), сжатие
+ответов, запись JSON на диск
+Под gunicorn с воркером gevent (gunicorn.conf.py) все запросы воркера - гринлеты
+в одном потоке ОС: долгий вызов PIL, zlib или запись большого файла останавливает
+их все, включая открытые SSE-соединения. run_blocking выполняет такой вызов в
+настоящем потоке ОС (пул gevent), а ждущий гринлет тем временем уступает
+управление остальным. Без gevent (python app.py) - обычный ThreadPoolExecutor:
+он ограничивает, сколько тяжёлых вызовов идёт одновременно.
+
+Размер пула - переменная окружения BLOCKING_POOL_SIZE (по умолчанию 4).
+В функции, которые уходят в пул, передаются только готовые данные: без
+блокировок и объектов, которые в этот момент меняет другой запрос.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+POOL_SIZE = int(os.environ.get('BLOCKING_POOL_SIZE', 4))
+
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+class BlockingPool:
+
+    def __init__(self, size=POOL_SIZE):
+        self.size = max(1, size)
+        self.mode = None
+        self.calls = 0
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        # Пул создаётся лениво и заново после fork: потоки родителя в воркер не переходят
+        pid = os.getpid()
+        if self._pool is None or self._pid != pid:
+            with self._lock:
+                if self._pool is None or self._pid != pid:
+                    if _gevent_patched():
+                        from gevent.threadpool import ThreadPool
+                        self._pool, self.mode = ThreadPool(self.size), 'gevent'
+                    else:
+                        self._pool = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='blocking')
+                        self.mode = 'threads'
+                    self._pid = pid
+        return self._pool
+
+    def run(self, func, *args, **kwargs):
+        """Выполняет func в пуле и возвращает результат (исключения пробрасываются)"""
+        pool = self._get_pool()
+        self.calls += 1
+        if self.mode == 'gevent':
+            return pool.apply(func, args, kwargs)
+        try:
+            future = pool.submit(func, *args, **kwargs)
+        except RuntimeError:
+            # Интерпретатор завершается (сброс статистики в atexit) - пул задач уже не берёт
+            return func(*args, **kwargs)
+        return future.result()
+
+    def get_counters(self):
+        return {'size': self.size, 'mode': self.mode, 'calls': self.calls}
+
+
+blocking_pool = BlockingPool()
+
+
+def run_blocking(func, *args, **kwargs):
+    return blocking_pool.run(func, *args, **kwargs)
@@ -0,0 +1,179 @@
+"""
+Сборка статики для продакшена: файлы из static/ копируются в static/dist/
+с отпечатком содержимого в имени (style.css -> style.3f2a9c1b0d.css)
+и рядом кладутся сжатые варианты .gz и .br.
+Манифест static/dist/manifest.json сопоставляет исходный путь и собранный -
+по нему шаблоны получают ссылки через asset('css/style.css'), а скрипты -
+через /api/static-manifest.
+Ссылки внутри CSS и JS (url(...), @import, import ... from '...') на другие
+файлы статики переписываются на собранные, поэтому такие файлы собираются
+после тех, на которые ссылаются, и их отпечаток меняется вместе с ними.
+
+Запуск после любого изменения статики (на Render - в buildCommand):
+    python build_static.py
+"""
+
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+import argparse
+import posixpath
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None  # без brotli будут только .gz
+
+STATIC_DIR = 'static'
+DIST_DIR = 'dist'  # внутри STATIC_DIR
+MANIFEST_FILE = 'manifest.json'  # внутри DIST_DIR
+STATIC_URL = '/static/'  # так статика видна в браузере (serve_static в app.py)
+SKIP_DIRS = (DIST_DIR, 'tiles')  # тайлы планов этажей кэшируются по своей схеме (build_tiles.py)
+HASH_LENGTH = 10
+# JPEG/PNG уже сжаты - для них только отпечаток
+COMPRESSIBLE = {'.css', '.js', '.json', '.svg', '.html', '.txt', '.map'}
+# Ссылки на другие файлы статики; вторая группа - сам путь
+REFERENCE_PATTERNS = {
+    '.css': [
+        re.compile(r"""url\(\s*(['"]?)([^'")\s]+)\1\s*\)"""),
+        re.compile(r"""@import\s+(['"])([^'"]+)\1"""),
+    ],
+    '.js': [
+        re.compile(r"""\bimport\s*\(\s*(['"])([^'"]+)\1\s*\)"""),
+        re.compile(r"""\b(?:import|export)\b[^'";]*?\bfrom\s*(['"])([^'"]+)\1"""),
+        re.compile(r"""\bimport\s*(['"])([^'"]+)\1"""),
+    ],
+}
+
+
+def fingerprint_name(rel_path, content):
+    digest = hashlib.sha1(content).hexdigest()[:HASH_LENGTH]
+    base, ext = os.path.splitext(rel_path)
+    return f"{base}.{digest}{ext}"
+
+
+def _resolve_reference(rel_path, ref):
+    """Путь внутри static/ для ссылки ref из файла rel_path; None - внешняя ссылка"""
+    if ref.startswith(('data:', '#', '//')) or re.match(r'^[a-z][a-z0-9+.-]*:', ref, re.I):
+        return None
+    path = re.split(r'[?#]', ref, maxsplit=1)[0]
+    if path.startswith('/'):
+        return path[len(STATIC_URL):] if path.startswith(STATIC_URL) else None
+    return posixpath.normpath(posixpath.join(posixpath.dirname(rel_path), path))
+
+
+def rewrite_references(rel_path, content, resolve):
+    """
+    Переписывает в CSS/JS ссылки на файлы статики на собранные.
+    resolve(путь в static/) -> собранный путь ('dist/...') или None - ссылку не трогаем.
+    """
+    patterns = REFERENCE_PATTERNS.get(os.path.splitext(rel_path)[1].lower())
+    if not patterns:
+        return content
+    try:
+        text = content.decode('utf-8')
+    except UnicodeDecodeError:
+        return content
+
+    def replace(match):
+        ref = match.group(2)
+        target = _resolve_reference(rel_path, ref)
+        built = resolve(target) if target else None
+        if built is None:
+            return match.group(0)
+        path = re.split(r'[?#]', ref, maxsplit=1)[0]
+        if path.startswith('/'):
+            new_path = f"{STATIC_URL}{built}"
+        else:
+            # Собранный файл лежит в dist/ в той же подпапке, что и исходный
+            new_path = posixpath.relpath(built, posixpath.join(DIST_DIR, posixpath.dirname(rel_path)))
+            if not new_path.startswith('.'):
+                new_path = f"./{new_path}"  # иначе для import это имя пакета, а не файл
+        start, end = match.start(2) - match.start(0), match.end(2) - match.start(0)
+        whole = match.group(0)
+        return whole[:start] + new_path + ref[len(path):] + whole[end:]
+
+    for pattern in patterns:
+        text = pattern.sub(replace, text)
+    return text.encode('utf-8')
+
+
+def write_variants(path, content):
+    """Пишет .gz/.br рядом с файлом, если сжатие действительно уменьшает размер"""
+    variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(content)))
+    written = []
+    for suffix, data in variants:
+        if len(data) < len(content):
+            with open(path + suffix, 'wb') as f:
+                f.write(data)
+            written.append(suffix)
+    return written
+
+
+def build(static_dir=STATIC_DIR, clean=True):
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    if clean and os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+    os.makedirs(dist_dir, exist_ok=True)
+
+    sources = {}
+    for root, dirs, files in os.walk(static_dir):
+        if root == static_dir:
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for filename in sorted(files):
+            source = os.path.join(root, filename)
+            sources[os.path.relpath(source, static_dir).replace(os.sep, '/')] = source
+
+    manifest = {}
+    sizes = [0, 0]  # исходный размер, со сжатием
+
+    def build_file(rel_path, referrers=()):
+        if rel_path in manifest:
+            return manifest[rel_path]
+        with open(sources[rel_path], 'rb') as f:
+            content = f.read()
+        # Сначала собираем то, на что файл ссылается (циклические ссылки оставляем как есть)
+        content = rewrite_references(rel_path, content, lambda target: (
+            build_file(target, referrers + (rel_path,))
+            if target in sources and target not in referrers and target != rel_path else None))
+        built = fingerprint_name(rel_path, content)
+        target = os.path.join(dist_dir, built)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(content)
+        variants = []
+        if os.path.splitext(rel_path)[1].lower() in COMPRESSIBLE:
+            variants = write_variants(target, content)
+        manifest[rel_path] = f"{DIST_DIR}/{built}"
+        sizes[0] += len(content)
+        sizes[1] += os.path.getsize(target + variants[-1]) if variants else len(content)
+        print(f"   • {rel_path} -> {built} {' '.join(variants)}")
+        return manifest[rel_path]
+
+    for rel_path in sources:
+        build_file(rel_path)
+    total_size, compressed_size = sizes
+
+    with open(os.path.join(dist_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    print(f"\n✅ Собрано файлов: {len(manifest)}")
+    print(f"📦 Размер: {total_size // 1024} КБ, со сжатием: {compressed_size // 1024} КБ")
+    print(f"📁 Манифест: {os.path.join(dist_dir, MANIFEST_FILE)}")
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сборка статики с отпечатками и сжатыми вариантами')
+    parser.add_argument('--static-dir', default=STATIC_DIR, help='папка со статикой')
+    parser.add_argument('--keep', action='store_true', help='не удалять прошлую сборку (старые ссылки остаются рабочими)')
+    args = parser.parse_args()
+    build(args.static_dir, clean=not args.keep)
@@ -0,0 +1,88 @@
+"""
+Нарезка планов этажей (static/images/floor1..3.jpg) на пирамиду тайлов
+Уровень max_zoom - исходное разрешение, каждый уровень ниже - вдвое меньше.
+Тайлы: static/tiles/floor<N>/<z>/<x>_<y>.webp (или .jpg, если Pillow без WebP),
+описание уровней: static/tiles/tiles.json - его отдаёт /api/tiles
+
+Запуск после замены плана этажа (на Render - в buildCommand):
+    python build_tiles.py
+"""
+
+import os
+import json
+import math
+import shutil
+import hashlib
+import argparse
+from PIL import Image, features
+
+FLOOR_IMAGES = 'static/images/floor{floor}.jpg'
+TILES_DIR = 'static/tiles'
+META_FILE = 'tiles.json'  # внутри TILES_DIR
+FLOORS = (1, 2, 3)
+TILE_SIZE = 256
+QUALITY = 80
+
+
+def tile_format():
+    return ('webp', 'WEBP') if features.check('webp') else ('jpg', 'JPEG')
+
+
+def build_floor(floor, source, tiles_dir=TILES_DIR, tile_size=TILE_SIZE, quality=QUALITY):
+    """Режет один план; возвращает описание пирамиды для tiles.json"""
+    with open(source, 'rb') as f:
+        version = hashlib.sha1(f.read()).hexdigest()[:10]
+    image = Image.open(source).convert('RGB')
+    width, height = image.size
+    max_zoom = max(0, math.ceil(math.log2(max(width, height) / tile_size)))
+    ext, pil_format = tile_format()
+
+    floor_dir = os.path.join(tiles_dir, f"floor{floor}")
+    shutil.rmtree(floor_dir, ignore_errors=True)
+    count = 0
+    level = image
+    for z in range(max_zoom, -1, -1):
+        level_dir = os.path.join(floor_dir, str(z))
+        os.makedirs(level_dir, exist_ok=True)
+        for ty in range(math.ceil(level.height / tile_size)):
+            for tx in range(math.ceil(level.width / tile_size)):
+                box = (tx * tile_size, ty * tile_size,
+                       min((tx + 1) * tile_size, level.width), min((ty + 1) * tile_size, level.height))
+                level.crop(box).save(os.path.join(level_dir, f"{tx}_{ty}.{ext}"), pil_format, quality=quality)
+                count += 1
+        # Следующий уровень - вдвое меньше
+        level = level.resize((max(1, level.width // 2), max(1, level.height // 2)), Image.LANCZOS)
+
+    print(f"   • {floor} этаж: {width}x{height}, уровней {max_zoom + 1}, тайлов {count}")
+    return {
+        'width': width,
+        'height': height,
+        'tile_size': tile_size,
+        'max_zoom': max_zoom,
+        'format': ext,
+        'version': version
+    }
+
+
+def build_all(tiles_dir=TILES_DIR, tile_size=TILE_SIZE, quality=QUALITY):
+    os.makedirs(tiles_dir, exist_ok=True)
+    meta = {}
+    for floor in FLOORS:
+        source = FLOOR_IMAGES.format(floor=floor)
+        if not os.path.exists(source):
+            print(f"⚠️ Нет плана {floor} этажа: {source}")
+            continue
+        meta[str(floor)] = build_floor(floor, source, tiles_dir, tile_size, quality)
+
+    with open(os.path.join(tiles_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ Тайлы готовы: {tiles_dir}")
+    return meta
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Нарезка планов этажей на тайлы')
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help='размер тайла в пикселях')
+    parser.add_argument('--quality', type=int, default=QUALITY, help='качество сжатия (1-100)')
+    args = parser.parse_args()
+    build_all(tile_size=args.tile_size, quality=args.quality)
@@ -0,0 +1,214 @@
+"""
+Эвакуация: кратчайший путь от любой точки до ближайшего выхода
+Выходы - точки категории entrance. По графу коридоров (pathfinding.CorridorGraph)
+один раз запускается Дейкстра сразу от всех выходов; для каждого узла запоминается
+расстояние до ближайшего выхода и следующий шаг к нему. Ответ на запрос -
+проход по таблице следующих шагов, без поиска.
+
+Перекрытые выходы и участки коридоров (круг на этаже) пересчитываются
+инкрементально: при перекрытии заново считаются только узлы, чей путь шёл
+через перекрытое место, при снятии - только узлы, которым стало ближе.
+"""
+
+import heapq
+import math
+import threading
+
+
+class EvacuationPlanner:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.graph = None
+        self.graph_version = None
+        self.version = 0  # меняется при любом пересчёте - по нему кэшируются ответы
+        self.exits = set()  # point_id выходов
+        self.blocked_exits = set()
+        self.blocked_areas = []  # [{'floor', 'x', 'y', 'radius'}, ...]
+        self._blocked_nodes = set()
+        self.dist = {}  # узел -> расстояние до ближайшего выхода
+        self.next = {}  # узел -> следующий узел по пути к выходу (у выхода - None)
+        self.full_rebuilds = 0
+        self.incremental_updates = 0
+
+    # ---------- вспомогательное ----------
+    def _sources(self):
+        return {('p', exit_id) for exit_id in self.exits - self.blocked_exits
+                if ('p', exit_id) in self.graph.nodes and ('p', exit_id) not in self._blocked_nodes}
+
+    def _area_nodes(self, area):
+        floor, x, y, radius = area['floor'], area['x'], area['y'], area['radius']
+        return {node for node, (n_floor, nx, ny) in self.graph.nodes.items()
+                if n_floor == floor and math.hypot(nx - x, ny - y) <= radius}
+
+    def _propagate(self, heap):
+        """Дейкстра от узлов в куче; улучшает dist/next у всех, кому стало ближе"""
+        adjacency = self.graph.adjacency
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if cost > self.dist.get(node, math.inf):
+                continue
+            for neighbor, weight in adjacency.get(node, {}).items():
+                if neighbor in self._blocked_nodes:
+                    continue
+                new_cost = cost + weight
+                if new_cost < self.dist.get(neighbor, math.inf):
+                    self.dist[neighbor] = new_cost
+                    self.next[neighbor] = node
+                    heapq.heappush(heap, (new_cost, neighbor))
+
+    def _best_neighbor(self, node):
+        """(расстояние, сосед) - лучший выход через соседей узла"""
+        best = (math.inf, None)
+        for neighbor, weight in self.graph.adjacency.get(node, {}).items():
+            if neighbor in self._blocked_nodes:
+                continue
+            cost = self.dist.get(neighbor, math.inf) + weight
+            if cost < best[0]:
+                best = (cost, neighbor)
+        return best
+
+    def _rebuild(self):
+        self.dist = {}
+        self.next = {}
+        self._blocked_nodes = set()
+        for area in self.blocked_areas:
+            self._blocked_nodes |= self._area_nodes(area)
+        heap = []
+        for source in self._sources():
+            self.dist[source] = 0.0
+            self.next[source] = None
+            heap.append((0.0, source))
+        heapq.heapify(heap)
+        self._propagate(heap)
+        self.full_rebuilds += 1
+        self.version += 1
+
+    def _invalidate(self, removed):
+        """Узлы removed перестали быть доступны: пересчитываем всех, кто шёл через них"""
+        adjacency = self.graph.adjacency
+        affected = set(removed)
+        queue = list(removed)
+        while queue:
+            node = queue.pop()
+            for neighbor in adjacency.get(node, {}):
+                if neighbor not in affected and self.next.get(neighbor) == node:
+                    affected.add(neighbor)
+                    queue.append(neighbor)
+        for node in affected:
+            self.dist.pop(node, None)
+            self.next.pop(node, None)
+        sources = self._sources()
+        heap = []
+        for node in affected:
+            if node in self._blocked_nodes:
+                continue
+            if node in sources:
+                self.dist[node], self.next[node] = 0.0, None
+                heap.append((0.0, node))
+                continue
+            cost, neighbor = self._best_neighbor(node)
+            if neighbor is not None:
+                self.dist[node], self.next[node] = cost, neighbor
+                heap.append((cost, node))
+        heapq.heapify(heap)
+        self._propagate(heap)
+
+    def _reopen(self, nodes):
+        """Узлы nodes снова доступны: от них распространяем улучшения"""
+        sources = self._sources()
+        heap = []
+        for node in nodes:
+            if node in self._blocked_nodes:
+                continue
+            if node in sources:
+                self.dist[node], self.next[node] = 0.0, None
+            else:
+                cost, neighbor = self._best_neighbor(node)
+                if neighbor is None or cost >= self.dist.get(node, math.inf):
+                    continue
+                self.dist[node], self.next[node] = cost, neighbor
+            heap.append((self.dist[node], node))
+        heapq.heapify(heap)
+        self._propagate(heap)
+
+    # ---------- данные ----------
+    def sync(self, graph, exit_ids):
+        """Полный пересчёт, если изменился граф коридоров или список выходов"""
+        with self._lock:
+            exit_ids = set(exit_ids)
+            if graph is self.graph and graph.version == self.graph_version and exit_ids == self.exits:
+                return False
+            with graph._lock:
+                self.graph = graph
+                self.graph_version = graph.version
+                self.exits = exit_ids
+                self._rebuild()
+            return True
+
+    def set_blocked(self, exits=None, areas=None):
+        """
+        Новый набор перекрытий. exits - point_id выходов, areas - круги {'floor', 'x', 'y', 'radius'}.
+        Пересчитывается только то, что изменилось.
+        """
+        with self._lock:
+            exits = set(self.blocked_exits if exits is None else exits)
+            areas = list(self.blocked_areas if areas is None else areas)
+            if self.graph is None:
+                self.blocked_exits, self.blocked_areas = exits, areas
+                return
+            with self.graph._lock:
+                old_nodes = self._blocked_nodes
+                new_nodes = set()
+                for area in areas:
+                    new_nodes |= self._area_nodes(area)
+                newly_blocked = {('p', e) for e in exits - self.blocked_exits} | (new_nodes - old_nodes)
+                reopened = {('p', e) for e in self.blocked_exits - exits} | (old_nodes - new_nodes)
+                self.blocked_exits, self.blocked_areas = exits, areas
+                self._blocked_nodes = new_nodes
+                if newly_blocked:
+                    self._invalidate({n for n in newly_blocked if n in self.graph.nodes})
+                if reopened:
+                    self._reopen({n for n in reopened if n in self.graph.nodes})
+                self.incremental_updates += 1
+                self.version += 1
+
+    # ---------- запросы ----------
+    def route_from(self, point_id):
+        """(список узлов до выхода, длина) или (None, inf), если выход недоступен"""
+        with self._lock:
+            if self.graph is None:
+                return None, math.inf
+            start = ('p', point_id)
+            if start not in self.graph.nodes:
+                return None, math.inf
+            if start in self._blocked_nodes or start not in self.next:
+                # Сам стоит в перекрытом месте - выходим через лучшего соседа
+                cost, node = self._best_neighbor(start)
+                if node is None:
+                    return None, math.inf
+                nodes = [start, node]
+            else:
+                cost, node = self.dist[start], start
+                nodes = [start]
+            while self.next.get(node) is not None:
+                node = self.next[node]
+                nodes.append(node)
+            return nodes, cost
+
+    def nearest_exit(self, point_id):
+        nodes, cost = self.route_from(point_id)
+        if not nodes:
+            return None, math.inf
+        return nodes[-1][1], cost
+
+    def get_counters(self):
+        return {
+            'exits': len(self.exits),
+            'blocked_exits': len(self.blocked_exits),
+            'blocked_areas': len(self.blocked_areas),
+            'reachable_nodes': len(self.dist),
+            'full_rebuilds': self.full_rebuilds,
+            'incremental_updates': self.incremental_updates,
+            'version': self.version
+        }
@@ -7,8 +7,28 @@ import qrcode
 import os
 import json
 import socket
+import hashlib
+import argparse
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image, ImageDraw, ImageFont
 
+from storage import get_storage
+
+# Шрифты с кириллицей: Windows, Linux, macOS
+FONT_CANDIDATES = [
+    "C:\\Windows\\Fonts\\Arial.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/Library/Fonts/Arial.ttf",
+    "/System/Library/Fonts/Supplemental/Arial.ttf",
+]
+MANIFEST_FILE = 'manifest.json'  # в папке QR-кодов: отпечатки уже созданных картинок
+PDF_FILE = 'qr_codes_print.pdf'
+
+_fonts = None
+
 
 def get_local_ip():
     """Получение локального IP адреса компьютера"""
@@ -22,6 +42,22 @@ def get_local_ip():
         return "localhost"
 
 
+def load_fonts():
+    """Загрузка шрифтов один раз на процесс"""
+    global _fonts
+    if _fonts is None:
+        for font_path in FONT_CANDIDATES:
+            try:
+                _fonts = (ImageFont.truetype(font_path, 20), ImageFont.truetype(font_path, 16))
+                break
+            except OSError:
+                continue
+        else:
+            # Если шрифт не найден, используем стандартный
+            _fonts = (ImageFont.load_default(), ImageFont.load_default())
+    return _fonts
+
+
 def create_qr_with_label(data, filename, label_text, box_size=10):
     """Создание QR-кода с подписью"""
     # Создаем QR-код
@@ -40,16 +76,7 @@ def create_qr_with_label(data, filename, label_text, box_size=10):
     # Создаем изображение с подписью
     qr_width, qr_height = qr_img.size
 
-    # Пытаемся загрузить шрифт
-    try:
-        # Для Windows
-        font_path = "C:\\Windows\\Fonts\\Arial.ttf"
-        font = ImageFont.truetype(font_path, 20)
-        small_font = ImageFont.truetype(font_path, 16)
-    except:
-        # Если шрифт не найден, используем стандартный
-        font = ImageFont.load_default()
-        small_font = ImageFont.load_default()
+    font, small_font = load_fonts()
 
     # Создаем изображение с отступами для подписи
     padding = 20
@@ -80,8 +107,34 @@ def create_qr_with_label(data, filename, label_text, box_size=10):
     img.save(filename, quality=95)
 
 
-def generate_all_qr_codes():
-    """Генерация QR-кодов для всех точек"""
+def qr_digest(url, label, box_size):
+    """Отпечаток содержимого QR-кода и подписи - по нему пропускаем неизменившиеся точки"""
+    return hashlib.sha1(f"{url}|{label}|{box_size}".encode('utf-8')).hexdigest()
+
+
+def _render_task(task):
+    url, filename, label, box_size = task
+    create_qr_with_label(url, filename, label, box_size=box_size)
+    return filename
+
+
+def load_manifest(qr_folder):
+    try:
+        with open(os.path.join(qr_folder, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(qr_folder, manifest):
+    path = os.path.join(qr_folder, MANIFEST_FILE)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def generate_all_qr_codes(workers=None, force=False, pdf=True):
+    """Генерация QR-кодов для всех точек (параллельно, только изменившиеся)"""
 
     # Получаем IP компьютера
     local_ip = get_local_ip()
@@ -95,17 +148,17 @@ def generate_all_qr_codes():
     print(f"📱 Полный адрес: http://{local_ip}:{port}/viewer?point=ID_ТОЧКИ")
     print()
 
-    # Загружаем точки из файла
+    # Загружаем точки из хранилища (JSON или SQLite - см. STORAGE_BACKEND)
+    storage = get_storage()
     try:
-        with open('data/points.json', 'r', encoding='utf-8') as f:
-            points = json.load(f)
-        print(f"✅ Загружено {len(points)} точек из data/points.json")
-    except FileNotFoundError:
-        print("❌ Файл data/points.json не найден!")
+        points = storage.load_points()
+    except (json.JSONDecodeError, sqlite3.Error) as e:
+        print(f"❌ Ошибка чтения точек ({storage.name}): {e}")
         return
-    except json.JSONDecodeError:
-        print("❌ Ошибка в формате файла points.json")
+    if points is None:
+        print(f"❌ Точки не найдены в хранилище ({storage.name})!")
         return
+    print(f"✅ Загружено {len(points)} точек ({storage.name})")
 
     # Создаем папку для QR-кодов
     qr_folder = 'qr_codes'
@@ -113,59 +166,62 @@ def generate_all_qr_codes():
     print(f"📁 Папка {qr_folder} создана")
     print()
 
-    # Генерируем QR-код для каждой точки
-    success_count = 0
-
     # Сортируем точки по этажам и названиям
     points_by_floor = {1: [], 2: [], 3: []}
     for point in points:
         floor = point.get('floor', 1)
         if floor in points_by_floor:
             points_by_floor[floor].append(point)
-
-    for floor in [1, 2, 3]:
-        floor_points = points_by_floor[floor]
-        if not floor_points:
-            continue
-
-        print(f"\n🏢 {floor} ЭТАЖ:")
-        print("-" * 50)
-
-        # Сортируем по названию
+    for floor_points in points_by_floor.values():
         floor_points.sort(key=lambda x: x['name'])
 
-        for point in floor_points:
-            try:
-                point_id = point['id']
-                point_name = point['name']
-                point_category = point.get('category', '')
-                point_desc = point.get('description', '')
-
-                # URL для точки
-                url = f"http://{local_ip}:{port}/viewer?point={point_id}"
-
-                # Текст для подписи
-                label = f"{point_name}\n{point_desc}\n{floor} этаж"
-
-                # Имя файла
-                filename = f"{qr_folder}/{point_id}.png"
-
-                # Создаем QR-код с подписью
-                create_qr_with_label(url, filename, label, box_size=8)
-
-                print(f"✅ {point_name} -> {filename}")
-                success_count += 1
-
-            except Exception as e:
-                print(f"❌ Ошибка создания QR для {point.get('name', 'unknown')}: {e}")
+    # Собираем задания, пропуская точки, у которых не изменились ни URL, ни подпись
+    manifest = {} if force else load_manifest(qr_folder)
+    tasks = []
+    digests = {}
+    skipped = 0
+    for floor in [1, 2, 3]:
+        for point in points_by_floor[floor]:
+            point_id = point['id']
+            url = f"http://{local_ip}:{port}/viewer?point={point_id}"
+            label = f"{point['name']}\n{point.get('description', '')}\n{floor} этаж"
+            filename = f"{qr_folder}/{point_id}.png"
+            digest = qr_digest(url, label, 8)
+            if manifest.get(point_id) == digest and os.path.exists(filename):
+                skipped += 1
+                continue
+            tasks.append((url, filename, label, 8))
+            digests[filename] = (point_id, point['name'], digest)
+
+    # Рендер на пуле процессов; шрифты грузятся один раз в каждом процессе
+    success_count = 0
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers, initializer=load_fonts) as pool:
+            futures = [(task, pool.submit(_render_task, task)) for task in tasks]
+            for task, future in futures:
+                point_id, point_name, digest = digests[task[1]]
+                try:
+                    future.result()
+                    manifest[point_id] = digest
+                    print(f"✅ {point_name} -> {task[1]}")
+                    success_count += 1
+                except Exception as e:
+                    print(f"❌ Ошибка создания QR для {point_name}: {e}")
+
+    # Точки, которых больше нет, убираем из манифеста
+    known_ids = {p['id'] for p in points}
+    manifest = {k: v for k, v in manifest.items() if k in known_ids}
+    save_manifest(qr_folder, manifest)
 
     print("\n" + "=" * 70)
-    print(f"🎉 ВСЕГО СОЗДАНО: {success_count} QR-кодов")
+    print(f"🎉 ВСЕГО СОЗДАНО: {success_count} QR-кодов (без изменений: {skipped})")
     print(f"📁 Они сохранены в папке: {qr_folder}")
     print("=" * 70)
 
     # Создаем HTML страницу для печати
     create_printable_page(qr_folder, points_by_floor, local_ip, port)
+    if pdf:
+        create_printable_pdf(qr_folder, points_by_floor)
 
 
 def create_printable_page(qr_folder, points_by_floor, local_ip, port):
@@ -354,5 +410,44 @@ def create_printable_page(qr_folder, points_by_floor, local_ip, port):
     print(f"📱 Откройте его в браузере и нажмите Ctrl+P для печати")
 
 
+def create_printable_pdf(qr_folder, points_by_floor, columns=3, rows=4):
+    """Многостраничный PDF (A4, 150 dpi) со всеми QR-кодами для печати"""
+    page_width, page_height = 1240, 1754
+    margin = 60
+    header_height = 80
+    cell_width = (page_width - margin * 2) // columns
+    cell_height = (page_height - margin * 2 - header_height) // rows
+    font, _ = load_fonts()
+
+    pages = []
+    for floor in [1, 2, 3]:
+        floor_points = points_by_floor[floor]
+        for start in range(0, len(floor_points), columns * rows):
+            page = Image.new('RGB', (page_width, page_height), 'white')
+            draw = ImageDraw.Draw(page)
+            draw.text((margin, margin), f"{floor} ЭТАЖ", fill='black', font=font)
+            for i, point in enumerate(floor_points[start:start + columns * rows]):
+                try:
+                    with Image.open(f"{qr_folder}/{point['id']}.png") as qr_img:
+                        tile = qr_img.convert('RGB')
+                except OSError:
+                    continue
+                tile.thumbnail((cell_width - 20, cell_height - 20))
+                x = margin + (i % columns) * cell_width + (cell_width - tile.width) // 2
+                y = margin + header_height + (i // columns) * cell_height + (cell_height - tile.height) // 2
+                page.paste(tile, (x, y))
+            pages.append(page)
+
+    if not pages:
+        return
+    pages[0].save(PDF_FILE, save_all=True, append_images=pages[1:], resolution=150)
+    print(f"📄 Создан PDF для печати: {PDF_FILE} ({len(pages)} стр.)")
+
+
 if __name__ == '__main__':
-    generate_all_qr_codes()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Генерация QR-кодов для всех точек навигации')
+    parser.add_argument('--workers', type=int, default=None, help='число процессов (по умолчанию - по числу ядер)')
+    parser.add_argument('--force', action='store_true', help='пересоздать все QR-коды, даже неизменившиеся')
+    parser.add_argument('--no-pdf', action='store_true', help='не создавать PDF для печати')
+    args = parser.parse_args()
+    generate_all_qr_codes(workers=args.workers, force=args.force, pdf=not args.no_pdf)
\ No newline at end of file
@@ -0,0 +1,49 @@
+"""
+Продакшен-запуск: gunicorn -c gunicorn.conf.py app:app
+Несколько процессов-воркеров, в каждом - gevent: запросы, которые ждут диск или
+сеть (SSE-тревоги, отдача JSON и тайлов), обслуживаются гринлетами, а рендер QR,
+сжатие и запись JSON уходят в ограниченный пул потоков (blocking.py).
+
+Настройка через переменные окружения:
+    PORT                 порт (Render задаёт сам), по умолчанию 8080
+    WEB_CONCURRENCY      число воркеров, по умолчанию 2 * ядра + 1, но не больше 4
+    WORKER_CLASS         gevent (по умолчанию) или gthread / sync без gevent
+    WORKER_CONNECTIONS   одновременных соединений на воркер gevent, по умолчанию 2000
+    WORKER_THREADS       потоков на воркер gthread, по умолчанию 8
+    BLOCKING_POOL_SIZE   потоков пула блокирующей работы на воркер, по умолчанию 4
+    WORKER_TIMEOUT       секунд до перезапуска зависшего воркера, по умолчанию 60
+"""
+
+import multiprocessing
+import os
+
+# Отладчик Flask и подробный лог - только в python app.py
+os.environ.setdefault('FLASK_DEBUG', '0')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+worker_class = os.environ.get('WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 2000))
+threads = int(os.environ.get('WORKER_THREADS', 8))
+timeout = int(os.environ.get('WORKER_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# Приложение не загружается в мастере до fork: gevent должен подменить threading
+# раньше, чем app.py создаст блокировки и очереди
+preload_app = False
+
+# Плавный перезапуск воркеров против утечек памяти (PIL, кэши QR)
+max_requests = int(os.environ.get('MAX_REQUESTS', 5000))
+max_requests_jitter = 500
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+
+def post_worker_init(worker):
+    # Граф коридоров строится до первого запроса, а не на первом сканировании QR
+    from app import get_corridor_graph
+    graph = get_corridor_graph()
+    worker.log.info(f"🧭 Воркер {worker.pid}: граф коридоров готов ({len(graph.nodes)} узлов)")
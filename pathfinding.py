@@ -0,0 +1,463 @@
+"""
+Поиск маршрутов по графу коридоров
+Граф строится из промежуточных точек сохранённых маршрутов (data/routes.json),
+рёбра проверяются на пересечение со стенами из data/map_data.json,
+переход между этажами - через точки категории stair
+"""
+
+import hashlib
+import heapq
+import json
+import math
+import os
+import sys
+import threading
+from array import array
+
+from shared_state import FileLock
+from spatial_index import WallIndex
+
+SNAP_DISTANCE = 20  # точки маршрутов ближе этого сливаются в один узел
+LINK_RADIUS = 150  # узлы разных маршрутов соединяются, если между ними нет стены
+POINT_LINK_COUNT = 3  # к скольким ближайшим узлам коридора привязывается точка навигации
+POINT_LINK_RADIUS = 400
+STAIR_COST = 200  # надбавка за переход на соседний этаж (в единицах карты)
+STAIR_MATCH_RADIUS = 150  # лестницы соседних этажей считаются одной, если они ближе
+
+
+class CorridorGraph:
+    """
+    Граф коридоров с инкрементальным обновлением.
+    Узлы: ('w', этаж, gx, gy) - точки маршрутов, привязанные к сетке SNAP_DISTANCE;
+          ('p', point_id) - точки навигации.
+    У каждого ребра есть счётчик источников (маршрут, связь по видимости, привязка
+    точки), поэтому изменение одного маршрута или точки не требует полной перестройки.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.nodes = {}  # узел -> (этаж, x, y)
+        self.adjacency = {}  # узел -> {сосед: длина}
+        self.walls = {}
+        self.wall_index = WallIndex()
+        self.version = 0
+        self._node_refs = {}
+        self._edge_refs = {}
+        self._buckets = {}
+        self._routes = {}  # route_key -> кортеж точек маршрута
+        self._route_edges = {}  # route_key -> рёбра маршрута
+        self._points = {}  # point_id -> (этаж, x, y, название, категория)
+        self._point_edges = {}  # point_id -> рёбра привязки
+        self._cache = {}
+        self.next_hop = None  # NextHopTable, если предрасчёт актуален
+
+    # ---------- примитивы ----------
+    @staticmethod
+    def _edge_key(a, b):
+        return (a, b) if a <= b else (b, a)
+
+    def _bucket_of(self, floor, x, y):
+        return floor, math.floor(x / LINK_RADIUS), math.floor(y / LINK_RADIUS)
+
+    def _nearby_nodes(self, floor, x, y, radius):
+        """Узлы коридора того же этажа в радиусе radius (через сетку корзин)"""
+        _, bx, by = self._bucket_of(floor, x, y)
+        span = max(1, math.ceil(radius / LINK_RADIUS))
+        found = []
+        for i in range(bx - span, bx + span + 1):
+            for j in range(by - span, by + span + 1):
+                for node in self._buckets.get((floor, i, j), ()):
+                    _, nx, ny = self.nodes[node]
+                    dist = math.hypot(nx - x, ny - y)
+                    if dist <= radius:
+                        found.append((dist, node))
+        found.sort()
+        return found
+
+    def is_clear(self, floor, a, b) -> bool:
+        """Нет ли стены между точками a и b на этаже floor"""
+        return not self.wall_index.intersects(floor, a, b)
+
+    def _add_edge(self, a, b, weight):
+        if a == b:
+            return None
+        key = self._edge_key(a, b)
+        self._edge_refs[key] = self._edge_refs.get(key, 0) + 1
+        self.adjacency[a][b] = weight
+        self.adjacency[b][a] = weight
+        return key
+
+    def _release_edge(self, key):
+        refs = self._edge_refs.get(key, 0) - 1
+        if refs > 0:
+            self._edge_refs[key] = refs
+            return
+        self._edge_refs.pop(key, None)
+        a, b = key
+        self.adjacency.get(a, {}).pop(b, None)
+        self.adjacency.get(b, {}).pop(a, None)
+
+    def _acquire_waypoint(self, floor, x, y):
+        node = ('w', floor, round(x / SNAP_DISTANCE), round(y / SNAP_DISTANCE))
+        if node in self._node_refs:
+            self._node_refs[node] += 1
+            return node
+        self._node_refs[node] = 1
+        self.nodes[node] = (floor, x, y)
+        self.adjacency[node] = {}
+        # Связываем с соседними узлами других маршрутов, если их видно
+        for dist, other in self._nearby_nodes(floor, x, y, LINK_RADIUS):
+            if self.is_clear(floor, (x, y), self.nodes[other][1:]):
+                self._add_edge(node, other, dist)
+        self._buckets.setdefault(self._bucket_of(floor, x, y), set()).add(node)
+        return node
+
+    def _release_waypoint(self, node):
+        refs = self._node_refs[node] - 1
+        if refs > 0:
+            self._node_refs[node] = refs
+            return
+        del self._node_refs[node]
+        floor, x, y = self.nodes.pop(node)
+        self._buckets[self._bucket_of(floor, x, y)].discard(node)
+        for other in list(self.adjacency.pop(node, {})):
+            self.adjacency[other].pop(node, None)
+            self._edge_refs.pop(self._edge_key(node, other), None)
+
+    # ---------- маршруты ----------
+    def _add_route(self, route_key, route_points):
+        nodes = []
+        for p in route_points:
+            node = self._acquire_waypoint(p[0], p[1], p[2])
+            nodes.append(node)
+        edges = []
+        for a, b, pa, pb in zip(nodes, nodes[1:], route_points, route_points[1:]):
+            if pa[0] != pb[0]:
+                continue  # смена этажа описывается лестницами, а не отрезком
+            if self.is_clear(pa[0], pa[1:], pb[1:]):
+                # Длина - по координатам узлов, иначе эвристика A* может её превысить
+                (_, ax, ay), (_, bx, by) = self.nodes[a], self.nodes[b]
+                edge = self._add_edge(a, b, math.hypot(bx - ax, by - ay))
+                if edge:
+                    edges.append(edge)
+        self._routes[route_key] = route_points
+        self._route_edges[route_key] = (nodes, edges)
+
+    def _remove_route(self, route_key):
+        nodes, edges = self._route_edges.pop(route_key)
+        del self._routes[route_key]
+        for edge in edges:
+            self._release_edge(edge)
+        for node in nodes:
+            self._release_waypoint(node)
+
+    # ---------- точки навигации ----------
+    def _anchor_point(self, point_id):
+        for edge in self._point_edges.pop(point_id, []):
+            self._release_edge(edge)
+        floor, x, y, _, category = self._points[point_id]
+        node = ('p', point_id)
+        edges = []
+        for dist, other in self._nearby_nodes(floor, x, y, POINT_LINK_RADIUS):
+            if len(edges) >= POINT_LINK_COUNT:
+                break
+            # Совпадающую с точкой вершину маршрута привязываем без проверки стен
+            if dist <= SNAP_DISTANCE or self.is_clear(floor, (x, y), self.nodes[other][1:]):
+                edges.append(self._add_edge(node, other, dist))
+        if category == 'stair':
+            for other_id, (o_floor, ox, oy, _, o_category) in self._points.items():
+                if o_category != 'stair' or abs(o_floor - floor) != 1:
+                    continue
+                dist = math.hypot(ox - x, oy - y)
+                if dist <= STAIR_MATCH_RADIUS:
+                    edges.append(self._add_edge(node, ('p', other_id), dist + STAIR_COST))
+        self._point_edges[point_id] = [e for e in edges if e]
+
+    def _set_point(self, point_id, value):
+        node = ('p', point_id)
+        self._points[point_id] = value
+        self.nodes[node] = value[:3]
+        self.adjacency.setdefault(node, {})
+
+    def _remove_point(self, point_id):
+        for edge in self._point_edges.pop(point_id, []):
+            self._release_edge(edge)
+        node = ('p', point_id)
+        del self._points[point_id]
+        self.nodes.pop(node, None)
+        for other in list(self.adjacency.pop(node, {})):
+            self.adjacency[other].pop(node, None)
+            self._edge_refs.pop(self._edge_key(node, other), None)
+
+    # ---------- синхронизация с данными ----------
+    @staticmethod
+    def _route_signature(route):
+        return tuple((p.get('floor', 1), p['x'], p['y']) for p in route.get('points', []))
+
+    def sync(self, points, routes, walls):
+        """
+        Приводит граф к текущим точкам/маршрутам/стенам, трогая только изменившееся.
+        points - список NavigationPoint, routes - dict из routes.json, walls - walls_from_map()
+        """
+        with self._lock:
+            changed = False
+            if walls != self.walls:
+                # Стены влияют на все рёбра - перестраиваем целиком
+                version = self.version
+                self._reset()
+                self.version = version
+                self.walls = walls
+                self.wall_index = WallIndex(walls)
+                changed = True
+
+            wanted_routes = {key: self._route_signature(route) for key, route in routes.items()}
+            for key in [k for k in self._routes if wanted_routes.get(k) != self._routes[k]]:
+                self._remove_route(key)
+                changed = True
+            for key, signature in wanted_routes.items():
+                if key not in self._routes:
+                    self._add_route(key, signature)
+                    changed = True
+
+            wanted_points = {p.id: (p.floor, p.x, p.y, p.name, p.category) for p in points}
+            for point_id in [pid for pid in self._points if pid not in wanted_points]:
+                self._remove_point(point_id)
+                changed = True
+            for point_id, value in wanted_points.items():
+                if self._points.get(point_id) != value:
+                    self._set_point(point_id, value)
+                    changed = True
+
+            if changed:
+                # Привязка точек зависит от узлов коридора и соседних лестниц
+                for point_id in self._points:
+                    self._anchor_point(point_id)
+                self._cache.clear()
+                self.next_hop = None
+                self.version += 1
+            return changed
+
+    def fingerprint(self) -> str:
+        """Отпечаток исходных данных графа - по нему проверяется сохранённая таблица"""
+        with self._lock:
+            digest = hashlib.sha1()
+            digest.update(repr((SNAP_DISTANCE, LINK_RADIUS, POINT_LINK_COUNT, POINT_LINK_RADIUS,
+                                STAIR_COST, STAIR_MATCH_RADIUS)).encode('utf-8'))
+            digest.update(repr(sorted(self._points.items())).encode('utf-8'))
+            digest.update(repr(sorted(self._routes.items())).encode('utf-8'))
+            digest.update(repr(sorted(self.walls.items())).encode('utf-8'))
+            return digest.hexdigest()
+
+    def attach_table(self, table):
+        with self._lock:
+            self.next_hop = table
+            self._cache.clear()
+
+    # ---------- поиск ----------
+    def _search(self, start, goal):
+        """A*: эвристика - расстояние по плоскости, она не превышает длину любого ребра"""
+        gx, gy = self.nodes[goal][1:]
+        best = {start: 0.0}
+        came_from = {}
+        heap = [(0.0, 0.0, start)]
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == goal:
+                path = [node]
+                while node in came_from:
+                    node = came_from[node]
+                    path.append(node)
+                return list(reversed(path)), cost
+            if cost > best.get(node, math.inf):
+                continue
+            for neighbor, weight in self.adjacency.get(node, {}).items():
+                new_cost = cost + weight
+                if new_cost < best.get(neighbor, math.inf):
+                    best[neighbor] = new_cost
+                    came_from[neighbor] = node
+                    nx, ny = self.nodes[neighbor][1:]
+                    heapq.heappush(heap, (new_cost + math.hypot(gx - nx, gy - ny), new_cost, neighbor))
+        return None, math.inf
+
+    def to_waypoints(self, nodes):
+        path = []
+        for node in nodes:
+            floor, x, y = self.nodes[node]
+            if node[0] == 'p':
+                name = self._points[node[1]][3]
+                waypoint = {'floor': floor, 'pointId': node[1], 'pointName': name, 'x': x, 'y': y}
+            else:
+                waypoint = {'floor': floor, 'pointId': None, 'pointName': None, 'x': x, 'y': y}
+            if path and (path[-1]['x'], path[-1]['y'], path[-1]['floor']) == (x, y, floor):
+                continue
+            path.append(waypoint)
+        return path
+
+    def find_path(self, start_id, end_id):
+        """Список точек маршрута в формате routes.json или None, если пути нет"""
+        with self._lock:
+            key = (start_id, end_id)
+            if key in self._cache:
+                return self._cache[key]
+            start, goal = ('p', start_id), ('p', end_id)
+            if start not in self.nodes or goal not in self.nodes:
+                return None
+            if self.next_hop is not None:
+                # Предрасчитанная таблица: O(длина пути), без поиска
+                nodes = self.next_hop.path_nodes(start, goal)
+                return self.to_waypoints(nodes) if nodes else None
+            nodes, _ = self._search(start, goal)
+            path = self.to_waypoints(nodes) if nodes else None
+            self._cache[key] = path
+            return path
+
+    def get_counters(self):
+        return {
+            'nodes': len(self.nodes),
+            'edges': len(self._edge_refs),
+            'cached_paths': len(self._cache),
+            'next_hop_table': self.next_hop is not None,
+            'version': self.version
+        }
+
+
+NO_HOP = 0xFFFFFFFF
+
+
+class NextHopTable:
+    """
+    Кратчайшие пути между всеми парами узлов графа в виде матрицы следующего шага.
+    next_hop[i * n + j] - порядковый номер узла, в который надо идти из i, чтобы попасть в j;
+    distances[i * n + j] - длина кратчайшего пути. Обе матрицы - плоские array.
+    """
+
+    def __init__(self, nodes, next_hop, distances, fingerprint):
+        self.nodes = nodes
+        self.index = {node: i for i, node in enumerate(nodes)}
+        self.next_hop = next_hop
+        self.distances = distances
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, graph):
+        """Дейкстра от каждого узла; дерево кратчайших путей к j даёт столбец j"""
+        with graph._lock:
+            nodes = sorted(graph.nodes)
+            index = {node: i for i, node in enumerate(nodes)}
+            adjacency = [[(index[nb], w) for nb, w in graph.adjacency[node].items()] for node in nodes]
+            fingerprint = graph.fingerprint()
+        n = len(nodes)
+        next_hop = array('I', [NO_HOP]) * (n * n)
+        distances = array('f', [math.inf]) * (n * n)
+        for target in range(n):
+            dist = [math.inf] * n
+            hop = [NO_HOP] * n
+            dist[target] = 0.0
+            hop[target] = target
+            heap = [(0.0, target)]
+            while heap:
+                cost, u = heapq.heappop(heap)
+                if cost > dist[u]:
+                    continue
+                for v, weight in adjacency[u]:
+                    new_cost = cost + weight
+                    if new_cost < dist[v]:
+                        dist[v] = new_cost
+                        hop[v] = u  # из v к target идём через u
+                        heapq.heappush(heap, (new_cost, v))
+            for i in range(n):
+                next_hop[i * n + target] = hop[i]
+                distances[i * n + target] = dist[i]
+        return cls(nodes, next_hop, distances, fingerprint)
+
+    def path_nodes(self, start, goal):
+        i, j = self.index.get(start), self.index.get(goal)
+        if i is None or j is None:
+            return None
+        n = len(self.nodes)
+        path = [self.nodes[i]]
+        while i != j:
+            i = self.next_hop[i * n + j]
+            if i == NO_HOP:
+                return None
+            path.append(self.nodes[i])
+        return path
+
+    def distance(self, start, goal):
+        i, j = self.index.get(start), self.index.get(goal)
+        if i is None or j is None:
+            return math.inf
+        return self.distances[i * len(self.nodes) + j]
+
+    def save(self, path):
+        meta = {
+            'fingerprint': self.fingerprint,
+            'byteorder': sys.byteorder,
+            'nodes': [list(node) for node in self.nodes]
+        }
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Своё имя временного файла у каждого процесса: воркеры могут сохранять одновременно
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(meta, ensure_ascii=False).encode('utf-8') + b'\n')
+            f.write(self.next_hop.tobytes())
+            f.write(self.distances.tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        """Таблица из файла или None, если её нет или она построена по другим данным"""
+        try:
+            with open(path, 'rb') as f:
+                meta = json.loads(f.readline())
+                if meta.get('fingerprint') != fingerprint or meta.get('byteorder') != sys.byteorder:
+                    return None
+                nodes = [tuple(node) for node in meta['nodes']]
+                size = len(nodes) * len(nodes)
+                next_hop = array('I')
+                next_hop.frombytes(f.read(size * next_hop.itemsize))
+                distances = array('f')
+                distances.frombytes(f.read(size * distances.itemsize))
+        except (OSError, ValueError, KeyError):
+            return None
+        if len(next_hop) != size or len(distances) != size:
+            return None
+        return cls(nodes, next_hop, distances, fingerprint)
+
+
+def _load_matching(path, fingerprint, graph):
+    table = NextHopTable.load(path, fingerprint)
+    if table is None or any(node not in graph.nodes for node in table.nodes):
+        return None
+    return table
+
+
+def ensure_next_hop_table(graph, path):
+    """Подключает к графу таблицу из файла, а если она устарела - строит и сохраняет новую"""
+    if graph.next_hop is not None:
+        return graph.next_hop
+    fingerprint = graph.fingerprint()
+    table = _load_matching(path, fingerprint, graph)
+    if table is None:
+        # При холодном старте таблицу строит один воркер, остальные ждут и читают готовую
+        with FileLock(f"{path}.lock"):
+            table = _load_matching(path, fingerprint, graph)
+            if table is None:
+                table = NextHopTable.build(graph)
+                try:
+                    table.save(path)
+                except OSError:
+                    pass
+    graph.attach_table(table)
+    return table
+
+
+if __name__ == '__main__':
+    # Предрасчёт таблицы заранее, чтобы сервер не считал её при первом запросе
+    import app
+
+    graph = app.get_corridor_graph()
+    print(f"✅ Таблица следующего шага: {len(graph.next_hop.nodes)} узлов -> {app.NEXT_HOP_FILE}")
@@ -0,0 +1,195 @@
+"""
+Упрощение и компактная запись маршрутов
+Упрощение: подряд идущие дубли и точки, лежащие на прямой (Дуглас-Пекер с допуском),
+выбрасываются; точки с pointId и смены этажа сохраняются всегда.
+Компактная форма маршрута:
+    {'name': ..., 'type': ...,
+     'polyline': 'координаты x, y: разности + varint, как в Google Encoded Polyline',
+     'floors': [[этаж, сколько точек подряд], ...],
+     'anchors': [[номер точки, pointId], ...]}
+Названия точек не повторяются - восстанавливаются по pointId (expand_route).
+
+Упростить маршруты прямо в хранилище:
+    python route_codec.py simplify [--tolerance 2]
+"""
+
+import argparse
+import json
+import math
+
+DEFAULT_TOLERANCE = 2.0  # в единицах карты (1 единица ~ 0.5 м)
+PRECISION = 1  # множитель координат перед округлением: 1 - целые единицы карты
+
+
+# ---------- упрощение ----------
+def _point_line_distance(p, a, b):
+    dx, dy = b['x'] - a['x'], b['y'] - a['y']
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(p['x'] - a['x'], p['y'] - a['y'])
+    t = max(0.0, min(1.0, ((p['x'] - a['x']) * dx + (p['y'] - a['y']) * dy) / length_sq))
+    return math.hypot(p['x'] - (a['x'] + t * dx), p['y'] - (a['y'] + t * dy))
+
+
+def _douglas_peucker(points, first, last, tolerance, keep):
+    """Отмечает в keep точки участка [first, last], которые нельзя выбросить"""
+    stack = [(first, last)]
+    while stack:
+        first, last = stack.pop()
+        best, best_index = -1.0, None
+        for i in range(first + 1, last):
+            distance = _point_line_distance(points[i], points[first], points[last])
+            if distance > best:
+                best, best_index = distance, i
+        if best_index is not None and best > tolerance:
+            keep[best_index] = True
+            stack.append((first, best_index))
+            stack.append((best_index, last))
+
+
+def _is_anchor(points, i):
+    point = points[i]
+    if point.get('pointId') or i == 0 or i == len(points) - 1:
+        return True
+    floor = point.get('floor', 1)
+    return points[i - 1].get('floor', 1) != floor or points[i + 1].get('floor', 1) != floor
+
+
+def simplify_points(points, tolerance=DEFAULT_TOLERANCE):
+    """Упрощённая копия списка точек маршрута"""
+    # Подряд идущие дубли: из двух одинаковых оставляем привязанную к точке навигации
+    unique = []
+    for point in points:
+        if unique and (point['x'], point['y'], point.get('floor', 1)) == \
+                (unique[-1]['x'], unique[-1]['y'], unique[-1].get('floor', 1)):
+            if point.get('pointId') and not unique[-1].get('pointId'):
+                unique[-1] = point
+            continue
+        unique.append(point)
+    if len(unique) < 3:
+        return [dict(p) for p in unique]
+
+    keep = [_is_anchor(unique, i) for i in range(len(unique))]
+    anchors = [i for i, flag in enumerate(keep) if flag]
+    for first, last in zip(anchors, anchors[1:]):
+        # Отрезок между этажами не упрощаем
+        if unique[first].get('floor', 1) == unique[last].get('floor', 1):
+            _douglas_peucker(unique, first, last, tolerance, keep)
+    return [dict(p) for p, flag in zip(unique, keep) if flag]
+
+
+def simplify_route(route, tolerance=DEFAULT_TOLERANCE):
+    simplified = dict(route)
+    simplified['points'] = simplify_points(route.get('points') or [], tolerance)
+    return simplified
+
+
+# ---------- кодирование координат ----------
+def _encode_value(value, chunks):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+
+
+def encode_polyline(coords, precision=PRECISION):
+    """[(x, y), ...] -> строка: разности соседних точек, zigzag и 5-битные группы"""
+    chunks = []
+    prev_x = prev_y = 0
+    for x, y in coords:
+        ix, iy = round(x * precision), round(y * precision)
+        _encode_value(ix - prev_x, chunks)
+        _encode_value(iy - prev_y, chunks)
+        prev_x, prev_y = ix, iy
+    return ''.join(chunks)
+
+
+def decode_polyline(encoded, precision=PRECISION):
+    coords = []
+    values = []
+    value = shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    x = y = 0
+    for dx, dy in zip(values[::2], values[1::2]):
+        x += dx
+        y += dy
+        coords.append((x, y) if precision == 1 else (x / precision, y / precision))
+    return coords
+
+
+# ---------- компактная форма маршрута ----------
+def compact_points(points):
+    floors = []
+    for point in points:
+        floor = point.get('floor', 1)
+        if floors and floors[-1][0] == floor:
+            floors[-1][1] += 1
+        else:
+            floors.append([floor, 1])
+    return {
+        'polyline': encode_polyline((p['x'], p['y']) for p in points),
+        'floors': floors,
+        'anchors': [[i, p['pointId']] for i, p in enumerate(points) if p.get('pointId')]
+    }
+
+
+def compact_route(route, tolerance=DEFAULT_TOLERANCE):
+    """Маршрут в компактной форме; tolerance=None - без упрощения"""
+    points = route.get('points') or []
+    if tolerance is not None:
+        points = simplify_points(points, tolerance)
+    compact = {key: value for key, value in route.items() if key != 'points'}
+    compact.update(compact_points(points))
+    return compact
+
+
+def expand_route(compact, point_names=None):
+    """Обратно в формат routes.json; point_names - {pointId: название}"""
+    point_names = point_names or {}
+    floors = [floor for floor, count in compact.get('floors', []) for _ in range(count)]
+    anchors = dict((index, point_id) for index, point_id in compact.get('anchors', []))
+    points = []
+    for i, (x, y) in enumerate(decode_polyline(compact.get('polyline', ''))):
+        point_id = anchors.get(i)
+        points.append({
+            'floor': floors[i] if i < len(floors) else 1,
+            'pointId': point_id,
+            'pointName': point_names.get(point_id) if point_id else None,
+            'x': x,
+            'y': y
+        })
+    route = {key: value for key, value in compact.items() if key not in ('polyline', 'floors', 'anchors')}
+    route['points'] = points
+    return route
+
+
+if __name__ == '__main__':
+    from storage import get_storage
+
+    parser = argparse.ArgumentParser(description='Упрощение маршрутов в хранилище')
+    parser.add_argument('command', choices=['simplify', 'stats'])
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='допуск в единицах карты')
+    args = parser.parse_args()
+
+    storage = get_storage()
+    routes = storage.load_routes()
+    verbose_size = len(json.dumps(routes, ensure_ascii=False))
+    compact_size = len(json.dumps({k: compact_route(r, args.tolerance) for k, r in routes.items()},
+                                  ensure_ascii=False))
+    before = sum(len(r.get('points') or []) for r in routes.values())
+    simplified = {key: simplify_route(route, args.tolerance) for key, route in routes.items()}
+    after = sum(len(r['points']) for r in simplified.values())
+    print(f"📊 Маршрутов: {len(routes)}, точек: {before} -> {after} после упрощения")
+    print(f"📦 JSON: {verbose_size // 1024} КБ, компактная форма: {compact_size // 1024} КБ")
+    if args.command == 'simplify':
+        changed = {key: route for key, route in simplified.items() if route != routes[key]}
+        if changed:
+            storage.patch_routes(changed)
+        print(f"✅ Упрощено маршрутов: {len(changed)}")
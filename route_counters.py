@@ -0,0 +1,314 @@
+"""
+Счётчики популярности маршрутов в файле фиксированной структуры (mmap)
+Вместо словаря {"start_end": число}, который целиком сериализуется в
+statistics.json, - матрица счётчиков [начало, конец], где строка и столбец -
+порядковый номер точки в таблице id. Файл отображён в память (mmap) всеми
+воркерами сразу; прибавление - запись на месте под FileLock, без чтения и
+перезаписи файла. Размер файла зависит только от числа точек, а не от истории.
+
+Раскладка файла (little-endian):
+    заголовок  HEADER_SIZE байт: b'RCNT', версия, ёмкость N, дней D, длина id
+    id точек   N * ID_SIZE байт, utf-8 с нулями в конце
+    всего      N * N uint64
+    дни        D int64 - номер дня (date.toordinal) в каждой ячейке кольца
+    по дням    D * N * N uint32 - кольцо счётчиков за последние D дней
+
+Номер точки не освобождается сам: таблица id помнит каждую точку, по которой
+была навигация. Когда она заполнена, сначала выбрасываются точки, которых
+больше нет (live_ids - id существующих точек), вместе с их счётчиками, и только
+если места не хватило, файл пересоздаётся с удвоенной ёмкостью. Размер растёт
+как N * N * (8 + 4 * D) байт: 64 точки - ~0.5 МБ, 256 - ~8.5 МБ, 1024 - ~136 МБ,
+поэтому каждое удвоение пишется в лог предупреждением.
+В обоих случаях другие воркеры замечают новый файл по смене inode и открывают его заново.
+
+Посмотреть счётчики:
+    python route_counters.py [--days 7] [--limit 20]
+"""
+
+import argparse
+import mmap
+import os
+import struct
+from datetime import date
+
+import numpy as np
+
+from shared_state import FileLock
+
+MAGIC = b'RCNT'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sIIII')
+HEADER_SIZE = 64
+ID_SIZE = 64
+DEFAULT_CAPACITY = 64  # точек; растёт удвоением
+DAYS = 32  # длина кольца по дням
+
+COUNTERS_FILE = 'data/route_counters.bin'
+
+
+def _layout(capacity, days):
+    """Смещения областей файла и его полный размер"""
+    ids = HEADER_SIZE
+    totals = ids + capacity * ID_SIZE
+    stamps = totals + capacity * capacity * 8
+    daily = stamps + days * 8
+    size = daily + days * capacity * capacity * 4
+    return ids, totals, stamps, daily, size
+
+
+class RouteCounters:
+
+    def __init__(self, path=COUNTERS_FILE, capacity=DEFAULT_CAPACITY, days=DAYS):
+        self.path = path
+        self.initial_capacity = capacity
+        self.days = days
+        self.capacity = 0
+        self.grows = 0
+        self.compactions = 0
+        self.live_ids = None  # функция -> множество id существующих точек (для сжатия таблицы)
+        self._lock = FileLock(f"{path}.lock")
+        self._mmap = None
+        self._file = None
+        self._inode = None
+        self._pid = None
+        self._ids = {}  # id точки -> порядковый номер
+        self.totals = None
+        self.stamps = None
+        self.daily = None
+
+    # ---------- файл ----------
+    def _create(self, path, capacity, days):
+        _, _, _, _, size = _layout(capacity, days)
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, capacity, days, ID_SIZE).ljust(HEADER_SIZE, b'\0'))
+            f.truncate(size)  # остальное - нули, на диске файл разреженный
+
+    def _map(self):
+        """Открывает файл заново, если его ещё нет в этом процессе или его пересоздали"""
+        try:
+            inode = os.stat(self.path).st_ino
+        except OSError:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._create(self.path, self.initial_capacity, self.days)
+            inode = os.stat(self.path).st_ino
+        if self._mmap is not None and inode == self._inode and self._pid == os.getpid():
+            return
+        self._close()
+        self._file = open(self.path, 'r+b')
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        magic, version, capacity, days, id_size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or id_size != ID_SIZE:
+            raise ValueError(f"{self.path}: неизвестный формат файла счётчиков")
+        ids, totals, stamps, daily, _ = _layout(capacity, days)
+        self.capacity, self.days = capacity, days
+        self.totals = np.frombuffer(self._mmap, np.uint64, capacity * capacity, totals).reshape(capacity, capacity)
+        self.stamps = np.frombuffer(self._mmap, np.int64, days, stamps)
+        self.daily = np.frombuffer(self._mmap, np.uint32, days * capacity * capacity, daily) \
+            .reshape(days, capacity, capacity)
+        self._inode, self._pid = inode, os.getpid()
+        self._read_ids()
+
+    def _close(self):
+        # Представления NumPy держат буфер mmap - сначала отпускаем их
+        self.totals = self.stamps = self.daily = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # кто-то ещё держит ссылку на массив - закроется сборщиком мусора
+            self._file.close()
+        self._mmap = self._file = None
+
+    def _read_ids(self):
+        self._ids = {}
+        for ordinal in range(self.capacity):
+            start = HEADER_SIZE + ordinal * ID_SIZE
+            raw = self._mmap[start:start + ID_SIZE].rstrip(b'\0')
+            if not raw:
+                break
+            self._ids[raw.decode('utf-8')] = ordinal
+
+    def _rebuild(self, capacity, ordinals):
+        """Новый файл ёмкостью capacity с точками ordinals (старые номера, по порядку); их счётчики копируются"""
+        keep = np.array(ordinals, dtype=np.intp)
+        count = len(keep)
+        tmp_path = f"{self.path}.tmp"
+        self._create(tmp_path, capacity, self.days)
+        with open(tmp_path, 'r+b') as f:
+            new = mmap.mmap(f.fileno(), 0)
+            ids, totals, stamps, daily, _ = _layout(capacity, self.days)
+            for new_ordinal, ordinal in enumerate(ordinals):
+                source, target = HEADER_SIZE + ordinal * ID_SIZE, ids + new_ordinal * ID_SIZE
+                new[target:target + ID_SIZE] = self._mmap[source:source + ID_SIZE]
+            new_totals = np.frombuffer(new, np.uint64, capacity * capacity, totals).reshape(capacity, capacity)
+            new_totals[:count, :count] = self.totals[np.ix_(keep, keep)]
+            np.frombuffer(new, np.int64, self.days, stamps)[:] = self.stamps
+            new_daily = np.frombuffer(new, np.uint32, self.days * capacity * capacity, daily) \
+                .reshape(self.days, capacity, capacity)
+            new_daily[:, :count, :count] = self.daily[:, keep][:, :, keep]
+            del new_totals, new_daily
+            new.flush()
+            new.close()
+        os.replace(tmp_path, self.path)
+        self._map()
+
+    def _make_room(self):
+        """Таблица id заполнена: освобождаем номера удалённых точек, не хватило - удваиваем ёмкость"""
+        if self.live_ids is not None:
+            live = set(self.live_ids())
+            names = self._names()
+            keep = [ordinal for ordinal in range(len(self._ids)) if names[ordinal] in live]
+            if len(keep) < len(self._ids):
+                dropped = len(self._ids) - len(keep)
+                self._rebuild(self.capacity, keep)
+                self.compactions += 1
+                print(f"📊 Счётчики маршрутов: убраны удалённые точки ({dropped})")
+                if len(self._ids) < self.capacity:
+                    return
+        self._rebuild(self.capacity * 2, list(range(len(self._ids))))
+        self.grows += 1
+        size = _layout(self.capacity, self.days)[4]
+        print(f"⚠️ Счётчики маршрутов: ёмкость увеличена до {self.capacity} точек, "
+              f"файл {size // (1024 * 1024)} МБ")
+
+    def _ordinal(self, point_id):
+        """Номер точки; новая точка записывается в таблицу id (вызывать под блокировкой)"""
+        ordinal = self._ids.get(point_id)
+        if ordinal is not None:
+            return ordinal
+        self._read_ids()  # могла добавить другая копия процесса
+        ordinal = self._ids.get(point_id)
+        if ordinal is not None:
+            return ordinal
+        raw = point_id.encode('utf-8')
+        if not raw or len(raw) > ID_SIZE:
+            return None
+        if len(self._ids) >= self.capacity:
+            self._make_room()
+        ordinal = len(self._ids)
+        start = HEADER_SIZE + ordinal * ID_SIZE
+        self._mmap[start:start + len(raw)] = raw
+        self._ids[point_id] = ordinal
+        return ordinal
+
+    # ---------- запись ----------
+    def add(self, counts):
+        """
+        counts - {(start_id, end_id, номер дня): сколько}; номер дня - date.toordinal()
+        или None (только общий счётчик, без кольца по дням)
+        """
+        if not counts:
+            return
+        with self._lock:
+            self._map()
+            self._add(counts)
+
+    def _add(self, counts):
+        # Вызывать под блокировкой, после _map()
+        for (start_id, end_id, day), count in counts.items():
+            start, end = self._ordinal(start_id), self._ordinal(end_id)
+            # Номер начала мог смениться, если ради конца таблицу сжали
+            start = self._ids.get(start_id)
+            if start is None or end is None:
+                continue
+            self.totals[start, end] += count
+            if day is None:
+                continue
+            slot = day % self.days
+            if self.stamps[slot] != day:
+                if self.stamps[slot] > day:
+                    continue  # день старше кольца - только в общий счётчик
+                self.daily[slot] = 0
+                self.stamps[slot] = day
+            self.daily[slot, start, end] += count
+
+    def import_legacy(self, popular_routes, point_ids):
+        """
+        Перенос старого словаря {"start_end": число} из statistics.json.
+        id точек сами содержат "_", поэтому ключ делим там, где обе части - известные точки.
+        Переносится один раз - пока счётчики пусты. Возвращает, сколько ключей
+        разобрать не удалось, или None, если переносить было не нужно.
+        """
+        point_ids = set(point_ids)
+        counts, skipped = {}, 0
+        for key, count in popular_routes.items():
+            parts = key.split('_')
+            for i in range(1, len(parts)):
+                start_id, end_id = '_'.join(parts[:i]), '_'.join(parts[i:])
+                if start_id in point_ids and end_id in point_ids:
+                    # День навигаций неизвестен - в кольцо по дням не попадают
+                    counts[(start_id, end_id, None)] = int(count)
+                    break
+            else:
+                skipped += 1
+        with self._lock:
+            self._map()
+            if self.totals.any():
+                return None
+            self._add(counts)
+        return skipped
+
+    # ---------- чтение ----------
+    def _names(self):
+        names = [None] * self.capacity
+        for point_id, ordinal in self._ids.items():
+            names[ordinal] = point_id
+        return names
+
+    def _as_dict(self, matrix, names, limit):
+        starts, ends = np.nonzero(matrix)
+        values = matrix[starts, ends]
+        order = np.argsort(-values.astype(np.int64), kind='stable')
+        if limit:
+            order = order[:limit]
+        return {f"{names[starts[i]]}_{names[ends[i]]}": int(values[i]) for i in order}
+
+    def popular_routes(self, limit=None):
+        """{"start_end": число} по убыванию - строится по запросу из матрицы"""
+        with self._lock:
+            self._map()
+            self._read_ids()
+            return self._as_dict(self.totals, self._names(), limit)
+
+    def by_day(self, days=7, limit=None):
+        """{"ГГГГ-ММ-ДД": {"start_end": число}} за последние days дней (не больше длины кольца)"""
+        today = date.today().toordinal()
+        with self._lock:
+            self._map()
+            self._read_ids()
+            names = self._names()
+            result = {}
+            for slot in np.argsort(-self.stamps):
+                day = int(self.stamps[slot])
+                if day <= 0 or day <= today - days:
+                    continue
+                result[date.fromordinal(day).isoformat()] = self._as_dict(self.daily[slot], names, limit)
+            return result
+
+    def total(self):
+        with self._lock:
+            self._map()
+            return int(self.totals.sum())
+
+    def get_counters(self):
+        with self._lock:
+            self._map()
+            return {'points': len(self._ids), 'capacity': self.capacity, 'days': self.days,
+                    'file_size': _layout(self.capacity, self.days)[4], 'grows': self.grows,
+                    'compactions': self.compactions}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Счётчики популярности маршрутов')
+    parser.add_argument('--file', default=COUNTERS_FILE)
+    parser.add_argument('--days', type=int, default=7, help='за сколько последних дней показать')
+    parser.add_argument('--limit', type=int, default=20, help='сколько маршрутов показать')
+    args = parser.parse_args()
+
+    counters = RouteCounters(args.file)
+    print(f"📊 {counters.get_counters()}, всего навигаций: {counters.total()}")
+    for key, count in counters.popular_routes(args.limit).items():
+        print(f"   {count:6d}  {key}")
+    for day, routes in counters.by_day(args.days).items():
+        top = dict(list(routes.items())[:3])
+        print(f"📅 {day}: {sum(routes.values())} навигаций, маршрутов: {len(routes)}, топ: {top}")
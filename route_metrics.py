@@ -0,0 +1,195 @@
+"""
+Метрики маршрутов: длина, длина по этажам, время в пути, направления отрезков, повороты
+Считаются при сохранении маршрута и хранятся рядом с ним в поле metrics; при
+загрузке хранилища - сразу для всех маршрутов одной векторной операцией NumPy
+по всем точкам всех маршрутов. /api/navigate, просмотрщик и голосовые подсказки
+берут готовые значения, а не пересчитывают их по точкам.
+
+Углы - в координатах карты: x вправо, y вниз; 0° - направо, 90° - вниз.
+Поворот > 0 - по часовой стрелке на экране, то есть направо.
+
+    metrics = {
+        'version': 1,
+        'length': длина в единицах карты,
+        'meters': метры, 'eta_seconds': секунды, 'minutes': минуты (не меньше 1),
+        'floors': {"1": метры на этаже, ...},
+        'directions': [направление отрезка i -> i+1 в градусах или None, ...],
+        'turns': [{'index': точка поворота, 'angle': градусы, 'side': 'left'|'right'}, ...],
+        'floor_changes': [{'index': первая точка на новом этаже, 'from': этаж, 'to': этаж}, ...]
+    }
+
+Сводка и запись в хранилище:
+    python route_metrics.py [--save]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+METRICS_VERSION = 1
+METERS_PER_UNIT = 0.5  # 1 единица карты ~ 0.5 м
+WALK_SPEED = 70.0  # м/мин - шаг школьника в коридоре
+FLOOR_CHANGE_SECONDS = 30  # на каждый переход между этажами по лестнице
+TURN_THRESHOLD = 30.0  # градусов: меньше - не поворот, а изгиб коридора
+
+
+def _stack(routes):
+    """Точки всех маршрутов подряд: ключи, число точек, x, y, этаж"""
+    keys, counts, xs, ys, floors = [], [], [], [], []
+    for key, route in routes.items():
+        points = route.get('points') or []
+        keys.append(key)
+        counts.append(len(points))
+        for point in points:
+            xs.append(point['x'])
+            ys.append(point['y'])
+            floors.append(point.get('floor', 1))
+    return (keys, np.asarray(counts, dtype=np.int64), np.asarray(xs, dtype=np.float64),
+            np.asarray(ys, dtype=np.float64), np.asarray(floors, dtype=np.int64))
+
+
+def _eta_seconds(meters, floor_changes):
+    return meters / WALK_SPEED * 60 + floor_changes * FLOOR_CHANGE_SECONDS
+
+
+def compute_metrics(routes):
+    """{ключ: маршрут} -> {ключ: metrics}; все маршруты - одним проходом NumPy"""
+    keys, counts, x, y, floor = _stack(routes)
+    n_routes = len(keys)
+    if not n_routes:
+        return {}
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    owner = np.repeat(np.arange(n_routes), counts)
+
+    # ---------- отрезки: точка i -> i+1 внутри одного маршрута ----------
+    dx, dy = np.diff(x), np.diff(y)
+    seg_owner = owner[:-1]
+    same_route = seg_owner == owner[1:]
+    same_floor = same_route & (floor[:-1] == floor[1:])
+    # Переход между этажами - не отрезок на плане, длины у него нет
+    seg_length = np.where(same_floor, np.hypot(dx, dy), 0.0)
+    heading = np.degrees(np.arctan2(dy, dx))
+    moving = same_floor & (seg_length > 0)
+
+    lengths = np.bincount(seg_owner[same_route], weights=seg_length[same_route], minlength=n_routes)
+    floor_lengths = {}
+    for value in np.unique(floor[:-1][same_floor]):
+        mask = same_floor & (floor[:-1] == value)
+        floor_lengths[int(value)] = np.bincount(seg_owner[mask], weights=seg_length[mask], minlength=n_routes)
+    changes = same_route & ~same_floor
+    change_counts = np.bincount(seg_owner[changes], minlength=n_routes)
+    changes_before = np.cumsum(changes)  # переходов между этажами на отрезках 0..i
+
+    # ---------- повороты: между соседними ненулевыми отрезками на одном этаже ----------
+    moving_index = np.nonzero(moving)[0]
+    prev, cur = moving_index[:-1], moving_index[1:]
+    # Пара считается, если между отрезками не было перехода на другой этаж
+    pair = (seg_owner[prev] == seg_owner[cur]) & (changes_before[cur - 1] == changes_before[prev])
+    turn = (heading[cur] - heading[prev] + 180.0) % 360.0 - 180.0
+    is_turn = pair & (np.abs(turn) >= TURN_THRESHOLD)
+    # Точка поворота - конец предыдущего отрезка (угол коридора)
+    turn_segments, turn_angles = prev[is_turn], turn[is_turn]
+
+    # ---------- по маршрутам ----------
+    result = {}
+    turn_owner = seg_owner[turn_segments]
+    turn_bounds = np.searchsorted(turn_owner, np.arange(n_routes + 1))
+    change_index = np.nonzero(changes)[0]
+    change_bounds = np.searchsorted(seg_owner[change_index], np.arange(n_routes + 1))
+    for r, key in enumerate(keys):
+        start, count = int(starts[r]), int(counts[r])
+        seg = slice(start, start + max(count - 1, 0))
+        directions = np.where(moving[seg], np.round(heading[seg]), np.nan).tolist()
+        meters = float(lengths[r]) * METERS_PER_UNIT
+        turns = [{'index': int(s) - start + 1, 'angle': int(round(a)), 'side': 'right' if a > 0 else 'left'}
+                 for s, a in zip(turn_segments[turn_bounds[r]:turn_bounds[r + 1]],
+                                 turn_angles[turn_bounds[r]:turn_bounds[r + 1]])]
+        floor_changes = [{'index': int(s) - start + 1, 'from': int(floor[s]), 'to': int(floor[s + 1])}
+                         for s in change_index[change_bounds[r]:change_bounds[r + 1]]]
+        eta = _eta_seconds(meters, int(change_counts[r]))
+        result[key] = {
+            'version': METRICS_VERSION,
+            'length': round(float(lengths[r]), 1),
+            'meters': round(meters),
+            'eta_seconds': round(eta),
+            'minutes': max(1, round(eta / 60)),
+            'floors': {str(f): round(float(v[r]) * METERS_PER_UNIT) for f, v in floor_lengths.items() if v[r] > 0},
+            'directions': [None if d != d else int(d) for d in directions],
+            'turns': turns,
+            'floor_changes': floor_changes
+        }
+    return result
+
+
+def path_metrics(points):
+    """Метрики одного списка точек (путь по графу коридоров, запасной путь)"""
+    return compute_metrics({'path': {'points': points}})['path']
+
+
+def attach_metrics(routes):
+    """Записывает metrics во все маршруты словаря (на месте) и возвращает его"""
+    for key, metrics in compute_metrics(routes).items():
+        routes[key]['metrics'] = metrics
+    return routes
+
+
+def with_metrics(routes):
+    """Копии маршрутов с metrics - для записи в хранилище; None (удаление) не трогает"""
+    present = {key: dict(route) for key, route in routes.items() if route is not None}
+    attach_metrics(present)
+    return {key: present.get(key) for key in routes}
+
+
+def _opposite(direction):
+    if direction is None:
+        return None
+    return direction - 180 if direction > 0 else direction + 180
+
+
+def reverse_metrics(metrics, n_points):
+    """
+    Метрики того же маршрута, пройденного в обратную сторону.
+    Если в углу стоят дубли точки, index поворота может указать на другой дубль -
+    координаты у них те же.
+    """
+    last = n_points - 1
+    reversed_metrics = dict(metrics)
+    reversed_metrics['directions'] = [_opposite(d) for d in reversed(metrics.get('directions', []))]
+    reversed_metrics['turns'] = [{'index': last - t['index'], 'angle': -t['angle'],
+                                  'side': 'left' if t['side'] == 'right' else 'right'}
+                                 for t in reversed(metrics.get('turns', []))]
+    reversed_metrics['floor_changes'] = [{'index': n_points - c['index'], 'from': c['to'], 'to': c['from']}
+                                         for c in reversed(metrics.get('floor_changes', []))]
+    return reversed_metrics
+
+
+def summary(metrics):
+    """Только итоги, без списков по точкам - для упрощённых (compact) маршрутов"""
+    return {key: metrics[key] for key in ('version', 'length', 'meters', 'eta_seconds', 'minutes', 'floors')}
+
+
+if __name__ == '__main__':
+    from storage import get_storage
+
+    parser = argparse.ArgumentParser(description='Метрики маршрутов: длина, время, повороты')
+    parser.add_argument('--save', action='store_true', help='записать metrics в хранилище маршрутов')
+    args = parser.parse_args()
+
+    storage = get_storage()
+    routes = storage.load_routes()
+    started = time.perf_counter()
+    metrics = compute_metrics(routes)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"📏 Маршрутов: {len(metrics)}, посчитано за {elapsed:.1f} мс")
+    if metrics:
+        meters = [m['meters'] for m in metrics.values()]
+        turns = sum(len(m['turns']) for m in metrics.values())
+        print(f"   • длина: от {min(meters)} до {max(meters)} м, в среднем {sum(meters) // len(meters)} м")
+        print(f"   • поворотов: {turns}, переходов между этажами: "
+              f"{sum(len(m['floor_changes']) for m in metrics.values())}")
+    if args.save:
+        changed = {key: dict(routes[key], metrics=m) for key, m in metrics.items() if routes[key].get('metrics') != m}
+        if changed:
+            storage.patch_routes(changed)
+        print(f"✅ Обновлено маршрутов: {len(changed)}")
@@ -0,0 +1,230 @@
+"""
+Проверка маршрутов (routes.json) по стенам карты и точкам навигации
+Все отрезки всех маршрутов проверяются против всех стен этажа одной матричной
+операцией NumPy, поэтому проверка укладывается в миллисекунды и запускается
+при каждом сохранении маршрутов.
+
+Находит:
+  wall_crossing     - отрезок маршрута пересекает стену
+  duplicate_point   - подряд идущие одинаковые точки (маршрут "застревает" в точке)
+  stale_point_id    - pointId, которого больше нет среди точек навигации
+  endpoint_mismatch - начало/конец маршрута не совпадает с координатами своей точки
+  missing_endpoint  - у начала/конца маршрута нет pointId
+  too_short         - в маршруте меньше двух точек
+
+Запуск отдельно:
+    python route_validator.py [--fix] [--report report.json]
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+CHUNK_SEGMENTS = 4096  # отрезков за одну матричную операцию (ограничивает память)
+
+
+def _as_point_map(points):
+    """{id: точка} из списка словарей или NavigationPoint"""
+    result = {}
+    for point in points or []:
+        data = point if isinstance(point, dict) else point.to_dict()
+        result[data['id']] = data
+    return result
+
+
+def _collect_segments(routes):
+    """Отрезки всех маршрутов: координаты (N, 4), этаж, номер маршрута, номер отрезка"""
+    coords, floors, owners, indexes = [], [], [], []
+    keys = list(routes.keys())
+    for owner, key in enumerate(keys):
+        points = routes[key].get('points') or []
+        for i in range(len(points) - 1):
+            a, b = points[i], points[i + 1]
+            floor = a.get('floor', 1)
+            # Переход между этажами - не отрезок на плане
+            if b.get('floor', 1) != floor:
+                continue
+            coords.append((a['x'], a['y'], b['x'], b['y']))
+            floors.append(floor)
+            owners.append(owner)
+            indexes.append(i)
+    return (keys,
+            np.asarray(coords, dtype=np.float64).reshape(-1, 4),
+            np.asarray(floors, dtype=np.int64),
+            np.asarray(owners, dtype=np.int64),
+            np.asarray(indexes, dtype=np.int64))
+
+
+def find_wall_crossings(segments, walls):
+    """
+    Пары (номер отрезка, номер стены) со строгим пересечением.
+    segments - (N, 4), walls - (M, 4); та же проверка, что spatial_index.segments_intersect.
+    Сначала отсекаем пары с непересекающимися габаритами, ориентации считаем только для остальных.
+    """
+    if not len(segments) or not len(walls):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    wall_min = np.minimum(walls[:, :2], walls[:, 2:])
+    wall_max = np.maximum(walls[:, :2], walls[:, 2:])
+    found_segments, found_walls = [], []
+    for start in range(0, len(segments), CHUNK_SEGMENTS):
+        chunk = segments[start:start + CHUNK_SEGMENTS]
+        seg_min = np.minimum(chunk[:, :2], chunk[:, 2:])
+        seg_max = np.maximum(chunk[:, :2], chunk[:, 2:])
+        overlap = ((seg_min[:, None, 0] <= wall_max[None, :, 0]) & (seg_max[:, None, 0] >= wall_min[None, :, 0]) &
+                   (seg_min[:, None, 1] <= wall_max[None, :, 1]) & (seg_max[:, None, 1] >= wall_min[None, :, 1]))
+        seg_index, wall_index = np.nonzero(overlap)
+        ax, ay, bx, by = chunk[seg_index].T
+        cx, cy, dx, dy = walls[wall_index].T
+        d1 = (dx - cx) * (ay - cy) - (dy - cy) * (ax - cx)
+        d2 = (dx - cx) * (by - cy) - (dy - cy) * (bx - cx)
+        d3 = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+        d4 = (bx - ax) * (dy - ay) - (by - ay) * (dx - ax)
+        hits = (d1 * d2 < 0) & (d3 * d4 < 0)
+        found_segments.append(seg_index[hits] + start)
+        found_walls.append(wall_index[hits])
+    return np.concatenate(found_segments), np.concatenate(found_walls)
+
+
+def validate_routes(routes, points, walls):
+    """
+    routes - {ключ: маршрут}, points - список точек (dict или NavigationPoint),
+    walls - {этаж: [(x1, y1, x2, y2), ...]} (spatial_index.walls_from_map)
+    Возвращает отчёт: {'issues': {ключ: [проблема, ...]}, 'counts': {...}, ...}
+    """
+    started = time.perf_counter()
+    point_map = _as_point_map(points)
+    issues = {}
+
+    def add(key, issue):
+        issues.setdefault(key, []).append(issue)
+
+    # ---------- пересечения со стенами ----------
+    keys, coords, floors, owners, indexes = _collect_segments(routes)
+    for floor in np.unique(floors):
+        floor_walls = np.asarray(walls.get(int(floor), []), dtype=np.float64).reshape(-1, 4)
+        mask = np.nonzero(floors == floor)[0]
+        seg_hits, wall_hits = find_wall_crossings(coords[mask], floor_walls)
+        for seg, wall in zip(mask[seg_hits].tolist(), wall_hits.tolist()):
+            add(keys[owners[seg]], {
+                'type': 'wall_crossing',
+                'segment': int(indexes[seg]),
+                'floor': int(floor),
+                'from': coords[seg, :2].tolist(),
+                'to': coords[seg, 2:].tolist(),
+                'wall': floor_walls[wall].tolist()
+            })
+
+    # ---------- точки маршрутов ----------
+    for key, route in routes.items():
+        route_points = route.get('points') or []
+        if len(route_points) < 2:
+            add(key, {'type': 'too_short', 'points': len(route_points)})
+        for i, point in enumerate(route_points):
+            point_id = point.get('pointId')
+            if point_id and point_id not in point_map:
+                add(key, {'type': 'stale_point_id', 'index': i, 'pointId': point_id})
+            if i and (point['x'], point['y'], point.get('floor', 1)) == \
+                    (route_points[i - 1]['x'], route_points[i - 1]['y'], route_points[i - 1].get('floor', 1)):
+                add(key, {'type': 'duplicate_point', 'index': i, 'pointId': point_id})
+        endpoints = sorted({0, len(route_points) - 1}) if route_points else []
+        for i in endpoints:
+            point = route_points[i]
+            target = point_map.get(point.get('pointId'))
+            if not point.get('pointId'):
+                add(key, {'type': 'missing_endpoint', 'index': i})
+            elif target and (target['x'], target['y'], target['floor']) != \
+                    (point['x'], point['y'], point.get('floor', 1)):
+                add(key, {'type': 'endpoint_mismatch', 'index': i, 'pointId': point['pointId'],
+                          'expected': [target['x'], target['y'], target['floor']]})
+
+    counts = {}
+    for route_issues in issues.values():
+        for issue in route_issues:
+            counts[issue['type']] = counts.get(issue['type'], 0) + 1
+    return {
+        'routes_checked': len(routes),
+        'segments_checked': int(len(coords)),
+        'invalid_routes': len(issues),
+        'counts': counts,
+        'issues': issues,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+    }
+
+
+def fix_routes(routes, points, report):
+    """
+    Автоисправление того, что можно исправить без человека: убирает подряд
+    идущие дубли, подтягивает начало/конец к текущим координатам точек,
+    сбрасывает устаревшие pointId у промежуточных точек.
+    Пересечения со стенами не трогает. Возвращает {ключ: исправленный маршрут}.
+    """
+    point_map = _as_point_map(points)
+    fixable = {'duplicate_point', 'endpoint_mismatch', 'stale_point_id'}
+    fixed = {}
+    for key, route_issues in report['issues'].items():
+        if key not in routes or not any(issue['type'] in fixable for issue in route_issues):
+            continue
+        route_points = [dict(p) for p in routes[key].get('points') or []]
+        last = len(route_points) - 1
+        for i, point in enumerate(route_points):
+            point_id = point.get('pointId')
+            target = point_map.get(point_id)
+            if point_id and target is None and 0 < i < last:
+                point['pointId'] = None
+                point['pointName'] = None
+            elif target is not None and i in (0, last):
+                point.update(x=target['x'], y=target['y'], floor=target['floor'], pointName=target['name'])
+        cleaned = []
+        for i, point in enumerate(route_points):
+            if cleaned and (point['x'], point['y'], point.get('floor', 1)) == \
+                    (cleaned[-1]['x'], cleaned[-1]['y'], cleaned[-1].get('floor', 1)):
+                # Из двух одинаковых оставляем ту, что привязана к точке навигации
+                if point.get('pointId') and not cleaned[-1].get('pointId'):
+                    cleaned[-1] = point
+                continue
+            cleaned.append(point)
+        route = dict(routes[key])
+        route['points'] = cleaned
+        if route != routes[key]:
+            fixed[key] = route
+    return fixed
+
+
+def summarize(report):
+    """Короткая сводка для ответов API и логов"""
+    return {key: report[key] for key in ('routes_checked', 'invalid_routes', 'counts', 'elapsed_ms')}
+
+
+if __name__ == '__main__':
+    from storage import get_storage
+    from spatial_index import walls_from_map
+
+    parser = argparse.ArgumentParser(description='Проверка маршрутов по стенам и точкам')
+    parser.add_argument('--fix', action='store_true', help='исправить дубли, концы и устаревшие pointId')
+    parser.add_argument('--report', help='сохранить полный отчёт в JSON-файл')
+    parser.add_argument('--map', default='data/map_data.json', help='файл карты со стенами')
+    args = parser.parse_args()
+
+    storage = get_storage()
+    routes = storage.load_routes()
+    points = storage.load_points() or []
+    with open(args.map, 'r', encoding='utf-8') as f:
+        walls = walls_from_map(json.load(f))
+
+    report = validate_routes(routes, points, walls)
+    print(f"🔍 Проверено маршрутов: {report['routes_checked']}, отрезков: {report['segments_checked']} "
+          f"за {report['elapsed_ms']} мс")
+    print(f"⚠️ Маршрутов с проблемами: {report['invalid_routes']}")
+    for issue_type, count in sorted(report['counts'].items()):
+        print(f"   • {issue_type}: {count}")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📄 Отчёт: {args.report}")
+    if args.fix:
+        fixed = fix_routes(routes, points, report)
+        if fixed:
+            storage.patch_routes(fixed)
+        print(f"🛠️ Исправлено маршрутов: {len(fixed)}")
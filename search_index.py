@@ -0,0 +1,164 @@
+"""
+Поисковый индекс по точкам навигации для /api/search
+Нормализация (регистр, ё, латиница -> кириллица, "Б115" == "B115"),
+префиксный индекс для автодополнения и триграммы для опечаток
+"""
+
+import re
+import threading
+
+# Сначала многобуквенные сочетания, потом одиночные буквы
+TRANSLIT_MULTI = re.compile(r'shch|sch|sh|ch|zh|kh|ts|yu|ya|yo|ye|x')
+TRANSLIT_MULTI_MAP = {
+    'shch': 'щ', 'sch': 'щ', 'sh': 'ш', 'ch': 'ч', 'zh': 'ж', 'kh': 'х', 'ts': 'ц',
+    'yu': 'ю', 'ya': 'я', 'yo': 'е', 'ye': 'е', 'x': 'кс'
+}
+TRANSLIT_SINGLE = str.maketrans('abcdefghijklmnopqrstuvwyz', 'абцдефгхийклмнопкрстуввыз')
+# Набрано в английской раскладке вместо русской ("rkfcc" -> "класс")
+KEYBOARD_LAYOUT = str.maketrans("qwertyuiop[]asdfghjkl;'zxcvbnm,.`", 'йцукенгшщзхъфывапролджэячсмитьбюё')
+
+NAME_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.5
+EXACT_SCORE = 3.0
+PREFIX_SCORE = 2.0
+FUZZY_SCORE = 1.5
+FUZZY_THRESHOLD = 0.4  # минимальная доля общих триграмм
+
+_WORD_RE = re.compile(r'[^\W_]+')
+_PARTS_RE = re.compile(r'\d+|[^\W\d_]+')
+_LATIN_RE = re.compile(r'[a-z]')
+
+
+def normalize(text: str) -> str:
+    text = (text or '').lower()
+    text = TRANSLIT_MULTI.sub(lambda m: TRANSLIT_MULTI_MAP[m.group(0)], text)
+    return text.translate(TRANSLIT_SINGLE).replace('ё', 'е')
+
+
+def tokenize(text: str, expand: bool = True):
+    """Слова текста; для индекса ещё части "б115" -> "б", "115" и склейки "б 117" -> "б117" """
+    words = _WORD_RE.findall(normalize(text))
+    if not expand:
+        return words
+    tokens = list(words)
+    for word in words:
+        parts = _PARTS_RE.findall(word)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    tokens.extend(a + b for a, b in zip(words, words[1:]))
+    return tokens
+
+
+def trigrams(token: str):
+    padded = f"  {token}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Индекс строится один раз и обновляется по изменившимся точкам"""
+
+    def __init__(self):
+        self.version = None
+        self._lock = threading.Lock()
+        self._docs = {}  # point_id -> (name, description)
+        self._point_tokens = {}  # point_id -> {токен: вес}
+        self._exact = {}  # токен -> {point_id: вес}
+        self._prefixes = {}  # префикс -> {point_id: вес}
+        self._trigrams = {}  # триграмма -> {токен}
+        self._name_lengths = {}
+
+    # ---------- обновление ----------
+    def _add(self, point_id, name, description):
+        tokens = {}
+        for token in tokenize(description):
+            tokens[token] = DESCRIPTION_WEIGHT
+        for token in tokenize(name):
+            tokens[token] = NAME_WEIGHT
+        for token, weight in tokens.items():
+            if token not in self._exact:
+                self._exact[token] = {}
+                for gram in trigrams(token):
+                    self._trigrams.setdefault(gram, set()).add(token)
+            self._exact[token][point_id] = weight
+            for i in range(1, len(token) + 1):
+                bucket = self._prefixes.setdefault(token[:i], {})
+                bucket[point_id] = max(weight, bucket.get(point_id, 0))
+        self._docs[point_id] = (name, description)
+        self._point_tokens[point_id] = tokens
+        self._name_lengths[point_id] = len(name)
+
+    def _remove(self, point_id):
+        for token in self._point_tokens.pop(point_id, {}):
+            ids = self._exact.get(token, {})
+            ids.pop(point_id, None)
+            if not ids:
+                self._exact.pop(token, None)
+                for gram in trigrams(token):
+                    self._trigrams.get(gram, set()).discard(token)
+            for i in range(1, len(token) + 1):
+                bucket = self._prefixes.get(token[:i])
+                if bucket is not None:
+                    bucket.pop(point_id, None)
+                    if not bucket:
+                        del self._prefixes[token[:i]]
+        self._docs.pop(point_id, None)
+        self._name_lengths.pop(point_id, None)
+
+    def sync(self, points, version=None):
+        """Переиндексирует только добавленные, удалённые и переименованные точки"""
+        with self._lock:
+            wanted = {p.id: (p.name or '', p.description or '') for p in points}
+            for point_id in [pid for pid in self._docs if wanted.get(pid) != self._docs[pid]]:
+                self._remove(point_id)
+            for point_id, (name, description) in wanted.items():
+                if point_id not in self._docs:
+                    self._add(point_id, name, description)
+            self.version = version
+
+    # ---------- поиск ----------
+    def _score_token(self, query_token):
+        scores = {}
+        for point_id, weight in self._prefixes.get(query_token, {}).items():
+            scores[point_id] = PREFIX_SCORE * weight
+        for point_id, weight in self._exact.get(query_token, {}).items():
+            scores[point_id] = EXACT_SCORE * weight
+        if len(query_token) >= 3:
+            query_grams = trigrams(query_token)
+            candidates = {}
+            for gram in query_grams:
+                for token in self._trigrams.get(gram, ()):
+                    candidates[token] = candidates.get(token, 0) + 1
+            for token, shared in candidates.items():
+                similarity = shared / max(len(query_grams), len(token))
+                if similarity < FUZZY_THRESHOLD:
+                    continue
+                for point_id, weight in self._exact[token].items():
+                    score = FUZZY_SCORE * similarity * weight
+                    if score > scores.get(point_id, 0):
+                        scores[point_id] = score
+        return scores
+
+    def _score_query(self, query):
+        total = None
+        for query_token in tokenize(query, expand=False):
+            scores = self._score_token(query_token)
+            if total is None:
+                total = scores
+            else:
+                # Все слова запроса должны найтись
+                total = {pid: total[pid] + s for pid, s in scores.items() if pid in total}
+            if not total:
+                return {}
+        return total or {}
+
+    def search(self, query: str, limit: int = 20):
+        """id точек, отсортированные по релевантности"""
+        with self._lock:
+            best = self._score_query(query)
+            lowered = (query or '').lower()
+            if _LATIN_RE.search(lowered):
+                for point_id, score in self._score_query(lowered.translate(KEYBOARD_LAYOUT)).items():
+                    if score > best.get(point_id, 0):
+                        best[point_id] = score
+            ranked = sorted(best.items(), key=lambda kv: (-kv[1], self._name_lengths[kv[0]], kv[0]))
+            return [point_id for point_id, _ in ranked[:limit]]
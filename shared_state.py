@@ -0,0 +1,91 @@
+"""
+Общее состояние для нескольких процессов-воркеров (gunicorn -c gunicorn.conf.py)
+У каждого воркера свои объекты в памяти, общие у них только файлы и база.
+Поэтому любая запись "прочитать - изменить - записать" идёт под FileLock,
+а об изменениях воркеры узнают по подписи файла (mtime + размер): подпись
+сверяется при обращении, и если другой воркер что-то записал - данные перечитываются.
+"""
+
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LOCK_POLL = 0.005  # секунд между попытками взять занятую блокировку
+
+
+def file_signature(*paths):
+    """(mtime_ns, размер) каждого файла или None - меняется при любой записи"""
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            signature.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+class FileLock:
+    """
+    Межпроцессная блокировка на файле-замке path (fcntl.flock, в Windows - msvcrt.locking).
+    Внутри процесса сначала берётся обычная блокировка: под gevent это блокировка
+    гринлетов, и ожидающий гринлет не останавливает остальные. Занятую другим
+    процессом блокировку ждём короткими паузами time.sleep - тоже без остановки воркера.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = None
+        self._pid = None
+
+    def _get_fd(self):
+        # Дескриптор, унаследованный через fork, общий с родителем и соседними
+        # воркерами - блокировка на нём их не разделяет, поэтому открываем свой
+        pid = os.getpid()
+        if self._fd is None or self._pid != pid:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = pid
+        return self._fd
+
+    def _try_lock(self, fd):
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(self, fd):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            fd = self._get_fd()
+            while not self._try_lock(fd):
+                time.sleep(LOCK_POLL)
+        except BaseException:
+            self._lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self._unlock(self._fd)
+        finally:
+            self._lock.release()
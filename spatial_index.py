@@ -0,0 +1,150 @@
+"""
+Пространственный индекс стен из data/map_data.json
+Равномерная сетка по этажам: каждая стена записана во все ячейки, которые
+пересекает её габаритный прямоугольник. Запросы (пересечение с отрезком,
+ближайшая стена, стены в окне просмотра) смотрят только на ближайшие ячейки,
+а не перебирают все стены здания.
+"""
+
+import math
+
+CELL_SIZE = 100  # сторона ячейки сетки в единицах карты
+
+
+def _orientation(ax, ay, bx, by, cx, cy):
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+
+def segments_intersect(a, b, c, d) -> bool:
+    """Строгое пересечение отрезков ab и cd (касание концами не считается)"""
+    d1 = _orientation(c[0], c[1], d[0], d[1], a[0], a[1])
+    d2 = _orientation(c[0], c[1], d[0], d[1], b[0], b[1])
+    d3 = _orientation(a[0], a[1], b[0], b[1], c[0], c[1])
+    d4 = _orientation(a[0], a[1], b[0], b[1], d[0], d[1])
+    return d1 * d2 < 0 and d3 * d4 < 0
+
+
+def point_segment_distance(px, py, x1, y1, x2, y2) -> float:
+    dx, dy = x2 - x1, y2 - y1
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(px - x1, py - y1)
+    t = max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / length_sq))
+    return math.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+
+
+def walls_from_map(map_data) -> dict:
+    """{этаж: [(x1, y1, x2, y2), ...]} из формата map_data.json"""
+    walls = {}
+    for floor, floor_data in (map_data or {}).get('floors', {}).items():
+        walls[int(floor)] = [(w['x1'], w['y1'], w['x2'], w['y2']) for w in floor_data.get('walls', [])]
+    return walls
+
+
+class WallIndex:
+    """Сетка ячеек CELL_SIZE по каждому этажу: ячейка -> номера стен"""
+
+    def __init__(self, walls=None, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.walls = {}  # этаж -> [(x1, y1, x2, y2), ...]
+        self._grid = {}  # этаж -> {(cx, cy): [номер стены, ...]}
+        self._bounds = {}  # этаж -> (min_cx, min_cy, max_cx, max_cy)
+        for floor, floor_walls in (walls or {}).items():
+            self.add_floor(floor, floor_walls)
+
+    def _cell(self, value):
+        return math.floor(value / self.cell_size)
+
+    def add_floor(self, floor, floor_walls):
+        floor_walls = [tuple(w) for w in floor_walls]
+        grid = {}
+        for i, (x1, y1, x2, y2) in enumerate(floor_walls):
+            for cx in range(self._cell(min(x1, x2)), self._cell(max(x1, x2)) + 1):
+                for cy in range(self._cell(min(y1, y2)), self._cell(max(y1, y2)) + 1):
+                    grid.setdefault((cx, cy), []).append(i)
+        self.walls[floor] = floor_walls
+        self._grid[floor] = grid
+        if grid:
+            xs = [c[0] for c in grid]
+            ys = [c[1] for c in grid]
+            self._bounds[floor] = (min(xs), min(ys), max(xs), max(ys))
+        else:
+            self._bounds.pop(floor, None)
+
+    def _candidates(self, floor, x1, y1, x2, y2):
+        """Номера стен из ячеек, покрывающих прямоугольник"""
+        grid = self._grid.get(floor)
+        bounds = self._bounds.get(floor)
+        if not grid or bounds is None:
+            return set()
+        min_cx = max(self._cell(min(x1, x2)), bounds[0])
+        max_cx = min(self._cell(max(x1, x2)), bounds[2])
+        min_cy = max(self._cell(min(y1, y2)), bounds[1])
+        max_cy = min(self._cell(max(y1, y2)), bounds[3])
+        found = set()
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                found.update(grid.get((cx, cy), ()))
+        return found
+
+    # ---------- запросы ----------
+    def intersects(self, floor, a, b) -> bool:
+        """Пересекает ли отрезок ab хотя бы одну стену этажа"""
+        floor_walls = self.walls.get(floor, ())
+        for i in self._candidates(floor, a[0], a[1], b[0], b[1]):
+            x1, y1, x2, y2 = floor_walls[i]
+            if segments_intersect(a, b, (x1, y1), (x2, y2)):
+                return True
+        return False
+
+    def in_bbox(self, floor, x1, y1, x2, y2):
+        """Стены, чей габарит пересекается с окном (x1, y1)-(x2, y2), в исходном порядке"""
+        left, right = min(x1, x2), max(x1, x2)
+        top, bottom = min(y1, y2), max(y1, y2)
+        floor_walls = self.walls.get(floor, ())
+        result = []
+        for i in sorted(self._candidates(floor, left, top, right, bottom)):
+            wx1, wy1, wx2, wy2 = floor_walls[i]
+            if max(wx1, wx2) >= left and min(wx1, wx2) <= right and max(wy1, wy2) >= top and min(wy1, wy2) <= bottom:
+                result.append(floor_walls[i])
+        return result
+
+    def nearest(self, floor, x, y, max_distance=None):
+        """(расстояние, стена) до ближайшей стены или None; обход колец ячеек вокруг точки"""
+        grid = self._grid.get(floor)
+        bounds = self._bounds.get(floor)
+        if not grid or bounds is None:
+            return None
+        floor_walls = self.walls[floor]
+        cx, cy = self._cell(x), self._cell(y)
+        # Дальше этого кольца ячеек стен нет
+        max_ring = max(abs(cx - bounds[0]), abs(cx - bounds[2]), abs(cy - bounds[1]), abs(cy - bounds[3]))
+        if max_distance is not None:
+            max_ring = min(max_ring, math.ceil(max_distance / self.cell_size) + 1)
+        best = None
+        seen = set()
+        for ring in range(max_ring + 1):
+            # Стена из более дальнего кольца не может быть ближе ring * cell_size
+            if best is not None and best[0] <= (ring - 1) * self.cell_size:
+                break
+            for i in range(cx - ring, cx + ring + 1):
+                for j in range(cy - ring, cy + ring + 1):
+                    if max(abs(i - cx), abs(j - cy)) != ring:
+                        continue
+                    for index in grid.get((i, j), ()):
+                        if index in seen:
+                            continue
+                        seen.add(index)
+                        distance = point_segment_distance(x, y, *floor_walls[index])
+                        if best is None or distance < best[0]:
+                            best = (distance, floor_walls[index])
+        if best is None or (max_distance is not None and best[0] > max_distance):
+            return None
+        return best
+
+    def get_counters(self):
+        return {
+            'floors': len(self.walls),
+            'walls': sum(len(w) for w in self.walls.values()),
+            'cells': sum(len(g) for g in self._grid.values())
+        }
@@ -0,0 +1,80 @@
+/**
+ * Слой тайлов плана этажа для canvas-карт
+ * Загружает только тайлы, попадающие в видимую область, на уровне,
+ * соответствующем текущему масштабу (пирамида из build_tiles.py)
+ */
+
+class FloorTileLayer {
+    constructor(onTileLoaded, maxCachedTiles = 200) {
+        this.meta = {};
+        this.cache = new Map();  // url -> Image, порядок вставки = давность использования
+        this.maxCachedTiles = maxCachedTiles;
+        this.onTileLoaded = onTileLoaded;
+    }
+
+    async load() {
+        try {
+            const response = await fetch('/api/tiles');
+            this.meta = await response.json();
+        } catch (error) {
+            this.meta = {};
+        }
+        return this.meta;
+    }
+
+    hasFloor(floor) {
+        return Boolean(this.meta[floor]);
+    }
+
+    // Уровень, у которого на пиксель экрана приходится не меньше пикселя тайла
+    zoomFor(info, scale) {
+        const density = scale * (window.devicePixelRatio || 1);
+        const z = info.max_zoom + Math.ceil(Math.log2(Math.max(density, 1e-6)));
+        return Math.min(Math.max(z, 0), info.max_zoom);
+    }
+
+    getTile(url) {
+        let image = this.cache.get(url);
+        if (image) {
+            this.cache.delete(url);
+            this.cache.set(url, image);
+            return image;
+        }
+        image = new Image();
+        image.onload = () => this.onTileLoaded && this.onTileLoaded();
+        image.src = url;
+        this.cache.set(url, image);
+        // Старые тайлы выбрасываем, чтобы не держать в памяти весь план
+        while (this.cache.size > this.maxCachedTiles) {
+            this.cache.delete(this.cache.keys().next().value);
+        }
+        return image;
+    }
+
+    // ctx уже сдвинут и масштабирован: рисуем в координатах плана
+    draw(ctx, floor, scale, offsetX, offsetY, viewWidth, viewHeight) {
+        const info = this.meta[floor];
+        if (!info) return false;
+
+        const z = this.zoomFor(info, scale);
+        const factor = Math.pow(2, info.max_zoom - z);  // пикселей плана в пикселе тайла
+        const worldTile = info.tile_size * factor;
+
+        const left = Math.max(-offsetX / scale, 0);
+        const top = Math.max(-offsetY / scale, 0);
+        const right = Math.min((viewWidth - offsetX) / scale, info.width);
+        const bottom = Math.min((viewHeight - offsetY) / scale, info.height);
+        if (right <= left || bottom <= top) return true;
+
+        for (let ty = Math.floor(top / worldTile); ty * worldTile < bottom; ty++) {
+            for (let tx = Math.floor(left / worldTile); tx * worldTile < right; tx++) {
+                const image = this.getTile(`/api/tiles/${floor}/${z}/${tx}/${ty}?v=${info.version}`);
+                if (image.complete && image.naturalWidth) {
+                    ctx.drawImage(image, tx * worldTile, ty * worldTile,
+                        image.naturalWidth * factor, image.naturalHeight * factor);
+                }
+            }
+        }
+        return true;
+    }
+}
@@ -53,6 +53,10 @@ class GoogleStyleMap {
             end: '#e5252d'
         };
 
+        // План этажа тайлами: грузятся только видимые
+        this.tiles = new FloorTileLayer(() => this.draw());
+        this.tiles.load().then(() => this.draw());
+
         this.init();
     }
 
@@ -127,8 +131,11 @@ class GoogleStyleMap {
         // Рисуем базовую сетку
         this.drawGrid();
 
-        // Рисуем стены и комнаты
-        this.drawFloorPlan();
+        // Рисуем план этажа; без нарезанных тайлов - примерные стены
+        if (!this.tiles.draw(this.ctx, this.currentFloor, this.scale, this.offsetX, this.offsetY,
+                this.canvas.width, this.canvas.height)) {
+            this.drawFloorPlan();
+        }
 
         // Рисуем точки
         this.drawPoints();
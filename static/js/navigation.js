@@ -14,6 +14,7 @@ class SchoolNavigation {
         this.ctx = this.canvas.getContext('2d');
         this.scanner = null;
         this.searchTimeout = null;
+        this.assets = {};
 
         // Инициализация
         this.init();
@@ -28,8 +29,8 @@ class SchoolNavigation {
         // Показываем загрузку
         this.showToast('Загрузка данных...', 'info');
 
-        // Загружаем точки
-        await this.loadPoints();
+        // Загружаем точки и манифест собранной статики
+        await Promise.all([this.loadPoints(), this.loadAssets()]);
 
         // Заполняем выпадающие списки
         this.populateSelects();
@@ -46,6 +47,27 @@ class SchoolNavigation {
         console.log('Инициализация завершена');
     }
 
+    /**
+     * Манифест собранной статики: исходный путь -> файл с отпечатком в имени
+     */
+    async loadAssets() {
+        try {
+            const response = await fetch('/api/static-manifest');
+            if (response.ok) {
+                this.assets = await response.json();
+            }
+        } catch (error) {
+            console.warn('Манифест статики недоступен, файлы грузятся без отпечатков:', error);
+        }
+    }
+
+    /**
+     * Ссылка на файл статики - собранный вариант, если он есть (как asset() в шаблонах)
+     */
+    assetUrl(path) {
+        return `/static/${this.assets[path] || path}`;
+    }
+
     /**
      * Загрузка точек с сервера
      */
@@ -80,8 +102,8 @@ class SchoolNavigation {
         document.getElementById('map-error').style.display = 'none';
         this.mapImage.style.display = 'none';
 
-        // Устанавливаем путь к карте этажа
-        this.mapImage.src = `/static/images/floor${floor}.jpg?t=${new Date().getTime()}`;
+        // Путь к карте этажа: имя собранного файла меняется вместе с картой, кэш сбрасывать не нужно
+        this.mapImage.src = this.assetUrl(`images/floor${floor}.jpg`);
 
         this.mapImage.onload = () => {
             console.log(`Карта ${floor} этажа загружена`);
@@ -0,0 +1,42 @@
+/**
+ * Разбор компактной формы маршрута (?compact=1 у /api/routes и /api/navigate)
+ * Формат - см. route_codec.py
+ */
+
+function decodePolyline(encoded, precision = 1) {
+    const values = [];
+    let value = 0, shift = 0;
+    for (let i = 0; i < encoded.length; i++) {
+        const byte = encoded.charCodeAt(i) - 63;
+        value |= (byte & 0x1f) << shift;
+        shift += 5;
+        if (byte < 0x20) {
+            values.push(value & 1 ? ~(value >> 1) : value >> 1);
+            value = 0;
+            shift = 0;
+        }
+    }
+    const coords = [];
+    let x = 0, y = 0;
+    for (let i = 0; i + 1 < values.length; i += 2) {
+        x += values[i];
+        y += values[i + 1];
+        coords.push([x / precision, y / precision]);
+    }
+    return coords;
+}
+
+// pointNames - {pointId: название}, например из /api/points
+function expandRoute(compact, pointNames = {}) {
+    const floors = [];
+    (compact.floors || []).forEach(([floor, count]) => {
+        for (let i = 0; i < count; i++) floors.push(floor);
+    });
+    const anchors = new Map((compact.anchors || []).map(([index, pointId]) => [index, pointId]));
+    const points = decodePolyline(compact.polyline || '').map(([x, y], i) => {
+        const pointId = anchors.get(i) || null;
+        return { floor: floors[i] ?? 1, pointId, pointName: pointId ? (pointNames[pointId] ?? null) : null, x, y };
+    });
+    const { polyline, floors: _floors, anchors: _anchors, ...rest } = compact;
+    return { ...rest, points };
+}
@@ -40,12 +40,15 @@ class YandexStyleMap {
         this.canvas.width = window.innerWidth - 400;
         this.canvas.height = window.innerHeight;
 
+        // План этажа тайлами: грузятся только видимые
+        this.tiles = new FloorTileLayer(() => this.draw());
+
         this.init();
         this.setupEventListeners();
     }
 
     async init() {
-        await this.loadData();
+        await Promise.all([this.loadData(), this.tiles.load()]);
         this.draw();
         this.setupResizeHandler();
     }
@@ -134,6 +137,10 @@ class YandexStyleMap {
         // Рисуем базовую карту
         this.drawBaseMap();
 
+        // Подложка - план этажа
+        this.tiles.draw(this.ctx, this.currentFloor, this.scale, this.offsetX, this.offsetY,
+            this.canvas.width, this.canvas.height);
+
         // Рисуем стены и комнаты текущего этажа
         this.drawFloor();
 
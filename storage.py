@@ -0,0 +1,526 @@
+"""
+Хранилище данных навигации: точки, маршруты, эвакуационные маршруты, голосовые подсказки
+JsonStorage - файлы data/*.json (как раньше), SqliteStorage - одна база SQLite в режиме WAL
+Бэкенд выбирается переменной окружения STORAGE_BACKEND=json|sqlite
+Обоими бэкендами могут одновременно пользоваться несколько процессов-воркеров:
+JSON-файлы меняются под межпроцессной блокировкой (shared_state.FileLock),
+SQLite разделяет запись транзакциями.
+
+Перенос данных из JSON в SQLite:
+    python storage.py migrate [--db data/school.db]
+"""
+
+import argparse
+import atexit
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from blocking import run_blocking
+from shared_state import FileLock, file_signature
+
+DATA_DIR = 'data'
+SQLITE_FILE = 'data/school.db'
+
+
+def _route_endpoints(route):
+    """(start_id, end_id, этаж начала) - для индексов SQLite"""
+    points = route.get('points') or []
+    if not points:
+        return None, None, None
+    return points[0].get('pointId'), points[-1].get('pointId'), points[0].get('floor')
+
+
+def _dump_json_atomic(path, data):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _write_json_atomic(path, data):
+    # Сериализация и запись целого файла - в пуле, не в потоке запроса
+    run_blocking(_dump_json_atomic, path, data)
+
+
+class PreconditionFailed(Exception):
+    """Условная правка отменена: текущие значения ключей не прошли проверку (If-Match)"""
+
+    def __init__(self, current):
+        super().__init__('precondition failed')
+        self.current = current  # {ключ: значение в хранилище или None}
+
+
+def _read_json(path, default):
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return default
+
+
+class JournaledJsonFile:
+    """
+    Словарь в JSON-файле плюс журнал построчных правок рядом с ним.
+    Правка одного ключа - одна дописанная строка; файл переписывается целиком
+    только при save() или compact(), после чего журнал удаляется.
+    Чтение, дозапись и компактизация - под одной блокировкой: иначе воркер мог бы
+    удалить журнал вместе с правкой, которую только что дописал другой.
+    """
+
+    def __init__(self, path, journal_path):
+        self.path = path
+        self.journal_path = journal_path
+        self.journal_entries = 0
+        self._lock = FileLock(f"{path}.lock")
+
+    def signature(self):
+        return file_signature(self.path, self.journal_path)
+
+    @staticmethod
+    def _apply(data, entry):
+        if entry['op'] == 'put':
+            data[entry['key']] = entry['value']
+        elif entry['op'] == 'delete':
+            data.pop(entry['key'], None)
+
+    def _load(self):
+        data = _read_json(self.path, {})
+        self.journal_entries = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self._apply(data, json.loads(line))
+                        self.journal_entries += 1
+                    except (ValueError, KeyError):
+                        continue  # недописанная строка после сбоя
+        return data
+
+    def _save(self, data):
+        _write_json_atomic(self.path, data)
+        # Журнал уже учтён в снимке
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.journal_entries = 0
+
+    def load(self):
+        with self._lock:
+            return self._load()
+
+    def save(self, data):
+        with self._lock:
+            self._save(data)
+
+    def compact(self):
+        """Сворачивает журнал в файл по данным с диска, а не по копии в памяти воркера"""
+        with self._lock:
+            if os.path.exists(self.journal_path):
+                self._save(self._load())
+            else:
+                self.journal_entries = 0
+
+    def patch(self, changes, precondition=None):
+        """
+        {ключ: значение} - сохранить, {ключ: None} - удалить; дописывает только изменения.
+        precondition(текущие значения ключей) проверяется под той же блокировкой,
+        что и запись; False - PreconditionFailed и ничего не записано.
+        """
+        lines = []
+        for key, value in changes.items():
+            if value is None:
+                entry = {'op': 'delete', 'key': key}
+            else:
+                entry = {'op': 'put', 'key': key, 'value': value}
+            lines.append(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+        with self._lock:
+            if precondition is not None:
+                data = self._load()
+                current = {key: data.get(key) for key in changes}
+                if not precondition(current):
+                    raise PreconditionFailed(current)
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(''.join(lines))
+        self.journal_entries += len(lines)
+
+
+class JsonStorage:
+    """
+    Файлы data/*.json. Правки отдельных маршрутов и подсказок дописываются в журналы
+    (*_journal.jsonl), а сами файлы переписываются только при компактизации.
+    """
+
+    name = 'json'
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.points_file = os.path.join(data_dir, 'points.json')
+        self.evacuation_file = os.path.join(data_dir, 'evacuation_routes.json')
+        self._routes = JournaledJsonFile(os.path.join(data_dir, 'routes.json'),
+                                         os.path.join(data_dir, 'routes_journal.jsonl'))
+        self._voice = JournaledJsonFile(os.path.join(data_dir, 'voice_prompts.json'),
+                                        os.path.join(data_dir, 'voice_prompts_journal.jsonl'))
+        self._points_lock = FileLock(f"{self.points_file}.lock")
+        self._evacuation_lock = FileLock(f"{self.evacuation_file}.lock")
+
+    @property
+    def routes_journal_entries(self):
+        return self._routes.journal_entries
+
+    @property
+    def voice_prompts_journal_entries(self):
+        return self._voice.journal_entries
+
+    _signature = staticmethod(file_signature)
+
+    # ---------- точки ----------
+    def points_signature(self):
+        return self._signature(self.points_file)
+
+    def load_points(self):
+        """Список словарей точек или None, если данных ещё нет"""
+        if not os.path.exists(self.points_file):
+            return None
+        data = _read_json(self.points_file, [])
+        if isinstance(data, dict):
+            return data['points'] if 'points' in data else list(data.values())
+        return data
+
+    def save_points(self, points):
+        with self._points_lock:
+            _write_json_atomic(self.points_file, points)
+
+    def upsert_point(self, point, old_id=None):
+        # Читаем файл заново под блокировкой: точки могли изменить в другом воркере
+        with self._points_lock:
+            points = self.load_points() or []
+            old_id = old_id or point['id']
+            for i, existing in enumerate(points):
+                if existing['id'] == old_id:
+                    points[i] = point
+                    break
+            else:
+                points.append(point)
+            _write_json_atomic(self.points_file, points)
+
+    def delete_point(self, point_id):
+        with self._points_lock:
+            points = self.load_points() or []
+            _write_json_atomic(self.points_file, [p for p in points if p['id'] != point_id])
+
+    # ---------- маршруты ----------
+    def routes_signature(self):
+        return self._routes.signature()
+
+    def load_routes(self):
+        return self._routes.load()
+
+    def save_routes(self, routes):
+        self._routes.save(routes)
+
+    def patch_routes(self, changes, precondition=None):
+        """{ключ: маршрут} - сохранить, {ключ: None} - удалить"""
+        self._routes.patch(changes, precondition)
+
+    def compact_routes(self):
+        self._routes.compact()
+
+    # ---------- эвакуационные маршруты ----------
+    def evacuation_routes_signature(self):
+        return self._signature(self.evacuation_file)
+
+    def load_evacuation_routes(self):
+        return _read_json(self.evacuation_file, {})
+
+    def save_evacuation_routes(self, routes):
+        with self._evacuation_lock:
+            _write_json_atomic(self.evacuation_file, routes)
+
+    # ---------- голосовые подсказки ----------
+    def voice_prompts_signature(self):
+        return self._voice.signature()
+
+    def load_voice_prompts(self):
+        return self._voice.load()
+
+    def save_voice_prompts(self, prompts):
+        self._voice.save(prompts)
+
+    def patch_voice_prompts(self, changes, precondition=None):
+        self._voice.patch(changes, precondition)
+
+    def compact_voice_prompts(self):
+        self._voice.compact()
+
+
+class SqliteStorage:
+    """
+    SQLite в режиме WAL: читатели не блокируют писателя, каждая правка - транзакция
+    и стоит O(изменённых записей). Счётчики версий в таблице meta увеличивают
+    триггеры, поэтому изменения видны и другим процессам.
+    """
+
+    name = 'sqlite'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0);
+        INSERT OR IGNORE INTO meta (name, version) VALUES
+            ('points', 0), ('routes', 0), ('evacuation_routes', 0), ('voice_prompts', 0);
+
+        CREATE TABLE IF NOT EXISTS points (
+            id TEXT PRIMARY KEY, name TEXT NOT NULL, x REAL NOT NULL, y REAL NOT NULL,
+            floor INTEGER NOT NULL, description TEXT, category TEXT);
+        CREATE INDEX IF NOT EXISTS idx_points_floor ON points (floor);
+
+        CREATE TABLE IF NOT EXISTS routes (
+            key TEXT PRIMARY KEY, start_id TEXT, end_id TEXT, floor INTEGER, data TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS idx_routes_start_end ON routes (start_id, end_id);
+        CREATE INDEX IF NOT EXISTS idx_routes_floor ON routes (floor);
+
+        CREATE TABLE IF NOT EXISTS evacuation_routes (key TEXT PRIMARY KEY, floor INTEGER, data TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS idx_evacuation_routes_floor ON evacuation_routes (floor);
+
+        CREATE TABLE IF NOT EXISTS voice_prompts (route_key TEXT PRIMARY KEY, data TEXT NOT NULL);
+    """
+    VERSIONED_TABLES = ('points', 'routes', 'evacuation_routes', 'voice_prompts')
+
+    def __init__(self, db_path=SQLITE_FILE):
+        self.db_path = db_path
+        # Журналов у SQLite нет - каждая правка сразу на своём месте
+        self.routes_journal_entries = 0
+        self.voice_prompts_journal_entries = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        atexit.register(self.close)
+        with self._transaction() as conn:
+            conn.executescript(self.SCHEMA)
+            for table in self.VERSIONED_TABLES:
+                for event in ('INSERT', 'UPDATE', 'DELETE'):
+                    conn.execute(
+                        f"CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version "
+                        f"AFTER {event} ON {table} BEGIN "
+                        f"UPDATE meta SET version = version + 1 WHERE name = '{table}'; END")
+
+    def _conn(self):
+        """
+        Одно соединение на процесс, обращения к нему - под self._lock.
+        Соединение на поток под gevent было бы соединением на каждый гринлет,
+        и они бы не закрывались. Унаследованное через fork соединение не
+        используем и не закрываем - оно принадлежит родителю.
+        """
+        pid = os.getpid()
+        if self._connection is None or self._pid != pid:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._connection, self._pid = conn, pid
+        return self._connection
+
+    @contextmanager
+    def _transaction(self):
+        """Соединение процесса на время транзакции: commit в конце, rollback при исключении"""
+        with self._lock:
+            conn = self._conn()
+            with conn:
+                yield conn
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn().execute(sql, params).fetchall()
+
+    def close(self):
+        """Закрывает соединение процесса (atexit - при остановке воркера)"""
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+    @staticmethod
+    def _check(conn, table, key_column, changes, precondition):
+        """
+        Проверка условной правки внутри её транзакции: BEGIN IMMEDIATE сразу берёт
+        блокировку записи, и между чтением и записью базу никто не изменит
+        """
+        if precondition is None:
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        current = {}
+        for key in changes:
+            row = conn.execute(f'SELECT data FROM {table} WHERE {key_column} = ?', (key,)).fetchone()
+            current[key] = json.loads(row[0]) if row else None
+        if not precondition(current):
+            raise PreconditionFailed(current)
+
+    def _version(self, table):
+        rows = self._query('SELECT version FROM meta WHERE name = ?', (table,))
+        return rows[0][0] if rows else 0
+
+    # ---------- точки ----------
+    def points_signature(self):
+        return self._version('points')
+
+    def load_points(self):
+        rows = self._query('SELECT id, name, x, y, floor, description, category FROM points ORDER BY rowid')
+        if not rows and not self._version('points'):
+            return None
+        return [{'id': r[0], 'name': r[1], 'x': r[2], 'y': r[3], 'floor': r[4],
+                 'description': r[5] or '', 'category': r[6] or 'classroom'} for r in rows]
+
+    @staticmethod
+    def _point_row(point):
+        return (point['id'], point['name'], point['x'], point['y'], point['floor'],
+                point.get('description', ''), point.get('category', 'classroom'))
+
+    def save_points(self, points):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM points')
+            conn.executemany('INSERT INTO points VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             [self._point_row(p) for p in points])
+
+    def upsert_point(self, point, old_id=None):
+        with self._transaction() as conn:
+            if old_id and old_id != point['id']:
+                conn.execute('DELETE FROM points WHERE id = ?', (old_id,))
+            conn.execute(
+                'INSERT INTO points VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET '
+                'name = excluded.name, x = excluded.x, y = excluded.y, floor = excluded.floor, '
+                'description = excluded.description, category = excluded.category',
+                self._point_row(point))
+
+    def delete_point(self, point_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM points WHERE id = ?', (point_id,))
+
+    # ---------- маршруты ----------
+    def routes_signature(self):
+        return self._version('routes')
+
+    def load_routes(self):
+        rows = self._query('SELECT key, data FROM routes ORDER BY rowid')
+        return {key: json.loads(data) for key, data in rows}
+
+    @staticmethod
+    def _route_row(route_key, route):
+        start_id, end_id, floor = _route_endpoints(route)
+        return route_key, start_id, end_id, floor, json.dumps(route, ensure_ascii=False)
+
+    def save_routes(self, routes):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM routes')
+            conn.executemany('INSERT INTO routes VALUES (?, ?, ?, ?, ?)',
+                             [self._route_row(k, v) for k, v in routes.items()])
+
+    def patch_routes(self, changes, precondition=None):
+        with self._transaction() as conn:
+            self._check(conn, 'routes', 'key', changes, precondition)
+            for route_key, route in changes.items():
+                if route is None:
+                    conn.execute('DELETE FROM routes WHERE key = ?', (route_key,))
+                else:
+                    conn.execute(
+                        'INSERT INTO routes VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+                        'start_id = excluded.start_id, end_id = excluded.end_id, '
+                        'floor = excluded.floor, data = excluded.data',
+                        self._route_row(route_key, route))
+
+    def compact_routes(self):
+        pass  # правки сразу в таблице - сворачивать нечего
+
+    def find_routes(self, start_id=None, end_id=None, floor=None):
+        """Выборка по индексам без загрузки всех маршрутов"""
+        query, params = 'SELECT key, data FROM routes WHERE 1 = 1', []
+        for column, value in (('start_id', start_id), ('end_id', end_id), ('floor', floor)):
+            if value is not None:
+                query += f' AND {column} = ?'
+                params.append(value)
+        rows = self._query(query, params)
+        return {key: json.loads(data) for key, data in rows}
+
+    # ---------- эвакуационные маршруты ----------
+    def evacuation_routes_signature(self):
+        return self._version('evacuation_routes')
+
+    def load_evacuation_routes(self):
+        rows = self._query('SELECT key, data FROM evacuation_routes ORDER BY rowid')
+        return {key: json.loads(data) for key, data in rows}
+
+    def save_evacuation_routes(self, routes):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM evacuation_routes')
+            conn.executemany('INSERT INTO evacuation_routes VALUES (?, ?, ?)',
+                             [(k, _route_endpoints(v)[2], json.dumps(v, ensure_ascii=False))
+                              for k, v in routes.items()])
+
+    # ---------- голосовые подсказки ----------
+    def voice_prompts_signature(self):
+        return self._version('voice_prompts')
+
+    def load_voice_prompts(self):
+        rows = self._query('SELECT route_key, data FROM voice_prompts ORDER BY rowid')
+        return {key: json.loads(data) for key, data in rows}
+
+    def save_voice_prompts(self, prompts):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM voice_prompts')
+            conn.executemany('INSERT INTO voice_prompts VALUES (?, ?)',
+                             [(k, json.dumps(v, ensure_ascii=False)) for k, v in prompts.items()])
+
+    def patch_voice_prompts(self, changes, precondition=None):
+        with self._transaction() as conn:
+            self._check(conn, 'voice_prompts', 'route_key', changes, precondition)
+            for route_key, prompts in changes.items():
+                if prompts is None:
+                    conn.execute('DELETE FROM voice_prompts WHERE route_key = ?', (route_key,))
+                else:
+                    conn.execute('INSERT INTO voice_prompts VALUES (?, ?) ON CONFLICT (route_key) DO UPDATE SET '
+                                 'data = excluded.data', (route_key, json.dumps(prompts, ensure_ascii=False)))
+
+    def compact_voice_prompts(self):
+        pass
+
+
+def get_storage():
+    """Бэкенд по переменной окружения STORAGE_BACKEND (по умолчанию - JSON-файлы)"""
+    backend = os.environ.get('STORAGE_BACKEND', 'json').lower()
+    if backend == 'sqlite':
+        return SqliteStorage(os.environ.get('SQLITE_PATH', SQLITE_FILE))
+    return JsonStorage(os.environ.get('DATA_DIR', DATA_DIR))
+
+
+def migrate_json_to_sqlite(data_dir=DATA_DIR, db_path=SQLITE_FILE):
+    """Однократный перенос всех data/*.json в SQLite"""
+    source = JsonStorage(data_dir)
+    target = SqliteStorage(db_path)
+    points = source.load_points() or []
+    routes = source.load_routes()
+    evacuation_routes = source.load_evacuation_routes()
+    voice_prompts = source.load_voice_prompts()
+    target.save_points(points)
+    target.save_routes(routes)
+    target.save_evacuation_routes(evacuation_routes)
+    target.save_voice_prompts(voice_prompts)
+    return {
+        'points': len(points),
+        'routes': len(routes),
+        'evacuation_routes': len(evacuation_routes),
+        'voice_prompts': len(voice_prompts)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Хранилище данных школьной навигации')
+    parser.add_argument('command', choices=['migrate'], help='migrate - перенести data/*.json в SQLite')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--db', default=SQLITE_FILE)
+    args = parser.parse_args()
+
+    counts = migrate_json_to_sqlite(args.data_dir, args.db)
+    print("✅ Данные перенесены в SQLite:", args.db)
+    for name, count in counts.items():
+        print(f"   • {name}: {count}")
+    print("📌 Запускайте сервер с STORAGE_BACKEND=sqlite")
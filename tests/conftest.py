@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Модули приложения лежат в корне репозитория, пути к data/ в них относительные
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
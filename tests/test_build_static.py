@@ -0,0 +1,74 @@
+"""Сборка статики: ссылки внутри CSS/JS ведут на собранные файлы"""
+
+import json
+
+import app as app_module
+from build_static import build
+
+
+def _write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(text.encode('utf-8'))
+
+
+def test_references_rewritten(tmp_path):
+    static = tmp_path / 'static'
+    _write(static / 'images' / 'floor1.jpg', 'jpeg')
+    _write(static / 'css' / 'base.css', 'body { background: url(../images/floor1.jpg); }')
+    _write(static / 'css' / 'style.css',
+           '@import "base.css";\n'
+           '.map { background: url("/static/images/floor1.jpg?v=2"); }\n'
+           '.icon { background: url(data:image/png;base64,AAAA); }\n'
+           '.font { src: url(https://example.com/font.woff); }\n')
+    _write(static / 'js' / 'util.js', 'export const x = 1;')
+    _write(static / 'js' / 'main.js', "import { x } from './util.js';\nimport('./lazy.js');\n")
+    _write(static / 'js' / 'lazy.js', "export default 1;")
+
+    manifest = build(str(static))
+    dist = static
+
+    base = (dist / manifest['css/base.css']).read_text(encoding='utf-8')
+    assert f"url({manifest['images/floor1.jpg'][len('dist/'):].replace('images/', '../images/')})" in base
+    style = (dist / manifest['css/style.css']).read_text(encoding='utf-8')
+    assert f'@import "./{manifest["css/base.css"].split("/")[-1]}"' in style
+    assert f'url("/static/{manifest["images/floor1.jpg"]}?v=2")' in style
+    assert 'url(data:image/png;base64,AAAA)' in style
+    assert 'url(https://example.com/font.woff)' in style
+
+    main = (dist / manifest['js/main.js']).read_text(encoding='utf-8')
+    assert f"from './{manifest['js/util.js'].split('/')[-1]}'" in main
+    assert f"import('./{manifest['js/lazy.js'].split('/')[-1]}')" in main
+
+    with open(static / 'dist' / 'manifest.json', encoding='utf-8') as f:
+        assert json.load(f) == manifest
+
+
+def test_reference_cycle(tmp_path):
+    static = tmp_path / 'static'
+    _write(static / 'js' / 'a.js', "import './b.js';")
+    _write(static / 'js' / 'b.js', "import './a.js';")
+    manifest = build(str(static))
+    # Одна из ссылок цикла остаётся исходной, другая ведёт на собранный файл
+    texts = [(static / manifest[f'js/{name}.js']).read_text(encoding='utf-8') for name in 'ab']
+    assert sorted(texts) == sorted([f"import './{manifest['js/b.js'].split('/')[-1]}';", "import './a.js';"]) or \
+        sorted(texts) == sorted([f"import './{manifest['js/a.js'].split('/')[-1]}';", "import './b.js';"])
+
+
+def test_fingerprint_follows_referenced_file(tmp_path):
+    static = tmp_path / 'static'
+    _write(static / 'images' / 'floor1.jpg', 'old plan')
+    _write(static / 'css' / 'style.css', '.map { background: url(../images/floor1.jpg); }')
+    before = build(str(static))['css/style.css']
+    _write(static / 'images' / 'floor1.jpg', 'new plan')
+    assert build(str(static))['css/style.css'] != before
+
+
+def test_static_manifest_api(tmp_path, monkeypatch):
+    manifest = {'images/floor1.jpg': 'dist/images/floor1.0123456789.jpg'}
+    path = tmp_path / 'manifest.json'
+    path.write_text(json.dumps(manifest), encoding='utf-8')
+    monkeypatch.setattr(app_module, 'STATIC_MANIFEST_FILE', str(path))
+    client = app_module.app.test_client()
+    response = client.get('/api/static-manifest')
+    assert response.status_code == 200 and response.json == manifest
+    assert client.get('/api/static-manifest', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
@@ -0,0 +1,63 @@
+"""Компактная запись маршрутов: кодирование туда и обратно без потерь"""
+
+import json
+
+import pytest
+
+import app as app_module
+from route_codec import compact_route, decode_polyline, encode_polyline, expand_route, simplify_points
+
+
+@pytest.fixture(scope='module')
+def routes():
+    with open('data/routes.json', 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='module')
+def point_names():
+    with open('data/points.json', 'r', encoding='utf-8') as f:
+        return {p['id']: p['name'] for p in json.load(f)}
+
+
+def test_polyline_round_trip():
+    coords = [(0, 0), (-101, -483), (-107, -1111), (5000, 12), (5000, 12), (-1, 1)]
+    assert decode_polyline(encode_polyline(coords)) == coords
+
+
+def test_route_round_trip_without_simplification(routes, point_names):
+    for key, route in routes.items():
+        expanded = expand_route(compact_route(route, tolerance=None), point_names)
+        assert len(expanded['points']) == len(route['points']), key
+        for original, restored in zip(route['points'], expanded['points']):
+            assert (restored['x'], restored['y']) == (round(original['x']), round(original['y'])), key
+            assert restored['floor'] == original.get('floor', 1), key
+            assert restored['pointId'] == original.get('pointId'), key
+        assert {k: v for k, v in expanded.items() if k != 'points'} == \
+               {k: v for k, v in route.items() if k != 'points'}
+
+
+def test_simplified_route_keeps_anchors_and_floors(routes):
+    for key, route in routes.items():
+        simplified = simplify_points(route['points'], tolerance=2.0)
+        expanded = expand_route(compact_route(route, tolerance=2.0))
+        assert len(expanded['points']) == len(simplified)
+        assert [p['pointId'] for p in expanded['points']] == [p.get('pointId') for p in simplified], key
+        assert expanded['points'][0]['pointId'] == route['points'][0].get('pointId'), key
+        assert expanded['points'][-1]['pointId'] == route['points'][-1].get('pointId'), key
+        assert {p['floor'] for p in expanded['points']} == {p.get('floor', 1) for p in route['points']}, key
+
+
+@pytest.mark.parametrize('tolerance', ['nan', 'inf', '-inf'])
+def test_non_finite_tolerance_rejected(tolerance):
+    client = app_module.app.test_client()
+    key = next(iter(app_module.route_store.get_all()))
+    assert client.get(f'/api/routes?compact=1&tolerance={tolerance}').status_code == 400
+    assert client.get(f'/api/routes/{key}?compact=1&tolerance={tolerance}').status_code == 400
+
+
+def test_compact_cache_is_bounded():
+    client = app_module.app.test_client()
+    for tolerance in range(app_module.COMPACT_CACHE_SIZE + 3):
+        assert client.get(f'/api/routes?compact=1&tolerance={tolerance}').status_code == 200
+    assert len(app_module._compact_routes_cache) == app_module.COMPACT_CACHE_SIZE
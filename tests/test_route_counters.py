@@ -0,0 +1,51 @@
+"""Счётчики маршрутов: освобождение номеров удалённых точек и рост таблицы"""
+
+from datetime import date
+
+from route_counters import RouteCounters
+
+TODAY = date.today().toordinal()
+
+
+def _counters(tmp_path, live=None):
+    counters = RouteCounters(str(tmp_path / 'counters.bin'), capacity=4, days=4)
+    if live is not None:
+        counters.live_ids = lambda: live
+    return counters
+
+
+def test_deleted_points_are_dropped_before_growing(tmp_path):
+    live = {'a', 'b', 'c', 'd'}
+    counters = _counters(tmp_path, live)
+    counters.add({('a', 'b', TODAY): 3, ('c', 'd', TODAY): 2})
+    assert counters.get_counters()['points'] == 4
+
+    live -= {'c', 'd'}
+    live |= {'e', 'f'}
+    counters.add({('e', 'a', TODAY): 5, ('a', 'f', TODAY): 1})
+    info = counters.get_counters()
+    assert (info['capacity'], info['grows'], info['compactions']) == (4, 0, 1)
+    assert counters.popular_routes() == {'e_a': 5, 'a_b': 3, 'a_f': 1}
+    assert counters.by_day(1) == {date.today().isoformat(): {'e_a': 5, 'a_b': 3, 'a_f': 1}}
+
+
+def test_grows_when_all_points_are_live(tmp_path):
+    counters = _counters(tmp_path, {'a', 'b', 'c', 'd', 'e'})
+    counters.add({('a', 'b', TODAY): 1, ('c', 'd', TODAY): 1})
+    counters.add({('d', 'e', TODAY): 7})
+    info = counters.get_counters()
+    assert (info['capacity'], info['grows'], info['compactions']) == (8, 1, 0)
+    assert counters.popular_routes() == {'d_e': 7, 'a_b': 1, 'c_d': 1}
+
+
+def test_other_process_sees_compacted_file(tmp_path):
+    live = {'a', 'b', 'c', 'd'}
+    writer, reader = _counters(tmp_path, live), _counters(tmp_path)
+    writer.add({('a', 'b', None): 1, ('c', 'd', None): 1})
+    assert reader.popular_routes() == {'a_b': 1, 'c_d': 1}
+    live.discard('a')
+    live.add('x')
+    writer.add({('x', 'b', None): 2})
+    assert reader.popular_routes() == {'x_b': 2, 'c_d': 1}
+    reader.add({('c', 'd', None): 1})
+    assert writer.popular_routes() == {'x_b': 2, 'c_d': 2}
@@ -0,0 +1,76 @@
+"""Правка одного маршрута с If-Match: проверка и запись - одна операция хранилища"""
+
+import json
+
+import pytest
+from werkzeug.datastructures import ETags
+
+import app as app_module
+from storage import JsonStorage, PreconditionFailed, SqliteStorage
+
+ROUTE_KEY = 'point_1771735896016_point_1771734635494'
+
+
+def _route():
+    with open('data/routes.json', 'r', encoding='utf-8') as f:
+        return json.load(f)[ROUTE_KEY]
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def route_store(request, tmp_path, monkeypatch):
+    storage = JsonStorage(str(tmp_path)) if request.param == 'json' else SqliteStorage(str(tmp_path / 'school.db'))
+    store = app_module.RouteStore(storage)
+    store.save({ROUTE_KEY: _route()})
+    monkeypatch.setattr(app_module, 'route_store', store)
+    return store
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def _moved(route, dx):
+    route = dict(route)
+    route['points'] = [dict(p, x=p['x'] + dx) for p in route['points']]
+    route.pop('metrics', None)
+    return route
+
+
+def test_put_with_current_etag(route_store, client):
+    response = client.get(f'/api/routes/{ROUTE_KEY}')
+    etag = response.headers['ETag'].strip('"')
+    response = client.put(f'/api/routes/{ROUTE_KEY}', json=_moved(response.json, 1), headers={'If-Match': f'"{etag}"'})
+    assert response.status_code == 200
+    assert response.json['etag'] != etag
+    assert route_store.get(ROUTE_KEY)['points'][0]['x'] == _route()['points'][0]['x'] + 1
+
+
+def test_put_with_stale_etag_conflicts(route_store, client):
+    stale = client.get(f'/api/routes/{ROUTE_KEY}').headers['ETag']
+    # Маршрут успел поменять другой редактор
+    assert route_store.put(ROUTE_KEY, _moved(_route(), 5))
+
+    response = client.put(f'/api/routes/{ROUTE_KEY}', json=_moved(_route(), 1), headers={'If-Match': stale})
+    assert response.status_code == 412
+    assert response.json['route']['points'][0]['x'] == _route()['points'][0]['x'] + 5
+    assert route_store.get(ROUTE_KEY)['points'][0]['x'] == _route()['points'][0]['x'] + 5
+
+    response = client.delete(f'/api/routes/{ROUTE_KEY}', headers={'If-Match': stale})
+    assert response.status_code == 412
+    assert route_store.get(ROUTE_KEY) is not None
+
+
+def test_second_writer_with_same_etag_loses(route_store):
+    etag = app_module.route_etag(route_store.get(ROUTE_KEY))
+    if_match = ETags([etag])
+    assert route_store.put_if_match(ROUTE_KEY, _moved(_route(), 1), if_match)
+    with pytest.raises(PreconditionFailed) as conflict:
+        route_store.put_if_match(ROUTE_KEY, _moved(_route(), 2), if_match)
+    assert conflict.value.current[ROUTE_KEY]['points'][0]['x'] == _route()['points'][0]['x'] + 1
+
+
+def test_delete_with_current_etag(route_store, client):
+    etag = client.get(f'/api/routes/{ROUTE_KEY}').headers['ETag']
+    assert client.delete(f'/api/routes/{ROUTE_KEY}', headers={'If-Match': etag}).status_code == 200
+    assert route_store.get(ROUTE_KEY) is None
@@ -0,0 +1,109 @@
+"""Журнал статистики: несколько процессов, компактизация, ротация сегментов"""
+
+import multiprocessing
+import os
+
+import pytest
+
+from app import Statistics
+
+WORKERS = 4
+EVENTS = 300
+
+
+def make_stats(folder, **kwargs):
+    return Statistics(stats_file=str(folder / 'snapshot.json'), seed_file=None,
+                      events_file=str(folder / 'events.jsonl'), counters_file=str(folder / 'counters.bin'),
+                      write_behind=False, **kwargs)
+
+
+def _worker(folder, index, segment_size):
+    stats = make_stats(folder, segment_size=segment_size)
+    for n in range(EVENTS):
+        stats.increment_navigation('a', 'b')
+        if n % 37 == index:
+            stats.save_stats()
+    stats.flush()
+
+
+def _run_workers(folder, segment_size):
+    ctx = multiprocessing.get_context('fork')
+    processes = [ctx.Process(target=_worker, args=(folder, i, segment_size)) for i in range(WORKERS)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0
+
+
+@pytest.mark.parametrize('segment_size', [4 * 1024 * 1024, 2000])
+def test_workers_do_not_lose_events(tmp_path, segment_size):
+    _run_workers(tmp_path, segment_size)
+    stats = make_stats(tmp_path, segment_size=segment_size)
+    assert stats.get_stats()['total_navigations'] == WORKERS * EVENTS
+    assert stats.rebuild_from_log()['total_navigations'] == WORKERS * EVENTS
+    assert stats.get_stats()['popular_routes'] == {'a_b': WORKERS * EVENTS}
+
+
+def test_rotation_keeps_segments(tmp_path):
+    _run_workers(tmp_path, 2000)
+    generations = make_stats(tmp_path)._segment_generations()
+    assert len(generations) > 1
+    assert generations == list(range(generations[0], generations[0] + len(generations)))
+
+
+def test_crash_between_rotation_and_new_log(tmp_path):
+    stats = make_stats(tmp_path, segment_size=10 ** 9)
+    for _ in range(5):
+        stats.increment_navigation('a', 'b')
+    stats.save_stats()
+    for _ in range(3):
+        stats.increment_navigation('a', 'b')
+    # Журнал ушёл в сегмент, а новый ещё не начат; события после снимка - только в сегменте
+    stats._rotate()
+    assert not os.path.exists(stats.events_file)
+
+    restarted = make_stats(tmp_path)
+    assert restarted.get_stats()['total_navigations'] == 8
+    restarted.increment_navigation('a', 'b')
+    assert make_stats(tmp_path).get_stats()['total_navigations'] == 9
+
+
+def test_stale_snapshot_replays_all_later_segments(tmp_path):
+    stats = make_stats(tmp_path, segment_size=10 ** 9)
+    stats.increment_navigation('a', 'b')
+    stats.save_stats()
+    snapshot = (tmp_path / 'snapshot.json').read_bytes()
+    for _ in range(3):
+        for _ in range(4):
+            stats.increment_navigation('a', 'b')
+        stats._rotate()
+    stats.increment_navigation('a', 'b')
+    # Снимок из середины истории (воркер упал, не записав новый) - доигрываются все сегменты
+    (tmp_path / 'snapshot.json').write_bytes(snapshot)
+    assert make_stats(tmp_path).get_stats()['total_navigations'] == 14
+
+
+def test_load_does_not_write(tmp_path):
+    make_stats(tmp_path)
+    assert os.listdir(tmp_path) == []
+
+
+def test_events_recorded_during_compaction_stay_counted(tmp_path):
+    stats = make_stats(tmp_path)
+    stats.write_behind = True
+    write_snapshot = stats._write_snapshot
+
+    def record_while_writing(payload):
+        # Навигация пришла, пока снимок пишется: в снимок она не попала
+        stats.increment_navigation('a', 'b')
+        write_snapshot(payload)
+
+    stats.increment_navigation('a', 'b')
+    stats._write_snapshot = record_while_writing
+    stats.save_stats()
+    assert stats._since_compact == 1
+    stats._write_snapshot = write_snapshot
+    stats.flush()
+    assert stats._since_compact == 0
+    assert make_stats(tmp_path).get_stats()['total_navigations'] == 2
@@ -0,0 +1,87 @@
+"""Хранилище: перенос JSON -> SQLite без потерь, одно соединение SQLite на процесс"""
+
+import shutil
+import threading
+
+import pytest
+
+from storage import JsonStorage, SqliteStorage, migrate_json_to_sqlite
+
+DATA_FILES = ('points.json', 'routes.json', 'evacuation_routes.json', 'voice_prompts.json')
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    folder = tmp_path / 'data'
+    folder.mkdir()
+    for name in DATA_FILES:
+        shutil.copy(f'data/{name}', folder / name)
+    return str(folder)
+
+
+def test_migration_round_trip(data_dir, tmp_path):
+    db_path = str(tmp_path / 'school.db')
+    counts = migrate_json_to_sqlite(data_dir, db_path)
+    source, target = JsonStorage(data_dir), SqliteStorage(db_path)
+
+    assert target.load_points() == source.load_points()
+    assert target.load_routes() == source.load_routes()
+    assert list(target.load_routes()) == list(source.load_routes())  # порядок ключей тоже
+    assert target.load_evacuation_routes() == source.load_evacuation_routes()
+    assert target.load_voice_prompts() == source.load_voice_prompts()
+    assert counts['routes'] == len(source.load_routes())
+
+    # И обратно: выгрузка из SQLite в JSON-хранилище даёт те же данные
+    back = JsonStorage(str(tmp_path / 'back'))
+    back.save_points(target.load_points())
+    back.save_routes(target.load_routes())
+    back.save_evacuation_routes(target.load_evacuation_routes())
+    back.save_voice_prompts(target.load_voice_prompts())
+    assert back.load_routes() == source.load_routes()
+    assert back.load_points() == source.load_points()
+    assert back.load_voice_prompts() == source.load_voice_prompts()
+    target.close()
+
+
+def test_patch_after_migration(data_dir, tmp_path):
+    db_path = str(tmp_path / 'school.db')
+    migrate_json_to_sqlite(data_dir, db_path)
+    storage = SqliteStorage(db_path)
+    routes = storage.load_routes()
+    key, route = next(iter(routes.items()))
+    version = storage.routes_signature()
+    storage.patch_routes({key: None, 'new_route': route})
+    reloaded = storage.load_routes()
+    assert key not in reloaded and reloaded['new_route'] == route
+    assert len(reloaded) == len(routes)
+    assert storage.routes_signature() > version
+    assert storage.find_routes(start_id=route['points'][0]['pointId'])
+    storage.close()
+
+
+def test_one_connection_per_process(tmp_path):
+    storage = SqliteStorage(str(tmp_path / 'school.db'))
+    connection = storage._conn()
+    errors = []
+
+    def work(n):
+        try:
+            for i in range(20):
+                storage.patch_voice_prompts({f'route_{n}_{i}': [f'phrase {i}']})
+                storage.load_voice_prompts()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert storage._conn() is connection
+    assert len(storage.load_voice_prompts()) == 8 * 20
+
+    storage.close()
+    assert storage._connection is None
+    assert len(storage.load_voice_prompts()) == 8 * 20  # после close соединение открывается заново
+    storage.close()
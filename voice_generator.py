@@ -0,0 +1,200 @@
+"""
+Автоматические голосовые подсказки "поворот за поворотом"
+Ломаная маршрута делится на участки по поворотам и переходам между этажами
+(готовые metrics из route_metrics), каждый участок озвучивается фразой из
+шаблонов data/voice_settings.json: start, first_step, step, last_step,
+finish, floor_change, direction_*. Ориентир участка - ближайшая к углу
+именованная точка того же этажа (кабинет, столовая, лестница).
+
+Ориентиры для всех маршрутов ищутся одной матрицей расстояний NumPy
+"углы всех маршрутов x все точки", поэтому пакетная генерация по всем
+маршрутам - десятки миллисекунд. Подсказки, написанные вручную
+(voice_prompts.json), главнее: сгенерированные нужны там, где их нет.
+
+Посмотреть и дописать недостающие подсказки в хранилище:
+    python voice_generator.py [--route КЛЮЧ] [--fill]
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from route_metrics import attach_metrics, path_metrics
+
+VOICE_SETTINGS_FILE = 'data/voice_settings.json'
+LANDMARK_RADIUS = 120.0  # единиц карты (~60 м) от угла до точки-ориентира
+
+DEFAULT_PHRASES = {
+    "start": "Начинаем маршрут от {start} до {destination}.",
+    "step": "Затем идите {direction} к {point}.",
+    "first_step": "Сначала идите {direction} к {point}.",
+    "last_step": "Затем поверните {direction} и вы у цели: {point}.",
+    "finish": "Вы прибыли в пункт назначения: {destination}. Маршрут завершён.",
+    "floor_change": "Перейдите на {floor} этаж.",
+    "direction_up": "вверх",
+    "direction_down": "вниз",
+    "direction_left": "налево",
+    "direction_right": "направо",
+    "direction_straight": "прямо"
+}
+NO_LANDMARK = {'turn': 'повороту', 'floor': 'лестнице'}
+
+
+def load_phrases(path=VOICE_SETTINGS_FILE):
+    """Шаблоны фраз из настроек голоса; отсутствующие - по умолчанию"""
+    phrases = dict(DEFAULT_PHRASES)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            phrases.update(json.load(f).get('phrases') or {})
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Шаблоны фраз по умолчанию ({path}: {e})")
+    return phrases
+
+
+class _SafeFormat(dict):
+    # Шаблон с незнакомым полем ({distance} и т.п.) не роняет генерацию
+    def __missing__(self, key):
+        return ''
+
+
+class PromptGenerator:
+
+    def __init__(self, points, phrases=None):
+        """points - точки навигации (словари id, name, x, y, floor)"""
+        self.phrases = dict(DEFAULT_PHRASES, **(phrases or {}))
+        self.points = [p for p in points if p.get('name')]
+        self._names = {p['id']: p['name'] for p in self.points}
+        self._ids = np.array([p['id'] for p in self.points], dtype=object)
+        self._x = np.array([p['x'] for p in self.points], dtype=np.float64)
+        self._y = np.array([p['y'] for p in self.points], dtype=np.float64)
+        self._floor = np.array([p.get('floor', 1) for p in self.points], dtype=np.int64)
+
+    def _say(self, template, **values):
+        return self.phrases[template].format_map(_SafeFormat(values))
+
+    def _heading(self, angle):
+        """Направление на плане - для первого шага и после смены этажа, когда поворачивать не от чего"""
+        if angle is None:
+            return self.phrases['direction_straight']
+        if -45 < angle <= 45:
+            return self.phrases['direction_right']
+        if 45 < angle <= 135:
+            return self.phrases['direction_down']
+        if angle > 135 or angle <= -135:
+            return self.phrases['direction_left']
+        return self.phrases['direction_up']
+
+    def _endpoint_name(self, point, default):
+        return self._names.get(point.get('pointId')) or point.get('pointName') or default
+
+    # ---------- ориентиры ----------
+    def _landmarks(self, corners):
+        """
+        corners - [(x, y, этаж, id начала, id конца), ...] углов всех маршрутов.
+        Для каждого - название ближайшей точки того же этажа в LANDMARK_RADIUS
+        (кроме начала и конца самого маршрута) или None.
+        """
+        if not corners or not self.points:
+            return [None] * len(corners)
+        x = np.array([c[0] for c in corners], dtype=np.float64)[:, None]
+        y = np.array([c[1] for c in corners], dtype=np.float64)[:, None]
+        floor = np.array([c[2] for c in corners], dtype=np.int64)[:, None]
+        start = np.array([c[3] for c in corners], dtype=object)[:, None]
+        end = np.array([c[4] for c in corners], dtype=object)[:, None]
+        distance = np.hypot(self._x - x, self._y - y)
+        excluded = (self._floor != floor) | (self._ids == start) | (self._ids == end)
+        distance[excluded] = np.inf
+        nearest = np.argmin(distance, axis=1)
+        found = distance[np.arange(len(corners)), nearest] <= LANDMARK_RADIUS
+        return [self.points[i]['name'] if ok else None for i, ok in zip(nearest.tolist(), found.tolist())]
+
+    # ---------- подсказки ----------
+    @staticmethod
+    def _events(metrics):
+        """Повороты и переходы между этажами по порядку точек"""
+        events = [(t['index'], 1, 'turn', t) for t in metrics.get('turns', [])]
+        events += [(c['index'], 0, 'floor', c) for c in metrics.get('floor_changes', [])]
+        return [(index, kind, event) for index, _, kind, event in sorted(events, key=lambda e: e[:2])]
+
+    def generate_all(self, routes):
+        """{ключ: маршрут} -> {ключ: [фразы]}; metrics берутся из маршрута или считаются"""
+        plans, corners = {}, []
+        for key, route in routes.items():
+            points = route.get('points') or []
+            if len(points) < 2:
+                continue
+            metrics = route.get('metrics') or path_metrics(points)
+            start_id, end_id = points[0].get('pointId'), points[-1].get('pointId')
+            events = self._events(metrics)
+            for index, kind, _ in events:
+                # Переход между этажами озвучиваем у последней точки старого этажа - у лестницы
+                corner = points[index - 1] if kind == 'floor' else points[index]
+                corners.append((corner['x'], corner['y'], corner.get('floor', 1), start_id, end_id))
+            plans[key] = (points, metrics, events)
+
+        landmarks = iter(self._landmarks(corners))
+        return {key: self._phrases_for(points, metrics, events, landmarks)
+                for key, (points, metrics, events) in plans.items()}
+
+    def _phrases_for(self, points, metrics, events, landmarks):
+        start = self._endpoint_name(points[0], 'начало')
+        destination = self._endpoint_name(points[-1], 'конец')
+        directions = metrics.get('directions', [])
+
+        def heading_from(index):
+            return self._heading(next((d for d in directions[index:] if d is not None), None))
+
+        phrases = [self._say('start', start=start, destination=destination)]
+        direction, after_turn, first = heading_from(0), False, True
+        for index, kind, event in events:
+            point = next(landmarks) or NO_LANDMARK[kind]
+            phrases.append(self._say('first_step' if first else 'step', direction=direction, point=point))
+            first = False
+            if kind == 'turn':
+                direction = self.phrases['direction_right' if event['side'] == 'right' else 'direction_left']
+                after_turn = True
+            else:
+                phrases.append(self._say('floor_change', floor=event['to']))
+                # На новом этаже поворачивать не от чего - снова направление на плане
+                direction, after_turn = heading_from(index), False
+        if after_turn:
+            phrases.append(self._say('last_step', direction=direction, point=destination))
+        else:
+            phrases.append(self._say('first_step' if first else 'step', direction=direction, point=destination))
+        phrases.append(self._say('finish', start=start, destination=destination))
+        return phrases
+
+    def generate(self, points, metrics=None):
+        """Подсказки для одного пути (например, найденного по графу коридоров)"""
+        route = {'points': points, 'metrics': metrics}
+        return self.generate_all({'path': route}).get('path', [])
+
+
+if __name__ == '__main__':
+    from storage import get_storage
+
+    parser = argparse.ArgumentParser(description='Автоматические голосовые подсказки маршрутов')
+    parser.add_argument('--route', help='показать подсказки одного маршрута')
+    parser.add_argument('--fill', action='store_true',
+                        help='записать сгенерированные подсказки маршрутам, у которых их нет')
+    args = parser.parse_args()
+
+    storage = get_storage()
+    routes = attach_metrics(storage.load_routes())
+    generator = PromptGenerator(storage.load_points(), load_phrases())
+    started = time.perf_counter()
+    generated = generator.generate_all(routes)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"🔊 Подсказки для {len(generated)} маршрутов за {elapsed:.1f} мс")
+
+    if args.route:
+        for phrase in generated.get(args.route, []):
+            print(f"   • {phrase}")
+    manual = storage.load_voice_prompts()
+    missing = {key: prompts for key, prompts in generated.items() if not manual.get(key)}
+    print(f"   • написаны вручную: {len(manual)}, без подсказок: {len(missing)}")
+    if args.fill and missing:
+        storage.patch_voice_prompts(missing)
+        print(f"✅ Дописано подсказок: {len(missing)}")